@@ -1,37 +1,78 @@
-from typing import List
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import func
 from sqlmodel import select, delete
 
 from app.deps import require_admin, get_db
-from app.models import ActivityLog, FileShare, User, File
-from app.schemas import UserRead, UserCreate, AdminUserCreate
-from app.crud import create_user
-from app.core.security import get_password_hash
+from app.models import ActivityLog, DirectUpload, FileShare, User, UserStats, File
+from app.schemas import UserRead, UserCreate, AdminUserCreate, UserPage
+from app.crud import bump_user_stats, create_user, referenced_blob_paths, release_blobs
+from app.core.security import hash_password
+from app.core.principal_cache import principal_cache
+from app.core.acl import acl_cache
+from app.core.revocation import revocation_index
+from app.core.audit import activity_writer
+from app.core.usage import usage_aggregator
+from app.core.email import email_outbox
+from app.utils.blobstore import remove_orphaned_blobs
+from app.utils.paginator import paginate_query
+from app.utils.nsfw_check import nsfw_service
+from app.utils.nsfw_cache import verdict_cache
+from app.utils.derivatives import derivative_cache
+from app.utils.variants import variant_builder
+from app.utils.replication import replication_worker
+from app.utils.tiering import tiered_store
 
 router = APIRouter()
 
 
 @router.get("/activity")
 async def activity_log(
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     admin=Depends(require_admin)
 ):
-    q = select(ActivityLog).order_by(ActivityLog.created_at.desc()).limit(limit)
-    result = await db.exec(q)
-    return result.all()
+    """Newest first. Pass the returned next_cursor to get the following page."""
+    return await paginate_query(
+        db, select(ActivityLog),
+        created_col=ActivityLog.created_at, id_col=ActivityLog.id, limit=limit, cursor=cursor,
+    )
+
+
+@router.get("/cache-stats")
+async def cache_stats(admin=Depends(require_admin)):
+    return {
+        "principal_cache": principal_cache.stats(),
+        "revocation_index": revocation_index.stats(),
+        "acl_cache": acl_cache.stats(),
+        "activity_writer": activity_writer.stats(),
+        "usage_aggregator": usage_aggregator.stats(),
+        "email_outbox": email_outbox.stats(),
+        "nsfw_service": nsfw_service.stats(),
+        "nsfw_verdict_cache": verdict_cache.stats(),
+        "derivative_cache": derivative_cache.stats(),
+        "image_variants": variant_builder.stats(),
+        "replication": replication_worker.stats(),
+        "local_storage": tiered_store.stats(),
+    }
 
 
 # --- Admin user management (CRUD) ---
 
 
-@router.get("/users", response_model=List[UserRead])
-async def list_users(db: AsyncSession = Depends(get_db), admin=Depends(require_admin)):
-    q = select(User).order_by(User.created_at.desc()).limit(200)
-    res = await db.exec(q)
-    return res.all()
+@router.get("/users", response_model=UserPage)
+async def list_users(
+    limit: int = Query(200, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    admin=Depends(require_admin)
+):
+    return await paginate_query(
+        db, select(User), created_col=User.created_at, id_col=User.id, limit=limit, cursor=cursor,
+    )
 
 
 @router.get("/users/{user_id}", response_model=UserRead)
@@ -45,7 +86,7 @@ async def get_user(user_id: int, db: AsyncSession = Depends(get_db), admin=Depen
 @router.post("/users", response_model=UserRead)
 async def admin_create_user(u: AdminUserCreate, db: AsyncSession = Depends(get_db), admin=Depends(require_admin)):
     # create_user helper expects hashed password
-    hashed = get_password_hash(u.password)
+    hashed = await hash_password(u.password)
     # If admin provided a role, allow it; otherwise default to 'user'
     role = getattr(u, "role", None) or "user"
     user = await create_user(db, email=u.email, username=u.username, hashed_password=hashed, role=role)
@@ -62,10 +103,11 @@ async def admin_update_user(user_id: int, payload: UserCreate, db: AsyncSession
     user.email = payload.email
     user.username = payload.username
     if payload.password:
-        user.hashed_password = get_password_hash(payload.password)
+        user.hashed_password = await hash_password(payload.password)
     db.add(user)
     await db.commit()
     await db.refresh(user)
+    principal_cache.invalidate_user(user_id)
     return user
 
 
@@ -74,9 +116,23 @@ async def admin_delete_user(user_id: int, db: AsyncSession = Depends(get_db), ad
     user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    hashes = (await db.exec(select(File.content_hash).where(File.owner_id == user_id))).all()
     await db.exec(delete(ActivityLog).where(ActivityLog.user_id == user_id))
+    # recipients lose the shares this user made
+    received = (await db.exec(
+        select(FileShare.recipient_id, func.count())
+        .where(FileShare.owner_id == user_id, FileShare.recipient_id != user_id)
+        .group_by(FileShare.recipient_id)
+    )).all()
+    await bump_user_stats(db, {r: {"shares_received": -n, "pending_shares": -n} for r, n in received})
     await db.exec(delete(FileShare).where((FileShare.owner_id == user_id) | (FileShare.recipient_id == user_id)))
+    await db.exec(delete(UserStats).where(UserStats.user_id == user_id))
+    await db.exec(delete(DirectUpload).where(DirectUpload.owner_id == user_id))
     await db.exec(delete(File).where(File.owner_id == user_id))
+    orphaned = await release_blobs(db, list(hashes))
     await db.delete(user)
     await db.commit()
+    principal_cache.invalidate_user(user_id)
+    acl_cache.invalidate_user(user_id)
+    await remove_orphaned_blobs(orphaned, lambda paths: referenced_blob_paths(db, paths))
     return {"ok": True}
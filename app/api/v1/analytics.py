@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.usage import ROLLUP_MODELS, truncate
+from app.deps import get_current_user, get_db, require_admin
+from app.models import User
+
+router = APIRouter()
+
+# Every endpoint here reads only the ShareRollupHourly/ShareRollupDaily
+# tables, never FileShare, so cost follows the number of buckets in range.
+# Ranges are [since, until) and snap to whole buckets; default is 30 days.
+DEFAULT_RANGE = timedelta(days=30)
+
+
+def _naive_utc(ts: Optional[datetime]) -> Optional[datetime]:
+    # rollup buckets are naive UTC, like every other timestamp in the schema
+    if ts is not None and ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _rollup_range(granularity: str, since: Optional[datetime], until: Optional[datetime]):
+    if granularity not in ROLLUP_MODELS:
+        raise HTTPException(status_code=400, detail="granularity must be 'hour' or 'day'")
+    since, until = _naive_utc(since), _naive_utc(until)
+    until = until or datetime.utcnow()
+    since = truncate(since or until - DEFAULT_RANGE, granularity)
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    return ROLLUP_MODELS[granularity], since, until
+
+
+def _owner_scope(current, owner_id: Optional[int]) -> int:
+    # only owner OR admin allowed
+    if owner_id is None:
+        return current.id
+    if current.id != owner_id and current.role != "admin":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return owner_id
+
+
+async def _series(db: AsyncSession, model, since: datetime, until: datetime, owner_id: Optional[int] = None) -> list:
+    q = (
+        select(model.bucket, func.sum(model.share_count), func.sum(model.total_bytes))
+        .where(model.bucket >= since, model.bucket < until)
+        .group_by(model.bucket)
+        .order_by(model.bucket)
+    )
+    if owner_id is not None:
+        q = q.where(model.owner_id == owner_id)
+    rows = (await db.execute(q)).all()
+    return [{"bucket": bucket, "share_count": shares, "total_bytes": nbytes} for bucket, shares, nbytes in rows]
+
+
+@router.get("/top-recipients")
+async def top_recipients(
+    owner_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    granularity: str = "day",
+    order_by: str = "bytes",
+    limit: int = Query(20, ge=1, le=100),
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """An owner's top recipients by bytes (or share count) over the range; owner defaults to the caller."""
+    owner_id = _owner_scope(current, owner_id)
+    model, since, until = _rollup_range(granularity, since, until)
+    if order_by not in ("bytes", "shares"):
+        raise HTTPException(status_code=400, detail="order_by must be 'bytes' or 'shares'")
+    shares = func.sum(model.share_count).label("share_count")
+    nbytes = func.sum(model.total_bytes).label("total_bytes")
+    q = (
+        select(model.recipient_id, User.email, shares, nbytes)
+        .outerjoin(User, User.id == model.recipient_id)
+        .where(model.owner_id == owner_id, model.bucket >= since, model.bucket < until)
+        .group_by(model.recipient_id, User.email)
+        .order_by((nbytes if order_by == "bytes" else shares).desc(), model.recipient_id)
+        .limit(limit)
+    )
+    rows = (await db.execute(q)).all()
+    return {
+        "owner_id": owner_id,
+        "since": since,
+        "until": until,
+        "items": [
+            {"recipient_id": r.recipient_id, "email": r.email, "share_count": r.share_count, "total_bytes": r.total_bytes}
+            for r in rows
+        ],
+    }
+
+
+@router.get("/timeseries")
+async def timeseries(
+    owner_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    granularity: str = "day",
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Shares and bytes per hour/day for one owner (default: the caller). Empty buckets are omitted."""
+    owner_id = _owner_scope(current, owner_id)
+    model, since, until = _rollup_range(granularity, since, until)
+    return {
+        "owner_id": owner_id,
+        "granularity": granularity,
+        "since": since,
+        "until": until,
+        "points": await _series(db, model, since, until, owner_id),
+    }
+
+
+@router.get("/tenant/timeseries")
+async def tenant_timeseries(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    granularity: str = "day",
+    db: AsyncSession = Depends(get_db),
+    admin=Depends(require_admin)
+):
+    """Shares and bytes per hour/day across all owners."""
+    model, since, until = _rollup_range(granularity, since, until)
+    return {
+        "granularity": granularity,
+        "since": since,
+        "until": until,
+        "points": await _series(db, model, since, until),
+    }
+
+
+@router.get("/tenant/totals")
+async def tenant_totals(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    granularity: str = "day",
+    db: AsyncSession = Depends(get_db),
+    admin=Depends(require_admin)
+):
+    """Tenant-wide shares, bytes and distinct active owners/recipients over the range."""
+    model, since, until = _rollup_range(granularity, since, until)
+    q = select(
+        func.coalesce(func.sum(model.share_count), 0),
+        func.coalesce(func.sum(model.total_bytes), 0),
+        func.count(func.distinct(model.owner_id)),
+        func.count(func.distinct(model.recipient_id)),
+    ).where(model.bucket >= since, model.bucket < until)
+    shares, nbytes, owners, recipients = (await db.execute(q)).one()
+    return {
+        "since": since,
+        "until": until,
+        "share_count": shares,
+        "total_bytes": nbytes,
+        "active_owners": owners,
+        "active_recipients": recipients,
+    }
@@ -11,11 +11,12 @@ from app.crud import (
     revoke_token
 )
 from app.core.security import (
-    get_password_hash,
-    verify_password,
+    hash_password,
+    verify_and_update_password,
     create_access_token,
     decode_token
 )
+from app.core.principal_cache import principal_cache
 from app.schemas import Token, UserCreate, UserRead
 
 router = APIRouter()
@@ -29,7 +30,7 @@ async def register(u: UserCreate, db: AsyncSession = Depends(get_db)):
     if existing:
         raise HTTPException(status_code=400, detail="Email already exists")
 
-    hashed = get_password_hash(u.password)
+    hashed = await hash_password(u.password)
     user = await create_user(
         db,
         email=u.email,
@@ -46,8 +47,16 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(),
                 db: AsyncSession = Depends(get_db)):
 
     user = await get_user_by_email(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
+    valid, new_hash = await verify_and_update_password(form_data.password, user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=400, detail="Incorrect email or password")
+    if new_hash:
+        # cost factor changed since this hash was made; upgrade it transparently
+        user.hashed_password = new_hash
+        db.add(user)
+        await db.commit()
 
     token = create_access_token(subject=user.email)
     await log_activity(db, user.id, "login", "User logged in")
@@ -65,5 +74,6 @@ async def logout(token: str = Depends(oauth2_scheme),
 
     expires_at = datetime.utcfromtimestamp(exp)
     await revoke_token(db, jti, expires_at)
+    principal_cache.invalidate_token(jti)
 
     return {"ok": True, "message": "Logged out"}
@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+import os
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.deps import get_current_user, get_db
+from app.schemas import DirectUploadCreate, DirectUploadResp
+from app.models import DirectUpload, File as FileModel
+from app.core.config import settings
+from app.crud import (
+    claim_direct_upload,
+    complete_replication,
+    create_direct_upload,
+    reopen_direct_upload,
+    set_blob_backend_key,
+)
+from app.utils.storage import UploadTooLarge
+from app.utils.blobstore import discard_staged, staging_path
+from app.utils.ingest import ingest_staged_file, upload_result, UploadRejected
+from app.utils.storage_backends import incoming_key, storage_backend
+
+router = APIRouter()
+
+
+async def _owned_upload(db: AsyncSession, upload_id: str, current) -> DirectUpload:
+    upload = await db.get(DirectUpload, upload_id)
+    if not upload or upload.owner_id != current.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+
+async def _completed_result(db: AsyncSession, upload: DirectUpload) -> dict:
+    f = await db.get(FileModel, upload.file_id)
+    if f:
+        return upload_result(f, upload.deduplicated)
+    raise HTTPException(status_code=404, detail="File not found")
+
+
+@router.post("", response_model=DirectUploadResp)
+async def create_direct_upload_url(
+    req: DirectUploadCreate,
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Issue a short-lived signed URL the client sends the file to directly
+    (PUT, or a multipart POST with the returned fields). Then call
+    /{upload_id}/complete.
+    """
+    max_bytes = settings.max_upload_size_bytes
+    if req.size is not None and not 0 <= req.size <= max_bytes:
+        raise HTTPException(status_code=400, detail="File too large")
+
+    upload_id = uuid4().hex
+    filename = req.filename or "upload"
+    content_type = (req.content_type or "").lower() or None
+    key = incoming_key(upload_id, os.path.splitext(filename)[1])
+    ttl = settings.signed_url_ttl_seconds
+    target = storage_backend.presign_upload(key, content_type=content_type, max_bytes=max_bytes, expires_in=ttl)
+
+    await create_direct_upload(
+        db,
+        id=upload_id,
+        owner_id=current.id,
+        object_key=key,
+        filename=filename,
+        content_type=content_type,
+        max_bytes=max_bytes,
+        expires_at=datetime.utcnow() + timedelta(seconds=settings.direct_upload_ttl_seconds),
+    )
+    return {"upload_id": upload_id, "expires_at": datetime.utcnow() + timedelta(seconds=ttl), **target}
+
+
+@router.post("/{upload_id}/complete")
+async def complete_direct_upload(
+    upload_id: str,
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Bring the uploaded object through the regular ingest pipeline (NSFW
+    check, blob store, File record). Idempotent: completing again returns
+    the File created the first time (409 while that is still in progress).
+    """
+    upload = await _owned_upload(db, upload_id, current)
+    if upload.status == "completed":
+        return await _completed_result(db, upload)
+    if upload.status == "rejected":
+        raise HTTPException(status_code=400, detail="Upload was rejected")
+    if upload.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=410, detail="Upload expired")
+
+    # claim the row so only one request ingests this upload; a concurrent
+    # retry gets the winner's File, or a 409 while it is still running
+    if not await claim_direct_upload(db, upload.id):
+        await db.refresh(upload)
+        if upload.status == "completed":
+            return await _completed_result(db, upload)
+        raise HTTPException(status_code=409, detail="Upload is already being completed")
+
+    staged = staging_path(os.path.splitext(upload.filename)[1])
+    settled = False
+    try:
+        try:
+            size, content_hash = await storage_backend.claim(upload.object_key, staged, upload.max_bytes)
+        except FileNotFoundError:
+            raise HTTPException(status_code=409, detail="Nothing has been uploaded yet")
+        except UploadTooLarge:
+            raise HTTPException(status_code=400, detail="File too large")
+
+        try:
+            f, deduplicated = await ingest_staged_file(
+                db,
+                current,
+                staged,
+                filename=upload.filename,
+                content_type=upload.content_type or "",
+                size=size,
+                content_hash=content_hash,
+            )
+        except UploadRejected as exc:
+            upload.status = "rejected"
+            db.add(upload)
+            await db.commit()
+            settled = True
+            await storage_backend.delete(upload.object_key)
+            raise HTTPException(status_code=400, detail=str(exc))
+
+        # record completion first: from here on a retry returns this File
+        upload.status = "completed"
+        upload.file_id = f.id
+        upload.deduplicated = deduplicated
+        db.add(upload)
+        await db.commit()
+        settled = True
+    finally:
+        discard_staged(staged)
+        if not settled:
+            # let the client retry (e.g. after uploading the object)
+            await db.rollback()
+            await reopen_direct_upload(db, upload_id)
+
+    # the object was only copied by claim(); file it (or drop it) now. A failure
+    # here leaves it under incoming/ for the sweeper
+    backend_key = await storage_backend.promote(upload.object_key, content_hash, deduplicated)
+    if backend_key:
+        await set_blob_backend_key(db, content_hash, backend_key)
+        if storage_backend.name == "cloudinary":
+            # the direct upload already is the cloud copy
+            await complete_replication(db, content_hash, backend_key)
+            await db.refresh(f)
+    return upload_result(f, deduplicated)
+
+
+@router.delete("/{upload_id}")
+async def abort_direct_upload(
+    upload_id: str,
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    upload = await _owned_upload(db, upload_id, current)
+    if upload.status == "pending":
+        await storage_backend.delete(upload.object_key)
+    await db.delete(upload)
+    await db.commit()
+    return {"ok": True}
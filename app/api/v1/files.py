@@ -1,33 +1,44 @@
 import os
-import tempfile
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Request, Query
+from fastapi.responses import RedirectResponse, StreamingResponse
+from sqlalchemy import exists, or_
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel import select
+from typing import List, Optional
 
 from app.deps import get_current_user, get_db
-from app.schemas import ShareReq, UsageResp
-from app.utils.storage import save_upload_file, upload_file_to_cloudinary
+from app.schemas import BulkShareReq, FilePage, SharedFilePage, ShareReq, UsageResp
+from app.utils.storage import stream_upload_file, UploadTooLarge
+from app.utils.blobstore import staging_path, discard_staged
+from app.utils.ingest import ingest_batch, ingest_staged_file, upload_result, UploadRejected, is_image_content_type
+from app.utils.http_range import conditional_file_response
+from app.utils.derivatives import FORMATS, derivative_cache, derivative_source, format_supported
+from app.utils.variants import VARIANT_EXTENSIONS, choose_variant, wants_variant
+from app.utils.tiering import tiered_store
+from app.utils.storage_backends import local_backend, storage_backend
+from app.utils.archive import unavailable_entries, zip_stream
+from app.utils.paginator import paginate_query
+from app.core.config import settings
+from app.core.email import email_outbox
+from app.core.acl import acl_cache
 from app.crud import (
-    create_file,
     share_file,
+    share_file_bulk,
     log_activity,
-    get_user_by_email
+    log_activities,
+    get_user_by_email,
+    get_blob,
+    get_file_variants,
+    get_replication_job,
+    get_user_stats,
+    mark_shares_seen
 )
-from app.models import File as FileModel, FileShare, Usage
-from app.core.config import settings
+from app.models import File as FileModel, FileShare, Usage, User
 
 router = APIRouter()
 
 
-def _is_image_content_type(content_type: str | None) -> bool:
-    return bool(content_type and content_type.startswith("image/"))
-
-
-def _is_video_content_type(content_type: str | None) -> bool:
-    return bool(content_type and content_type.startswith("video/"))
-
-
 @router.post("/upload")
 async def upload(
     upload_file: UploadFile = File(...),
@@ -36,123 +47,58 @@ async def upload(
 ):
     """
     Upload flow:
-    1. Read bytes once and write to a temp file.
-    2. If image/video -> run NSFW check on temp file.
-    3. If NSFW -> block and delete temp file.
-    4. Upload temp file to Cloudinary (if configured) -> get secure_url, size
-       If Cloudinary not configured or upload fails -> fallback to local save using save_upload_file.
-    5. Create DB File record with stored_path set to secure_url (or local path) and size.
+    1. Stream the body in fixed-size chunks to a staging file, hashing and
+       counting bytes as they are written (rejects oversize early).
+    2. Hand the staged file to ingest_staged_file: NSFW check, blob store
+       dedup, Cloudinary push and File record.
     """
 
     # prepare
     filename = upload_file.filename or "upload"
     content_type = (upload_file.content_type or "").lower()
+    suffix = os.path.splitext(filename)[1]
 
-    # read bytes (consume the UploadFile stream once)
-    file_bytes = await upload_file.read()
-    file_size_local = len(file_bytes)
-
-    if file_size_local > settings.max_upload_size_bytes:
+    staged = staging_path(suffix)
+    try:
+        file_size_local, content_hash = await stream_upload_file(upload_file, staged)
+    except UploadTooLarge:
         raise HTTPException(status_code=400, detail="File too large")
 
-    # write to temp file (so nsfw detector and cloud uploader work with a filesystem path)
-    suffix = ""
-    if filename:
-        _, ext = os.path.splitext(filename)
-        suffix = ext or ""
-
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    tmp_path = tmp.name
     try:
-        tmp.write(file_bytes)
-        tmp.flush()
-        tmp.close()
-
-        # Also save a permanent local copy under uploads/<user_id>/ so we always
-        # keep a local file even when Cloudinary upload succeeds.
-        from pathlib import Path
-        owner_dir = Path(settings.upload_dir) / str(current.id)
-        owner_dir.mkdir(parents=True, exist_ok=True)
-        from uuid import uuid4
-        unique_name = f"{uuid4().hex}{suffix}"
-        dest_path = owner_dir / unique_name
-        with open(dest_path, "wb") as f:
-            f.write(file_bytes)
-        local_path = str(dest_path)
-
-        # NSFW check for images and videos (use your existing nsfw utils)
-        if _is_image_content_type(content_type) or _is_video_content_type(content_type):
-            try:
-                # import here to avoid heavy imports globally
-                from app.utils.nsfw_check import predict_image, is_nsfw
-                blocked = False
-                # call is_nsfw on the local file path.
-                try:
-                    blocked = is_nsfw(local_path)
-                except Exception:
-                    # If detector fails, log error and proceed permissively
-                    await log_activity(db, current.id, "nsfw_check_error", "Detector runtime error during upload")
-                    blocked = False
-
-                if blocked:
-                    await log_activity(db, current.id, "upload_blocked", f"NSFW blocked: {filename}")
-                    raise HTTPException(status_code=400, detail="Uploading NSFW content is not allowed")
-            except HTTPException:
-                # re-raise NSFW blocking
-                raise
-            except Exception as exc:
-                # If nsfw_check import or call fails, log and move on (permissive)
-                await log_activity(db, current.id, "nsfw_check_error", f"NSFW init error: {exc}")
-
-        # Try Cloudinary upload (uses the local permanent copy `local_path`)
-        stored_cloud_url = None
-        size = file_size_local
-        cloud_attempted = False
-
-        if settings.cloudinary_api_key and settings.cloudinary_api_secret and settings.cloudinary_cloud_name:
-            try:
-                cloud_attempted = True
-                folder = f"{settings.cloudinary_upload_folder.rstrip('/')}/{current.id}"
-                # use resource_type='raw' for non-image/video files so Cloudinary accepts them
-                res = await upload_file_to_cloudinary(
-                    local_path,
-                    public_id=None,
-                    folder=folder,
-                    resource_type=("image" if _is_image_content_type(content_type) or _is_video_content_type(content_type) else "raw"),
-                )
-                stored_cloud_url = res.get("secure_url") or res.get("url")
-                size = int(res.get("bytes") or file_size_local or 0)
-            except Exception as exc:
-                await log_activity(db, current.id, "cloudinary_error", f"{exc}")
-                stored_cloud_url = None
-
-        # create DB record with BOTH local stored path and optional cloud URL
-        f = await create_file(
+        f, deduplicated = await ingest_staged_file(
             db,
-            owner_id=current.id,
+            current,
+            staged,
             filename=filename,
-            stored_path=local_path,
-            cloud_url=stored_cloud_url,
-            content_type=content_type if content_type else None,
-            size=size,
+            content_type=content_type,
+            size=file_size_local,
+            content_hash=content_hash,
         )
+        return upload_result(f, deduplicated)
+    except UploadRejected as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    finally:
+        # no-op once the staged file has been moved into the blob store
+        discard_staged(staged)
 
-        await log_activity(db, current.id, "upload", f"Uploaded file {f.filename} (cloud={'yes' if cloud_attempted and stored_cloud_url else 'no'})")
-
-        return {
-            "id": f.id,
-            "filename": f.filename,
-            "size": f.size,
-            "stored_path": f.stored_path,
-            "cloud_url": getattr(f, "cloud_url", None),
-        }
 
-    finally:
-        # ensure temp file cleanup
-        try:
-            os.unlink(tmp_path)
-        except Exception:
-            pass
+@router.post("/upload/batch")
+async def upload_batch(
+    upload_files: List[UploadFile] = File(...),
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Upload several files in one multipart request (repeat the `upload_files` field).
+    Parts are staged and checked concurrently and recorded in one transaction;
+    a part that is too large or blocked is reported in its result without
+    failing the others.
+    """
+    if len(upload_files) > settings.batch_upload_max_files:
+        raise HTTPException(status_code=400, detail=f"At most {settings.batch_upload_max_files} files per request")
+    results = await ingest_batch(db, current, upload_files)
+    failed = sum(1 for r in results if "error" in r)
+    return {"results": results, "uploaded": len(results) - failed, "failed": failed}
 
 
 @router.post("/share")
@@ -178,8 +124,7 @@ async def share(
         message=req.message
     )
 
-    from app.core.email import send_local_email
-    send_local_email(
+    email_outbox.enqueue(
         recipient.email,
         f"File shared by {current.email}",
         f"{current.username} shared '{file_obj.filename}' with you"
@@ -195,6 +140,141 @@ async def share(
     return {"ok": True, "share_id": share_entry.id}
 
 
+@router.post("/share/bulk")
+async def share_bulk(
+    req: BulkShareReq,
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Share one file with many recipients. Emails are resolved with one IN
+    query and all shares are written in one transaction; unknown emails
+    are reported per recipient instead of failing the request.
+    """
+    emails = list(dict.fromkeys(req.recipient_emails))
+    if not emails:
+        raise HTTPException(status_code=400, detail="No recipients")
+    if len(emails) > settings.bulk_share_max_recipients:
+        raise HTTPException(status_code=400, detail=f"At most {settings.bulk_share_max_recipients} recipients per request")
+
+    file_obj = await db.get(FileModel, req.file_id)
+    if not file_obj or file_obj.owner_id != current.id:
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+    res = await db.execute(select(User.id, User.email).where(User.email.in_(emails)))
+    recipients = {email: user_id for user_id, email in res.all()}
+    found = [email for email in emails if email in recipients]
+
+    shares = await share_file_bulk(
+        db,
+        file_id=file_obj.id,
+        owner_id=current.id,
+        recipient_ids=[recipients[email] for email in found],
+        bytes_transferred=file_obj.size,
+        message=req.message
+    )
+    share_ids = {email: s.id for email, s in zip(found, shares)}
+
+    email_outbox.enqueue_many([
+        (email, f"File shared by {current.email}", f"{current.username} shared '{file_obj.filename}' with you")
+        for email in found
+    ])
+    await log_activities(db, current.id, "share", [f"Shared file {file_obj.filename} to {email}" for email in found])
+
+    results = [
+        {"email": email, "ok": True, "share_id": share_ids[email]} if email in share_ids
+        else {"email": email, "ok": False, "error": "Recipient not found"}
+        for email in emails
+    ]
+    return {"results": results, "shared": len(found), "failed": len(emails) - len(found)}
+
+
+def _list_filters(q, content_type: Optional[str], since: Optional[datetime], until: Optional[datetime], time_col):
+    # content_type: exact ("image/png") or a family ("image/" or "image/*")
+    if content_type:
+        content_type = content_type.lower()
+        if content_type.endswith(("/", "/*")):
+            q = q.where(FileModel.content_type.startswith(content_type.rstrip("*")))
+        else:
+            q = q.where(FileModel.content_type == content_type)
+    if since:
+        q = q.where(time_col >= since)
+    if until:
+        q = q.where(time_col < until)
+    return q
+
+
+@router.get("/mine", response_model=FilePage)
+async def list_my_files(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    content_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """The caller's files, newest first; counts come from the UserStats counters."""
+    q = select(FileModel).where(FileModel.owner_id == current.id, FileModel.is_deleted.is_(False))
+    q = _list_filters(q, content_type, since, until, FileModel.created_at)
+    page = await paginate_query(
+        db, q, created_col=FileModel.created_at, id_col=FileModel.id, limit=limit, cursor=cursor,
+    )
+    stats = await get_user_stats(db, current.id)
+    return {**page, "file_count": stats.file_count, "bytes_stored": stats.bytes_stored}
+
+
+@router.get("/shared-with-me", response_model=SharedFilePage)
+async def list_shared_with_me(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    content_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Shares the caller received, newest first, one item per share with its
+    file and owner (a single FileShare-File-User join). since/until filter
+    on the share time.
+    """
+    q = (
+        select(
+            FileModel.id, FileModel.filename, FileModel.content_type, FileModel.size,
+            FileModel.content_hash, FileModel.cloud_url, FileModel.created_at,
+            FileShare.id.label("share_id"), FileShare.shared_at, FileShare.message, FileShare.owner_id,
+            User.email.label("owner_email"), User.username.label("owner_username"),
+        )
+        .select_from(FileShare)
+        .join(FileModel, FileModel.id == FileShare.file_id)
+        .join(User, User.id == FileShare.owner_id)
+        .where(FileShare.recipient_id == current.id, FileModel.is_deleted.is_(False))
+    )
+    q = _list_filters(q, content_type, since, until, FileShare.shared_at)
+    page = await paginate_query(
+        db, q, created_col=FileShare.shared_at, id_col=FileShare.id, limit=limit, cursor=cursor,
+        key=lambda row: (row.shared_at, row.share_id),
+    )
+    stats = await get_user_stats(db, current.id)
+    return {
+        "items": [dict(row._mapping) for row in page["items"]],
+        "next_cursor": page["next_cursor"],
+        "shares_received": stats.shares_received,
+        "pending_shares": stats.pending_shares,
+    }
+
+
+@router.post("/shared-with-me/seen")
+async def mark_shared_with_me_seen(
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Reset the caller's pending_shares badge."""
+    await mark_shares_seen(db, current.id)
+    return {"ok": True}
+
+
 @router.get("/usage/{owner_id}/{recipient_id}", response_model=UsageResp)
 async def get_usage(
     owner_id: int,       
@@ -206,70 +286,265 @@ async def get_usage(
     if current.id != owner_id and current.role != "admin":
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    q = select(Usage).where(Usage.owner_id == owner_id, Usage.recipient_id == recipient_id)
-    res = await db.exec(q)
-
-    # Compatibility-safe extraction across SQLAlchemy/SQLModel versions.
-    record = None
-    if hasattr(res, "scalar_one_or_none"):
-        try:
-            record = res.scalar_one_or_none()
-        except Exception:
-            record = None
-    if record is None and hasattr(res, "one_or_none"):
-        try:
-            record = res.one_or_none()
-        except Exception:
-            record = None
-    if record is None and hasattr(res, "scalars"):
-        try:
-            record = res.scalars().first()
-        except Exception:
-            record = None
-    if record is None and hasattr(res, "first"):
-        try:
-            record = res.first()
-        except Exception:
-            record = None
-
+    record = await db.get(Usage, (owner_id, recipient_id))
     if not record:
         raise HTTPException(status_code=404, detail="No usage record")
 
     return record
 
 
+def _file_etag(file_obj: FileModel) -> str:
+    # strong validator from the content hash; legacy rows without one get a
+    # weak tag built from immutable row fields
+    if file_obj.content_hash:
+        return f'"{file_obj.content_hash}"'
+    return f'W/"{file_obj.id}-{file_obj.size}-{int(file_obj.created_at.timestamp())}"'
+
+
+def _serve_file(request: Request, file_obj: FileModel, variant=None, vary_accept: bool = False):
+    # If stored_path looks like a URL (cloud), return the URL
+    if str(file_obj.stored_path).startswith("http"):
+        return {"url": file_obj.stored_path}
+    headers = {"vary": "Accept"} if vary_accept else None
+    if variant is not None:
+        ext = VARIANT_EXTENSIONS[variant.media_type]
+        return conditional_file_response(
+            request,
+            variant.stored_path,
+            filename=f"{os.path.splitext(file_obj.filename)[0]}.{ext}",
+            etag=f'"{file_obj.content_hash}.{ext}"',
+            last_modified=variant.created_at,
+            media_type=variant.media_type,
+            extra_headers=headers,
+        )
+    if file_obj.cloud_url and not os.path.exists(file_obj.stored_path):
+        # evicted from the local tier: serve the cloud copy
+        tiered_store.on_miss(file_obj.content_hash, file_obj.cloud_url)
+        return RedirectResponse(file_obj.cloud_url, status_code=307, headers=headers)
+    tiered_store.record_access(file_obj.content_hash)
+    return conditional_file_response(
+        request,
+        file_obj.stored_path,
+        filename=file_obj.filename,
+        etag=_file_etag(file_obj),
+        last_modified=file_obj.created_at,
+        media_type=file_obj.content_type or None,
+        extra_headers=headers,
+    )
+
+
+async def _get_readable_file(db: AsyncSession, file_id: int, current) -> FileModel:
+    """
+    The File if `current` may read it (owner, share recipient or admin); 404/403 otherwise.
+    Served from the ACL cache, so it may lag the row by up to acl_cache_ttl_seconds.
+    """
+    file_obj, allowed = await acl_cache.readable_file(db, current, file_id)
+    if file_obj is not None and not file_obj.cloud_url and not os.path.exists(file_obj.stored_path):
+        # cached before another worker replicated it and the tier evicted the local copy
+        acl_cache.invalidate_file(file_id)
+        file_obj, allowed = await acl_cache.readable_file(db, current, file_id)
+    if not file_obj:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # owner, shared recipient or admin can download
+    if allowed:
+        return file_obj
+
+    raise HTTPException(status_code=403, detail="Forbidden")
+
+
 @router.get("/download/{file_id}")
 async def download(
     file_id: int,
+    request: Request,
+    original: bool = False,
     current=Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    file_obj = await db.get(FileModel, file_id)
-    if not file_obj:
-        raise HTTPException(status_code=404, detail="File not found")
+    """
+    Download a file (owner, share recipient or admin).
+    Supports Range / If-Range (206), If-None-Match / If-Modified-Since (304).
+    Images are served as the smallest WebP/AVIF variant the Accept header
+    names (Vary: Accept); ?original=1 always returns the uploaded bytes.
+    """
+    file_obj = await _get_readable_file(db, file_id, current)
+    if original or not is_image_content_type(file_obj.content_type) or not file_obj.content_hash:
+        return _serve_file(request, file_obj)
+
+    variant = None
+    accept = request.headers.get("accept")
+    if wants_variant(accept):
+        variant = choose_variant(accept, file_obj.size, await get_file_variants(db, file_obj.content_hash))
+    return _serve_file(request, file_obj, variant, vary_accept=True)
+
+
+@router.get("/archive")
+async def download_archive(
+    ids: Optional[List[int]] = Query(None),
+    shared_with_me: bool = False,
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Stream a ZIP of the given files (?ids=1&ids=2...) or of everything shared
+    with the caller (?shared_with_me=1). All files are authorized in one
+    query; the archive is built on the fly without temp files. Already
+    compressed content is stored, text-like content is deflated.
+    """
+    shared = exists().where(FileShare.file_id == FileModel.id, FileShare.recipient_id == current.id)
+    q = select(FileModel).where(FileModel.is_deleted.is_(False))
+    if shared_with_me:
+        q = q.where(shared)
+    elif ids:
+        wanted = set(ids)
+        q = q.where(FileModel.id.in_(wanted))
+        if current.role != "admin":
+            q = q.where(or_(FileModel.owner_id == current.id, shared))
+    else:
+        raise HTTPException(status_code=400, detail="Pass ids or shared_with_me")
+    files = (await db.exec(q.order_by(FileModel.id).limit(settings.archive_max_files + 1))).all()
+
+    if len(files) > settings.archive_max_files:
+        raise HTTPException(status_code=400, detail=f"At most {settings.archive_max_files} files per archive")
+    if not shared_with_me and len(files) != len(wanted):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if not files:
+        raise HTTPException(status_code=404, detail="No files to download")
+
+    entries = [
+        {
+            "id": f.id,
+            "name": f.filename,
+            "path": f.stored_path,
+            "url": f.cloud_url,
+            "size": f.size,
+            "content_type": f.content_type,
+            "modified": f.created_at,
+        }
+        for f in files
+    ]
+    missing = unavailable_entries(entries)
+    if missing:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Files not available for download: {', '.join(str(e['id']) for e in missing)}",
+        )
+    await log_activity(db, current.id, "download_archive", f"Archive of {len(entries)} files")
+    return StreamingResponse(
+        zip_stream(entries),
+        media_type="application/zip",
+        headers={"content-disposition": 'attachment; filename="shareledger-files.zip"'},
+    )
+
 
-    # owner can download
-    if file_obj.owner_id == current.id:
-        # If stored_path looks like a URL (cloud), redirect or return URL
-        if str(file_obj.stored_path).startswith("http"):
-            # for cloud assets, return the URL
-            return {"url": file_obj.stored_path}
-        return FileResponse(file_obj.stored_path, filename=file_obj.filename)
-
-    # shared recipient can download
-    q = await db.exec(
-        select(FileShare)
-        .where(FileShare.file_id == file_id, FileShare.recipient_id == current.id)
+@router.get("/{file_id}/download-url")
+async def download_url(
+    file_id: int,
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Short-lived URL the client fetches the bytes from directly, bypassing
+    this API: the storage backend's signed URL when the object lives there,
+    else a signed local-storage URL, else the cloud copy.
+    """
+    file_obj = await _get_readable_file(db, file_id, current)
+    ttl = settings.signed_url_ttl_seconds
+    blob = await get_blob(db, file_obj.content_hash) if file_obj.content_hash else None
+
+    url = None
+    if blob is not None and blob.backend_key:
+        url = storage_backend.presign_download(
+            blob.backend_key, filename=file_obj.filename, content_type=file_obj.content_type, expires_in=ttl
+        )
+    elif blob is not None and blob.is_local:
+        url = local_backend.presign_download(
+            local_backend.blob_key(blob.sha256), filename=file_obj.filename, content_type=file_obj.content_type, expires_in=ttl
+        )
+    elif file_obj.cloud_url:
+        url = file_obj.cloud_url
+    if not url:
+        raise HTTPException(status_code=404, detail="No direct URL available for this file")
+    return {"url": url, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)}
+
+
+@router.get("/{file_id}/thumbnail")
+async def thumbnail(
+    file_id: int,
+    request: Request,
+    w: int = Query(256, ge=1, le=settings.thumbnail_max_dimension),
+    h: int = Query(256, ge=1, le=settings.thumbnail_max_dimension),
+    fmt: str = Query(settings.thumbnail_default_format),
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Downscaled preview of an image (fits within w x h, aspect preserved).
+    Same access rules as download. Rendered once per content + parameters and
+    then served from the on-disk derivative cache with a strong ETag.
+    """
+    fmt = fmt.lower()
+    if not format_supported(fmt):
+        raise HTTPException(status_code=400, detail=f"Unsupported format; use one of: {', '.join(sorted(FORMATS))}")
+
+    file_obj = await _get_readable_file(db, file_id, current)
+    if not is_image_content_type(file_obj.content_type):
+        raise HTTPException(status_code=415, detail="Thumbnails are only available for images")
+    if str(file_obj.stored_path).startswith("http"):
+        raise HTTPException(status_code=404, detail="No local copy to render from")
+
+    key, src = derivative_source(file_obj)
+    if file_obj.cloud_url and file_obj.content_hash and not os.path.exists(src):
+        # evicted from the local tier: fetch the original back before rendering
+        try:
+            await tiered_store.rehydrate(file_obj.content_hash, file_obj.cloud_url)
+        except Exception:
+            raise HTTPException(status_code=503, detail="Original temporarily unavailable", headers={"Retry-After": "5"})
+    try:
+        path = await derivative_cache.get_or_render(key, src, w, h, fmt)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    except Exception:
+        raise HTTPException(status_code=415, detail="Could not decode image")
+
+    _, media_type, ext, _ = FORMATS[fmt]
+    stem = os.path.splitext(file_obj.filename)[0] or "thumbnail"
+    return conditional_file_response(
+        request,
+        str(path),
+        filename=f"{stem}-{w}x{h}.{ext}",
+        etag=f'"{key}-{w}x{h}-{fmt}"',
+        last_modified=file_obj.created_at,
+        media_type=media_type,
+        extra_headers={"cache-control": "private, max-age=86400"},
     )
-    if q.scalar_one_or_none():
-        if str(file_obj.stored_path).startswith("http"):
-            return {"url": file_obj.stored_path}
-        return FileResponse(file_obj.stored_path, filename=file_obj.filename)
 
-    # admin can download
-    if current.role == "admin":
-        if str(file_obj.stored_path).startswith("http"):
-            return {"url": file_obj.stored_path}
-        return FileResponse(file_obj.stored_path, filename=file_obj.filename)
 
-    raise HTTPException(status_code=403, detail="Forbidden")
+@router.get("/{file_id}/replication")
+async def replication_status(
+    file_id: int,
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Where the cloud copy of a file stands (owner or admin)."""
+    file_obj = await _get_readable_file(db, file_id, current)
+    if file_obj.owner_id != current.id and current.role != "admin":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    # the cached copy can predate the cloud_url this endpoint reports on
+    file_obj = await db.get(FileModel, file_id)
+
+    job = await get_replication_job(db, file_obj.content_hash) if file_obj.content_hash else None
+    if file_obj.cloud_url:
+        status = "done"
+    elif job is not None:
+        status = job.status
+    else:
+        status = "local_only"
+    return {
+        "file_id": file_obj.id,
+        "status": status,
+        "cloud_url": file_obj.cloud_url,
+        "attempts": job.attempts if job else 0,
+        "next_attempt_at": job.next_attempt_at if job and job.status == "pending" else None,
+        "last_error": job.last_error if job else None,
+    }
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.deps import get_db
+from app.models import DirectUpload
+from app.utils.storage import UploadTooLarge, stream_to_path
+from app.utils.http_range import conditional_file_response
+from app.utils.storage_backends import INCOMING_DIR, InvalidSignature, local_backend, upload_id_from_key, verify_signed
+from app.utils.tiering import tiered_store
+
+# Signed object URLs of the local storage backend. Authorization is the URL
+# signature itself: no bearer token or principal lookup. Downloads touch no
+# database; uploads check their DirectUpload is still open, so a signed PUT
+# can't be replayed once the upload is completed, rejected or expired.
+router = APIRouter()
+
+
+def _verified(method: str, key: str, request: Request) -> dict:
+    try:
+        return verify_signed(method, key, request.query_params)
+    except InvalidSignature as exc:
+        raise HTTPException(status_code=403, detail=str(exc))
+
+
+@router.put("/objects/{key:path}")
+async def put_object(key: str, request: Request, db: AsyncSession = Depends(get_db)):
+    params = _verified("PUT", key, request)
+    try:
+        dest = local_backend.incoming_path(key)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Unknown object")
+    upload = await db.get(DirectUpload, upload_id_from_key(key))
+    if upload is None or upload.status != "pending" or upload.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=409, detail="Upload is no longer open")
+    INCOMING_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        size, _ = await stream_to_path(request.stream(), dest, max_bytes=int(params["max"]))
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="File too large")
+    return {"ok": True, "size": size}
+
+
+@router.get("/objects/{key:path}")
+async def get_object(key: str, request: Request):
+    params = _verified("GET", key, request)
+    try:
+        path = local_backend.blob_file(key)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Unknown object")
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Object not found")
+    content_hash = path.name
+    tiered_store.record_access(content_hash)
+    return conditional_file_response(
+        request,
+        str(path),
+        filename=params.get("fn") or content_hash,
+        etag=f'"{content_hash}"',
+        media_type=params.get("ct") or None,
+    )
@@ -0,0 +1,151 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.deps import get_current_user, get_db
+from app.schemas import UploadSessionCreate, UploadSessionResp
+from app.models import File as FileModel
+from app.core.config import settings
+from app.utils.storage import UploadTooLarge, hash_file
+from app.utils.blobstore import discard_staged
+from app.utils.ingest import ingest_staged_file, upload_result, UploadRejected
+from app.utils.upload_sessions import (
+    UploadOffsetMismatch,
+    UploadSessionNotFound,
+    append_chunk,
+    committed_offset,
+    create_session,
+    data_path,
+    delete_session,
+    load_session,
+    mark_finalized,
+    session_lock,
+    snapshot_data,
+)
+
+router = APIRouter()
+
+
+def _owned_session(upload_id: str, current) -> dict:
+    try:
+        meta = load_session(upload_id)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if meta["owner_id"] != current.id:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return meta
+
+
+def _session_resp(meta: dict) -> dict:
+    return {
+        "upload_id": meta["upload_id"],
+        "filename": meta["filename"],
+        "content_type": meta["content_type"],
+        "total_size": meta["total_size"],
+        "offset": meta["size"] if meta["file_id"] else committed_offset(meta),
+        "file_id": meta["file_id"],
+    }
+
+
+@router.post("", response_model=UploadSessionResp)
+async def create_upload_session(req: UploadSessionCreate, current=Depends(get_current_user)):
+    """Start a resumable upload. PUT chunks to the returned upload_id, then finalize."""
+    if req.total_size is not None and not 0 <= req.total_size <= settings.max_session_upload_bytes:
+        raise HTTPException(status_code=400, detail="File too large")
+    meta = await run_in_threadpool(
+        create_session, current.id, req.filename or "upload", (req.content_type or "").lower() or None, req.total_size
+    )
+    return _session_resp(meta)
+
+
+@router.get("/{upload_id}", response_model=UploadSessionResp)
+async def get_upload_session(upload_id: str, current=Depends(get_current_user)):
+    """Report the committed offset, i.e. where the client should resume."""
+    return _session_resp(_owned_session(upload_id, current))
+
+
+@router.put("/{upload_id}", response_model=UploadSessionResp)
+async def put_upload_chunk(upload_id: str, offset: int, request: Request, current=Depends(get_current_user)):
+    """
+    Write the raw request body at `offset`.
+    Re-sending a chunk the server already has is a no-op, so clients can
+    retry blindly; writing past the committed offset returns 409.
+    """
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid offset")
+
+    async with session_lock(upload_id):
+        meta = _owned_session(upload_id, current)
+        if meta["file_id"]:
+            raise HTTPException(status_code=409, detail="Upload session already finalized")
+        try:
+            await append_chunk(meta, offset, request.stream())
+        except UploadOffsetMismatch as exc:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Offset mismatch, resume at {exc.committed}",
+                headers={"Upload-Offset": str(exc.committed)},
+            )
+        except UploadTooLarge:
+            raise HTTPException(status_code=400, detail="File too large")
+    return _session_resp(meta)
+
+
+@router.post("/{upload_id}/finalize")
+async def finalize_upload_session(
+    upload_id: str,
+    current=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Hash the assembled file and run it through the regular ingest pipeline
+    (NSFW check, blob store, Cloudinary push, File record). Idempotent: a
+    repeated finalize returns the File created the first time.
+    """
+    async with session_lock(upload_id):
+        meta = _owned_session(upload_id, current)
+        if meta["file_id"]:
+            f = await db.get(FileModel, meta["file_id"])
+            if f:
+                return upload_result(f, meta["deduplicated"])
+            raise HTTPException(status_code=404, detail="File not found")
+
+        size = committed_offset(meta)
+        if meta["total_size"] is not None and size != meta["total_size"]:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload incomplete: {size} of {meta['total_size']} bytes",
+                headers={"Upload-Offset": str(size)},
+            )
+
+        content_hash = await run_in_threadpool(hash_file, data_path(meta))
+        # ingest moves its own link to the data; the session's copy goes only
+        # once the File is recorded, so a failed finalize can be retried
+        staged = await run_in_threadpool(snapshot_data, meta)
+        try:
+            f, deduplicated = await ingest_staged_file(
+                db,
+                current,
+                staged,
+                filename=meta["filename"],
+                content_type=meta["content_type"] or "",
+                size=size,
+                content_hash=content_hash,
+            )
+        except UploadRejected as exc:
+            await run_in_threadpool(delete_session, upload_id)
+            raise HTTPException(status_code=400, detail=str(exc))
+        finally:
+            # no-op when the data was moved into the blob store
+            discard_staged(staged)
+
+        await run_in_threadpool(mark_finalized, meta, f.id, deduplicated, size)
+        return upload_result(f, deduplicated)
+
+
+@router.delete("/{upload_id}")
+async def abort_upload_session(upload_id: str, current=Depends(get_current_user)):
+    _owned_session(upload_id, current)
+    async with session_lock(upload_id):
+        await run_in_threadpool(delete_session, upload_id)
+    return {"ok": True}
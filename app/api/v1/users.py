@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.deps import get_current_user, require_admin, get_db
-from app.schemas import UserRead
+from app.schemas import UserRead, UserPage
+from app.utils.paginator import paginate_query
 from app.models import User
 
 router = APIRouter()
@@ -14,7 +17,12 @@ async def me(current=Depends(get_current_user)):
     return current
 
 
-@router.get("/", response_model=list[UserRead], dependencies=[Depends(require_admin)])
-async def list_users(db: AsyncSession = Depends(get_db)):
-    result = await db.exec(select(User).order_by(User.created_at.desc()))
-    return result.all()
+@router.get("/", response_model=UserPage, dependencies=[Depends(require_admin)])
+async def list_users(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    return await paginate_query(
+        db, select(User), created_col=User.created_at, id_col=User.id, limit=limit, cursor=cursor,
+    )
@@ -0,0 +1,138 @@
+from collections import OrderedDict
+import time
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.models import File, FileShare
+
+
+class AclCache:
+    """
+    In-process LRU of per-file read ACLs: file_id -> (File, recipient ids),
+    where File is a detached copy of the row, so an allowed repeat read
+    needs no query at all. Entries are loaded on first use with one query
+    on the (file_id, recipient_id) index and dropped by share_file, admin
+    user deletes and file deletion, or after `ttl` seconds.
+    Only covers this worker, so a cached "no" is always re-checked against
+    FileShare before it becomes a 403: a point query on (file_id,
+    recipient_id), whose hit is added to the entry. A share made through
+    another worker is never refused. Removals made elsewhere are seen once
+    the entry expires.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple[float, File, frozenset[int]]]" = OrderedDict()
+        # bumped by invalidate_file (per file) and by invalidate_user/clear
+        # (for all); a load that raced a bump is not cached
+        self._versions: dict[int, int] = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.rechecks = 0
+
+    def _version(self, file_id: int) -> tuple[int, int]:
+        return self._generation, self._versions.get(file_id, 0)
+
+    def _get(self, file_id: int):
+        entry = self._entries.get(file_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._entries[file_id]
+            return None
+        self._entries.move_to_end(file_id)
+        return entry
+
+    def _put(self, file_id: int, file_obj: File, recipients: frozenset[int], version: tuple[int, int]) -> None:
+        if self.maxsize <= 0 or version != self._version(file_id):
+            return
+        self._entries[file_id] = (time.time() + self.ttl, file_obj, recipients)
+        self._entries.move_to_end(file_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def _load(self, db: AsyncSession, file_id: int):
+        version = self._version(file_id)
+        file_obj = await db.get(File, file_id)
+        if file_obj is None:
+            return None
+        res = await db.execute(select(FileShare.recipient_id).where(FileShare.file_id == file_id).distinct())
+        # detached copy: the cached entry must not follow (or pin) this session
+        snapshot = File(**{c.name: getattr(file_obj, c.name) for c in File.__table__.columns})
+        entry = (0.0, snapshot, frozenset(res.scalars().all()))
+        self._put(file_id, entry[1], entry[2], version)
+        return entry
+
+    async def _recheck(self, db: AsyncSession, user_id: int, file_id: int) -> bool:
+        version = self._version(file_id)
+        res = await db.execute(
+            select(FileShare.id).where(FileShare.file_id == file_id, FileShare.recipient_id == user_id).limit(1)
+        )
+        if res.first() is None:
+            return False
+        entry = self._entries.get(file_id)
+        if entry is not None and version == self._version(file_id):
+            self._entries[file_id] = (entry[0], entry[1], entry[2] | {user_id})
+        return True
+
+    async def readable_file(self, db: AsyncSession, user, file_id: int) -> tuple[File | None, bool]:
+        """
+        (File, allowed) for owner, share recipient or admin; (None, False)
+        when the file doesn't exist. Repeat reads by an allowed user touch
+        no tables. The File is a cached copy: read it, don't modify or add it.
+        """
+        entry = self._get(file_id)
+        if entry is not None:
+            self.hits += 1
+            file_obj, recipients = entry[1], entry[2]
+            if user.role == "admin" or user.id == file_obj.owner_id or user.id in recipients:
+                return file_obj, True
+            # maybe shared since the entry was loaded (possibly by another worker)
+            self.rechecks += 1
+            return file_obj, await self._recheck(db, user.id, file_id)
+        self.misses += 1
+        entry = await self._load(db, file_id)
+        if entry is None:
+            return None, False
+        file_obj, recipients = entry[1], entry[2]
+        return file_obj, user.role == "admin" or user.id == file_obj.owner_id or user.id in recipients
+
+    def invalidate_file(self, file_id: int) -> None:
+        if len(self._versions) >= max(self.maxsize, 1) and file_id not in self._versions:
+            # keep the counters bounded; a new generation covers what is forgotten
+            self._versions.clear()
+            self._generation += 1
+        self._versions[file_id] = self._versions.get(file_id, 0) + 1
+        self._entries.pop(file_id, None)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drop every entry the user appears in, as owner or recipient."""
+        self._generation += 1
+        for file_id in [k for k, (_, file_obj, recipients) in self._entries.items()
+                        if file_obj.owner_id == user_id or user_id in recipients]:
+            del self._entries[file_id]
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rechecks": self.rechecks,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+acl_cache = AclCache(
+    maxsize=settings.acl_cache_size,
+    ttl=settings.acl_cache_ttl_seconds,
+)
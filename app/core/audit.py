@@ -0,0 +1,120 @@
+from datetime import datetime
+import asyncio
+import logging
+
+from sqlalchemy import insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.db.session import engine
+from app.models import ActivityLog
+
+logger = logging.getLogger("shareledger.audit")
+
+
+class ActivityWriter:
+    """
+    Buffered ActivityLog pipeline.
+    Callers enqueue rows and return immediately; a background task writes them
+    with one multi-row INSERT per batch, flushing when `batch_size` rows are
+    waiting or `flush_interval` seconds after the first one arrived, and once
+    more at shutdown. A full queue blocks enqueue (backpressure).
+    """
+
+    def __init__(self, maxsize: int, batch_size: int, flush_interval: float):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+
+    async def enqueue(self, user_id: int, action: str, details: str | None = None) -> bool:
+        """Queue a row. Returns False when the writer isn't running (caller writes directly)."""
+        if self._queue is None:
+            return False
+        await self._queue.put(
+            {"user_id": user_id, "action": action, "details": details, "created_at": datetime.utcnow()}
+        )
+        return True
+
+    async def _write(self, rows: list[dict]) -> None:
+        async with AsyncSession(engine) as session:
+            try:
+                await session.execute(insert(ActivityLog).values(rows))
+                await session.commit()
+                self.written += len(rows)
+                self.batches += 1
+                return
+            except Exception:
+                await session.rollback()
+                logger.exception("Batched activity insert failed, retrying row by row")
+            # one bad row (e.g. its user was deleted meanwhile) must not sink the batch
+            for row in rows:
+                try:
+                    await session.execute(insert(ActivityLog).values(row))
+                    await session.commit()
+                    self.written += 1
+                except Exception:
+                    await session.rollback()
+                    self.dropped += 1
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            row = await queue.get()
+            if row is None:
+                return
+            batch = [row]
+            stopping = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            try:
+                await self._write(batch)
+            except Exception:
+                self.dropped += len(batch)
+                logger.exception("Dropped %d activity rows", len(batch))
+            if stopping:
+                return
+
+    def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._task = asyncio.create_task(self._run(self._queue))
+
+    async def stop(self) -> None:
+        """Flush everything queued so far, then stop."""
+        if self._task is None:
+            return
+        queue, self._queue = self._queue, None  # later callers write directly
+        await queue.put(None)
+        await self._task
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+        }
+
+
+activity_writer = ActivityWriter(
+    maxsize=settings.activity_queue_size,
+    batch_size=settings.activity_batch_size,
+    flush_interval=settings.activity_flush_interval_ms / 1000,
+)
@@ -11,12 +11,127 @@ class Settings(BaseSettings):
     email_log_dir: str = "./logs/emails"
 
     max_upload_size_bytes: int = int(os.environ.get("MAX_UPLOAD_SIZE_BYTES", 52428800))
+    upload_chunk_size_bytes: int = 1024 * 1024
+
+    # resumable upload sessions
+    max_session_upload_bytes: int = 10 * 1024 * 1024 * 1024
+    upload_session_ttl_seconds: int = 24 * 60 * 60
+    upload_session_sweep_interval_seconds: int = 15 * 60
+
+    # password hashing (bcrypt on a process pool)
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 2
+    password_hash_queue_size: int = 32
+
+    # authenticated principal cache (per worker)
+    principal_cache_size: int = 10000
+    principal_cache_ttl_seconds: int = 60
+
+    # per-file read ACLs (owner + recipients), cached per worker
+    acl_cache_size: int = 50000
+    acl_cache_ttl_seconds: int = 300
+
+    # revoked-token index: Bloom filter pre-check + expiry purge
+    revocation_bloom_capacity: int = 100000
+    revocation_bloom_error_rate: float = 0.001
+    revocation_refresh_seconds: int = 5
+    # re-read window behind the refresh watermark, for revocations that commit late
+    revocation_refresh_overlap_seconds: int = 60
+    revocation_purge_interval_seconds: int = 15 * 60
+    revocation_purge_batch_size: int = 1000
+
+    # buffered ActivityLog writer
+    activity_queue_size: int = 10000
+    activity_batch_size: int = 500
+    activity_flush_interval_ms: int = 200
+
+    # recipients per /files/share/bulk request
+    bulk_share_max_recipients: int = 500
+
+    # Usage accounting: merge share increments in memory and flush them in bulk
+    usage_write_behind: bool = False
+    usage_flush_interval_ms: int = 250
+
+    # notification outbox (spooled to email_log_dir as JSONL segments)
+    email_queue_size: int = 10000
+    email_batch_size: int = 500
+    email_flush_interval_ms: int = 500
+    email_segment_max_bytes: int = 8 * 1024 * 1024
+    email_digest_window_seconds: float = 0
 
     nsfw_detector: str = os.environ.get("NSFW_DETECTOR", "disabled")
+    # NSFW inference service: worker processes and micro-batching
+    nsfw_workers: int = 1
+    nsfw_batch_size: int = 8
+    nsfw_batch_max_wait_ms: int = 20
+    nsfw_verdict_cache_size: int = 50000
+    # frame sampling for animated images / video
+    nsfw_sample_frames: int = 8
+    nsfw_max_keyframes: int = 8
+    nsfw_frame_batch_size: int = 4
+    nsfw_media_budget_seconds: float = 10.0
+
+    # multi-file uploads: parts per request, parts staged/checked at once
+    batch_upload_max_files: int = 50
+    batch_upload_concurrency: int = 4
+
+    # streaming ZIP downloads
+    archive_max_files: int = 1000
+
+    # image thumbnails / derivatives, cached on disk under upload_dir/derivatives
+    thumbnail_cache_max_bytes: int = 512 * 1024 * 1024
+    thumbnail_max_dimension: int = 2048
+    thumbnail_default_format: str = "webp"
+    # e.g. "128x128,512x512": rendered in the background right after an image upload
+    thumbnail_pregenerate_sizes: str = ""
+
+    # compact image variants (WebP, AVIF where Pillow supports it) built after
+    # ingest and served to clients whose Accept header allows them
+    image_variants_enabled: bool = False
+    image_variant_formats: str = "webp,avif"
+    image_variant_workers: int = 2
+    # keep a variant only if it is at most this fraction of the original size
+    image_variant_max_ratio: float = 0.9
+
     cloudinary_cloud_name: str | None = None
     cloudinary_api_key: str | None = None
     cloudinary_api_secret: str | None = None
     cloudinary_upload_folder: str | None = "shareledger"
+    cloudinary_max_concurrency: int = 4
+
+    # background cloud replication queue (ReplicationJob table)
+    replication_concurrency: int = 4
+    replication_poll_interval_seconds: float = 5
+    replication_batch_size: int = 20
+    replication_max_attempts: int = 8
+    replication_backoff_base_seconds: float = 5
+    replication_backoff_max_seconds: float = 60 * 60
+    replication_lease_seconds: int = 15 * 60
+    # files above the threshold go up in chunks (Cloudinary requires >= 5 MB chunks)
+    replication_chunk_threshold_bytes: int = 20 * 1024 * 1024
+    replication_chunk_size_bytes: int = 6 * 1024 * 1024
+
+    # tiered local storage: cloud-replicated blobs become an evictable local cache
+    local_storage_budget_bytes: int = 0  # 0 = keep every blob local
+    local_storage_low_watermark: float = 0.9  # evict down to this fraction of the budget
+    local_eviction_policy: str = "lru"  # "lru" (last access) or "lfu" (access count)
+    local_eviction_interval_seconds: float = 60
+    local_eviction_batch_size: int = 200
+    # on a local miss: "redirect" to the cloud copy, or "rehydrate" (redirect
+    # now, copy the blob back to local disk in the background)
+    local_miss_policy: str = "redirect"
+
+    # direct-to-storage uploads/downloads through short-lived signed URLs
+    storage_backend: str = "local"  # "local", "s3" or "cloudinary"
+    public_base_url: str = ""  # prefix for the local backend's signed URLs
+    signed_url_ttl_seconds: int = 15 * 60
+    direct_upload_ttl_seconds: int = 24 * 60 * 60
+    direct_upload_sweep_interval_seconds: int = 15 * 60
+    s3_bucket: str | None = None
+    s3_endpoint_url: str | None = None  # e.g. a MinIO endpoint
+    s3_region: str | None = None
+    s3_access_key_id: str | None = None
+    s3_secret_access_key: str | None = None
 
     class Config:
         env_file = ".env"
@@ -1,16 +1,168 @@
 from pathlib import Path
 from datetime import datetime
+from uuid import uuid4
+import asyncio
+import json
+import logging
 import os
 
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+logger = logging.getLogger("shareledger.email")
+
 EMAIL_DIR = os.environ.get("EMAIL_LOG_DIR", "./logs/emails")
 Path(EMAIL_DIR).mkdir(parents=True, exist_ok=True)
 
 def send_local_email(to_email: str, subject: str, body: str):
-    timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
     safe_email = to_email.replace("@", "_at_")
-    filename = Path(EMAIL_DIR) / f"email_{timestamp}_{safe_email}.txt"
+    # microseconds + a random suffix: two mails to one recipient in the same second must not collide
+    filename = Path(EMAIL_DIR) / f"email_{timestamp}_{uuid4().hex[:8]}_{safe_email}.txt"
 
     content = f"To: {to_email}\nSubject: {subject}\n\n{body}\n"
     filename.write_text(content)
 
     return str(filename)
+
+
+class EmailOutbox:
+    """
+    Non-blocking notification outbox.
+    enqueue() returns immediately; a background dispatcher appends messages in
+    batches as JSON lines to rotating spool segments
+    (EMAIL_DIR/outbox-<timestamp>.jsonl). With a digest window, messages to
+    the same recipient within the window are merged into one.
+    """
+
+    def __init__(self, spool_dir: str, maxsize: int, batch_size: int, flush_interval: float,
+                 segment_max_bytes: int, digest_window: float):
+        self.spool_dir = Path(spool_dir)
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_max_bytes = segment_max_bytes
+        self.digest_window = digest_window
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._segment: Path | None = None
+        # recipient -> (first queued at, [messages]) while a digest window is open
+        self._digests: dict[str, tuple[float, list[dict]]] = {}
+        self.sent = 0
+        self.merged = 0
+        self.segments = 0
+
+    def enqueue(self, to_email: str, subject: str, body: str) -> None:
+        self.enqueue_many([(to_email, subject, body)])
+
+    def enqueue_many(self, messages: list[tuple[str, str, str]]) -> None:
+        """Queue (to, subject, body) tuples. Falls back to direct delivery when not running or full."""
+        now = datetime.utcnow().isoformat()
+        for to_email, subject, body in messages:
+            msg = {"id": uuid4().hex, "queued_at": now, "to": to_email, "subject": subject, "body": body}
+            try:
+                if self._queue is None:
+                    raise asyncio.QueueFull
+                self._queue.put_nowait(msg)
+            except asyncio.QueueFull:
+                send_local_email(to_email, subject, body)
+
+    def _accept(self, msg: dict, batch: list[dict], now: float) -> None:
+        if self.digest_window <= 0:
+            batch.append(msg)
+            return
+        first, pending = self._digests.setdefault(msg["to"], (now, []))
+        pending.append(msg)
+
+    def _take_due_digests(self, now: float, force: bool = False) -> list[dict]:
+        due = []
+        for to_email, (first, pending) in list(self._digests.items()):
+            if force or now - first >= self.digest_window:
+                del self._digests[to_email]
+                due.append(self._merge(pending))
+        return due
+
+    def _merge(self, pending: list[dict]) -> dict:
+        if len(pending) == 1:
+            return pending[0]
+        self.merged += len(pending) - 1
+        subjects = {m["subject"] for m in pending}
+        return {
+            "id": uuid4().hex,
+            "queued_at": pending[0]["queued_at"],
+            "to": pending[0]["to"],
+            "subject": pending[0]["subject"] if len(subjects) == 1 else f"{len(pending)} new notifications",
+            "body": "\n".join(m["body"] for m in pending),
+            "count": len(pending),
+        }
+
+    def _append(self, batch: list[dict]) -> None:
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        if self._segment is None or (self._segment.exists() and self._segment.stat().st_size >= self.segment_max_bytes):
+            stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
+            self._segment = self.spool_dir / f"outbox-{stamp}.jsonl"
+            self.segments += 1
+        with open(self._segment, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(m) + "\n" for m in batch))
+        self.sent += len(batch)
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: list[dict] = []
+            stopping = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    msg = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if msg is None:
+                    stopping = True
+                    break
+                self._accept(msg, batch, loop.time())
+            batch.extend(self._take_due_digests(loop.time(), force=stopping))
+            if batch:
+                try:
+                    await run_in_threadpool(self._append, batch)
+                except Exception:
+                    logger.exception("Failed to spool %d emails", len(batch))
+            if stopping:
+                return
+
+    def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._task = asyncio.create_task(self._run(self._queue))
+
+    async def stop(self) -> None:
+        """Deliver everything queued (including open digests), then stop."""
+        if self._task is None:
+            return
+        queue, self._queue = self._queue, None
+        await queue.put(None)
+        await self._task
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "pending_digests": len(self._digests),
+            "sent": self.sent,
+            "merged": self.merged,
+            "segments": self.segments,
+        }
+
+
+email_outbox = EmailOutbox(
+    spool_dir=EMAIL_DIR,
+    maxsize=settings.email_queue_size,
+    batch_size=settings.email_batch_size,
+    flush_interval=settings.email_flush_interval_ms / 1000,
+    segment_max_bytes=settings.email_segment_max_bytes,
+    digest_window=settings.email_digest_window_seconds,
+)
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+import time
+
+from app.core.config import settings
+
+
+class PrincipalCache:
+    """
+    In-process LRU of authenticated principals keyed by token jti.
+    Entries expire after `ttl` seconds or at the token's exp, whichever comes
+    first. Only covers this worker: other workers notice a revocation or user
+    change once their own entry expires.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[float, object]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, jti: str):
+        entry = self._entries.get(jti)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at <= time.time():
+            del self._entries[jti]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(jti)
+        self.hits += 1
+        return user
+
+    def put(self, jti: str, user, token_exp: float | None = None) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        self._entries[jti] = (expires_at, user)
+        self._entries.move_to_end(jti)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate_token(self, jti: str) -> None:
+        self._entries.pop(jti, None)
+
+    def invalidate_user(self, user_id: int) -> None:
+        for jti in [k for k, (_, u) in self._entries.items() if u.id == user_id]:
+            del self._entries[jti]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+principal_cache = PrincipalCache(
+    maxsize=settings.principal_cache_size,
+    ttl=settings.principal_cache_ttl_seconds,
+)
@@ -0,0 +1,204 @@
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import logging
+import math
+
+from app.core.config import settings
+
+logger = logging.getLogger("shareledger.revocation")
+
+_maintenance_task: asyncio.Task | None = None
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on a blake2b digest)."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RevocationIndex:
+    """
+    In-memory pre-check in front of the RevokedToken table.
+    A miss in the Bloom filter means "definitely not revoked" and skips the
+    DB. Until the first rebuild, every lookup falls through to the DB.
+    """
+
+    def __init__(self):
+        self.bloom: BloomFilter | None = None
+        # newest revoked_at loaded from the table (never from local adds);
+        # refresh() re-reads from a little before it, see refresh_revocation_index
+        self.watermark: datetime | None = None
+        # jtis added locally while a rebuild reads its snapshot; load() re-applies them
+        self._added_during_rebuild: set[str] | None = None
+        self.skipped_lookups = 0
+        self.db_lookups = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.bloom is not None
+
+    def might_be_revoked(self, jti: str) -> bool:
+        if self.bloom is None or jti in self.bloom:
+            self.db_lookups += 1
+            return True
+        self.skipped_lookups += 1
+        return False
+
+    def add(self, jti: str) -> None:
+        if self._added_during_rebuild is not None:
+            self._added_during_rebuild.add(jti)
+        if self.bloom is None or jti in self.bloom:
+            # already present (or a false positive, which answers "maybe" anyway)
+            return
+        self.bloom.add(jti)
+        if self.bloom.count > self.bloom.capacity:
+            # over capacity the false-positive rate climbs; drop back to
+            # DB lookups until the next rebuild sizes a bigger filter
+            self.bloom = None
+
+    def merge(self, rows: list[tuple[str, datetime]]) -> None:
+        """Add (jti, revoked_at) rows read from the table and advance the watermark."""
+        for jti, revoked_at in rows:
+            self.add(jti)
+            if revoked_at is not None and (self.watermark is None or revoked_at > self.watermark):
+                self.watermark = revoked_at
+
+    def begin_rebuild(self) -> None:
+        """Start recording local adds; call before reading the snapshot for load()."""
+        self._added_during_rebuild = set()
+
+    def end_rebuild(self) -> None:
+        self._added_during_rebuild = None
+
+    def load(self, rows: list[tuple[str, datetime]]) -> None:
+        """
+        Replace the filter with one built from (jti, revoked_at) rows, plus
+        any jti added locally since begin_rebuild(): those may have committed
+        after the snapshot was read.
+        """
+        added = self._added_during_rebuild or set()
+        capacity = max(settings.revocation_bloom_capacity, 2 * (len(rows) + len(added)))
+        bloom = BloomFilter(capacity, settings.revocation_bloom_error_rate)
+        watermark = None
+        for jti, revoked_at in rows:
+            bloom.add(jti)
+            if revoked_at is not None and (watermark is None or revoked_at > watermark):
+                watermark = revoked_at
+        for jti in added:
+            bloom.add(jti)
+        self.bloom = bloom
+        self.watermark = watermark
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "entries": self.bloom.count if self.bloom else 0,
+            "capacity": self.bloom.capacity if self.bloom else 0,
+            "skipped_lookups": self.skipped_lookups,
+            "db_lookups": self.db_lookups,
+        }
+
+
+revocation_index = RevocationIndex()
+
+
+async def rebuild_revocation_index():
+    # local imports: crud imports this module
+    from app.db.session import get_session
+    from app.crud import load_revocations
+
+    revocation_index.begin_rebuild()
+    try:
+        async for session in get_session():
+            revocation_index.load(await load_revocations(session))
+    finally:
+        revocation_index.end_rebuild()
+
+
+async def refresh_revocation_index():
+    """
+    Pick up tokens revoked by other workers since the last load.
+    revoked_at is stamped by the app before the insert commits, so rows do
+    not become visible in revoked_at order; each refresh re-reads an overlap
+    window before the watermark and skips jtis already in the filter.
+    """
+    from app.db.session import get_session
+    from app.crud import load_revocations
+
+    if not revocation_index.ready:
+        return await rebuild_revocation_index()
+    since = revocation_index.watermark
+    if since is not None:
+        since -= timedelta(seconds=settings.revocation_refresh_overlap_seconds)
+    async for session in get_session():
+        revocation_index.merge(await load_revocations(session, since=since))
+
+
+async def purge_expired_revocations() -> int:
+    from app.db.session import get_session
+    from app.crud import purge_expired_tokens
+
+    async for session in get_session():
+        return await purge_expired_tokens(session, batch_size=settings.revocation_purge_batch_size)
+
+
+async def _maintenance_loop():
+    loop = asyncio.get_running_loop()
+    last_purge = loop.time()
+    while True:
+        await asyncio.sleep(settings.revocation_refresh_seconds)
+        try:
+            if loop.time() - last_purge >= settings.revocation_purge_interval_seconds:
+                last_purge = loop.time()
+                purged = await purge_expired_revocations()
+                if purged:
+                    logger.info("Purged %d expired revoked tokens", purged)
+                # Bloom filters can't forget; rebuild from what's left
+                await rebuild_revocation_index()
+            else:
+                await refresh_revocation_index()
+        except Exception:
+            logger.exception("Revocation index maintenance failed")
+
+
+async def start_revocation_maintenance():
+    global _maintenance_task
+    try:
+        await rebuild_revocation_index()
+    except Exception:
+        logger.exception("Could not build revocation index; falling back to DB lookups")
+    if _maintenance_task is None:
+        _maintenance_task = asyncio.create_task(_maintenance_loop())
+
+
+async def stop_revocation_maintenance():
+    global _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        try:
+            await _maintenance_task
+        except asyncio.CancelledError:
+            pass
+        _maintenance_task = None
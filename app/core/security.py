@@ -1,12 +1,24 @@
 from jose import jwt
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
 from passlib.context import CryptContext
 from app.core.config import settings
+import asyncio
+import multiprocessing
 import uuid
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
 ALGORITHM = "HS256"
 
+# bcrypt is CPU bound (~250ms at the default cost), so async callers run it on
+# a dedicated process pool instead of blocking the event loop.
+_hash_pool: ProcessPoolExecutor | None = None
+_hash_in_flight = 0
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool and its admission queue are full."""
+
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
@@ -16,6 +28,54 @@ def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
 
+def _verify_and_update(plain: str, hashed: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(plain, hashed)
+
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        # spawn: forking a process with a running event loop is not safe
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=settings.password_hash_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _hash_pool
+
+
+async def _run_in_hash_pool(fn, *args):
+    global _hash_in_flight
+    if _hash_in_flight >= settings.password_hash_workers + settings.password_hash_queue_size:
+        raise PasswordHasherBusy("Password hashing is saturated, retry later")
+    _hash_in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_hash_pool(), fn, *args)
+    finally:
+        _hash_in_flight -= 1
+
+
+async def hash_password(password: str) -> str:
+    """Async get_password_hash, run on the hashing pool."""
+    return await _run_in_hash_pool(get_password_hash, password)
+
+
+async def verify_and_update_password(plain: str, hashed: str) -> tuple[bool, str | None]:
+    """
+    Async verify, run on the hashing pool.
+    Returns: (valid, new_hash) where new_hash is set when the stored hash uses
+    outdated parameters (e.g. a lower bcrypt cost) and should be replaced.
+    """
+    return await _run_in_hash_pool(_verify_and_update, plain, hashed)
+
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = None
+
+
 def create_access_token(subject: str, expires_minutes: int | None = None) -> str:
     expire = datetime.utcnow() + timedelta(
         minutes=(expires_minutes or settings.access_token_expire_minutes)
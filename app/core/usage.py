@@ -0,0 +1,188 @@
+from datetime import datetime
+import asyncio
+import logging
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.db.dialect import dialect_insert
+from app.db.session import engine
+from app.models import ShareRollupDaily, ShareRollupHourly, Usage
+
+logger = logging.getLogger("shareledger.usage")
+
+# rows per multi-row upsert (keeps SQLite under its bound-parameter limit)
+_UPSERT_CHUNK = 500
+
+ROLLUP_MODELS = {"hour": ShareRollupHourly, "day": ShareRollupDaily}
+
+
+def _chunks(items: list, size: int = _UPSERT_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def truncate(ts: datetime, granularity: str) -> datetime:
+    """Start of the hour or day `ts` falls in."""
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0) if granularity == "day" else ts
+
+
+async def add_usage(session: AsyncSession, increments: dict[tuple[int, int], int]) -> None:
+    """
+    Add bytes to the Usage rows of many (owner_id, recipient_id) pairs with
+    one INSERT ... ON CONFLICT DO UPDATE SET total_bytes = total_bytes + excluded.
+    The increment happens inside the database, so concurrent writers never
+    lose each other's updates. Does not commit.
+    """
+    if not increments:
+        return
+    insert = dialect_insert(session)
+    now = datetime.utcnow()
+    # sorted so concurrent flushes lock rows in the same order
+    for chunk in _chunks(sorted(increments.items())):
+        stmt = insert(Usage).values([
+            {"owner_id": owner_id, "recipient_id": recipient_id, "total_bytes": n, "created_at": now, "updated_at": now}
+            for (owner_id, recipient_id), n in chunk
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Usage.owner_id, Usage.recipient_id],
+            set_={"total_bytes": Usage.total_bytes + stmt.excluded.total_bytes, "updated_at": now},
+        )
+        await session.execute(stmt)
+
+
+async def add_share_rollups(session: AsyncSession, increments: dict[tuple[datetime, int, int], tuple[int, int]]) -> None:
+    """
+    Add (share_count, total_bytes) to the hourly rollup rows keyed by
+    (hour, owner_id, recipient_id), and to the matching daily rows, with the
+    same additive upsert as add_usage. Does not commit.
+    """
+    if not increments:
+        return
+    daily: dict[tuple[datetime, int, int], tuple[int, int]] = {}
+    for (hour, owner_id, recipient_id), (count, nbytes) in increments.items():
+        key = (truncate(hour, "day"), owner_id, recipient_id)
+        prev_count, prev_bytes = daily.get(key, (0, 0))
+        daily[key] = (prev_count + count, prev_bytes + nbytes)
+    insert = dialect_insert(session)
+    for model, rows in ((ShareRollupHourly, increments), (ShareRollupDaily, daily)):
+        for chunk in _chunks(sorted(rows.items())):
+            stmt = insert(model).values([
+                {"bucket": bucket, "owner_id": owner_id, "recipient_id": recipient_id, "share_count": count, "total_bytes": nbytes}
+                for (bucket, owner_id, recipient_id), (count, nbytes) in chunk
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[model.bucket, model.owner_id, model.recipient_id],
+                set_={
+                    "share_count": model.share_count + stmt.excluded.share_count,
+                    "total_bytes": model.total_bytes + stmt.excluded.total_bytes,
+                },
+            )
+            await session.execute(stmt)
+
+
+class UsageAggregator:
+    """
+    Optional write-behind for Usage accounting and the share rollups.
+    Shares add their bytes to in-memory totals per (owner, recipient) and per
+    (hour, owner, recipient) and return without touching those tables; a
+    background task flushes the merged totals in one transaction every
+    `flush_interval` seconds, and once more at shutdown. Usage and analytics
+    reads lag by up to one interval.
+    """
+
+    def __init__(self, enabled: bool, flush_interval: float):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self._pending: dict[tuple[int, int], int] = {}
+        self._rollups: dict[tuple[datetime, int, int], tuple[int, int]] = {}
+        self._task: asyncio.Task | None = None
+        self._stop: asyncio.Event | None = None
+        self.merged = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def add(self, usage: dict[tuple[int, int], int], rollups: dict[tuple[datetime, int, int], tuple[int, int]]) -> bool:
+        """
+        Merge the increments of shares that are already committed (same shapes
+        as add_usage/add_share_rollups). Returns False when write-behind isn't
+        running; the caller then upserts them itself.
+        """
+        if self._task is None:
+            return False
+        self._merge(usage, rollups)
+        self.merged += sum(count for count, _ in rollups.values())
+        return True
+
+    def _merge(self, usage: dict, rollups: dict) -> None:
+        for key, n in usage.items():
+            self._pending[key] = self._pending.get(key, 0) + n
+        for key, (count, nbytes) in rollups.items():
+            prev_count, prev_bytes = self._rollups.get(key, (0, 0))
+            self._rollups[key] = (prev_count + count, prev_bytes + nbytes)
+
+    async def flush(self) -> None:
+        if not self._pending and not self._rollups:
+            return
+        pending, self._pending = self._pending, {}
+        rollups, self._rollups = self._rollups, {}
+        try:
+            async with AsyncSession(engine) as session:
+                await add_usage(session, pending)
+                await add_share_rollups(session, rollups)
+                await session.commit()
+        except Exception:
+            # keep the increments for the next flush rather than lose them
+            self._merge(pending, rollups)
+            raise
+        self.flushes += 1
+        self.rows_written += len(pending)
+
+    async def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Usage flush failed")
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything merged so far, then stop."""
+        if self._task is None:
+            return
+        task, self._task = self._task, None  # later shares upsert directly
+        self._stop.set()
+        await task
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Dropped usage increments for %d pairs at shutdown", len(self._pending))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self._task is not None,
+            "pending_pairs": len(self._pending),
+            "pending_bytes": sum(self._pending.values()),
+            "merged": self.merged,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+
+usage_aggregator = UsageAggregator(
+    enabled=settings.usage_write_behind,
+    flush_interval=settings.usage_flush_interval_ms / 1000,
+)
@@ -1,14 +1,26 @@
 from sqlmodel import select
+from sqlalchemy import bindparam, case, func, update, delete
 from app.models import (
     User,
     File,
+    Blob,
+    FileVariant,
+    ReplicationJob,
+    DirectUpload,
+    NsfwVerdict,
     FileShare,
-    Usage,
+    UserStats,
     ActivityLog,
     RevokedToken,
 )
 from sqlmodel.ext.asyncio.session import AsyncSession
-from datetime import datetime
+from datetime import datetime, timedelta
+from uuid import uuid4
+from app.core.revocation import revocation_index
+from app.core.audit import activity_writer
+from app.core.acl import acl_cache
+from app.core.usage import add_share_rollups, add_usage, truncate, usage_aggregator
+from app.db.dialect import dialect_insert
 
 
 # User helpers
@@ -42,6 +54,7 @@ async def create_file(
     content_type: str,
     size: int,
     cloud_url: str | None = None,
+    content_hash: str | None = None,
 ) -> File:
     f = File(
         owner_id=owner_id,
@@ -50,13 +63,388 @@ async def create_file(
         cloud_url=cloud_url,
         content_type=content_type,
         size=size,
+        content_hash=content_hash,
     )
+    if content_hash:
+        # take a reference on the shared blob in the same transaction
+        await acquire_blob(session, content_hash, size=size, stored_path=stored_path, cloud_url=cloud_url)
     session.add(f)
+    await bump_user_stats(session, {owner_id: {"file_count": 1, "bytes_stored": size}})
     await session.commit()
     await session.refresh(f)
     return f
 
 
+_USER_STATS_COUNTERS = ("file_count", "bytes_stored", "shares_received", "pending_shares")
+
+
+async def bump_user_stats(session: AsyncSession, deltas: dict[int, dict[str, int]]):
+    """
+    Add per-user counter deltas ({user_id: {"file_count": 1, ...}}) with one
+    additive upsert, so concurrent writers never lose increments. Negative
+    deltas are allowed; pending_shares never drops below zero. Does not commit.
+    """
+    if not deltas:
+        return
+    now = datetime.utcnow()
+    insert = dialect_insert(session)
+    stmt = insert(UserStats).values([
+        {"user_id": user_id, **{c: max(d.get(c, 0), 0) if c == "pending_shares" else d.get(c, 0) for c in _USER_STATS_COUNTERS}, "updated_at": now}
+        for user_id, d in sorted(deltas.items())
+    ])
+    set_ = {c: getattr(UserStats, c) + getattr(stmt.excluded, c) for c in _USER_STATS_COUNTERS}
+    set_["pending_shares"] = case((set_["pending_shares"] < 0, 0), else_=set_["pending_shares"])
+    set_["updated_at"] = now
+    stmt = stmt.on_conflict_do_update(index_elements=[UserStats.user_id], set_=set_)
+    await session.execute(stmt)
+
+
+async def get_user_stats(session: AsyncSession, user_id: int) -> UserStats:
+    return await session.get(UserStats, user_id) or UserStats(user_id=user_id)
+
+
+async def mark_shares_seen(session: AsyncSession, user_id: int):
+    await session.execute(
+        update(UserStats).where(UserStats.user_id == user_id).values(pending_shares=0, updated_at=datetime.utcnow())
+    )
+    await session.commit()
+
+
+async def create_files(
+    session: AsyncSession, owner_id: int, rows: list[dict], audit: list[tuple[str, str]] = ()
+) -> list[File]:
+    """
+    Insert many File rows, the blob references they take and audit rows in
+    a single transaction (one commit). Each row holds create_file's fields.
+    """
+    files = [File(owner_id=owner_id, **row) for row in rows]
+    refs: dict[str, list[File]] = {}
+    for f in files:
+        if f.content_hash:
+            refs.setdefault(f.content_hash, []).append(f)
+    # one upsert per distinct blob, in a stable order so concurrent batches don't deadlock
+    for sha256 in sorted(refs):
+        first = refs[sha256][0]
+        await acquire_blob(
+            session, sha256, size=first.size, stored_path=first.stored_path,
+            cloud_url=first.cloud_url, refs=len(refs[sha256]),
+        )
+    session.add_all(files)
+    if files:
+        await bump_user_stats(session, {owner_id: {"file_count": len(files), "bytes_stored": sum(f.size for f in files)}})
+    session.add_all([ActivityLog(user_id=owner_id, action=action, details=details) for action, details in audit])
+    await session.commit()
+    return files
+
+
+# Blob (content-addressed store) helpers
+async def get_blob(session: AsyncSession, sha256: str) -> Blob | None:
+    return await session.get(Blob, sha256)
+
+
+async def get_blobs(session: AsyncSession, hashes: list[str]) -> dict[str, Blob]:
+    if not hashes:
+        return {}
+    res = await session.execute(select(Blob).where(Blob.sha256.in_(list(hashes))))
+    return {b.sha256: b for b in res.scalars().all()}
+
+
+async def acquire_blob(
+    session: AsyncSession, sha256: str, *, size: int, stored_path: str, cloud_url: str | None = None, refs: int = 1
+):
+    """Insert the blob with ref_count=refs, or add refs to an existing one. Does not commit."""
+    insert = dialect_insert(session)
+    stmt = insert(Blob).values(
+        sha256=sha256, size=size, stored_path=stored_path, cloud_url=cloud_url,
+        ref_count=refs, created_at=datetime.utcnow(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Blob.sha256],
+        set_={
+            "ref_count": Blob.ref_count + refs,
+            "cloud_url": func.coalesce(Blob.cloud_url, stmt.excluded.cloud_url),
+        },
+    )
+    await session.execute(stmt)
+
+
+async def release_blobs(session: AsyncSession, hashes: list[str]) -> list[str]:
+    """
+    Drop one reference per entry in `hashes` (repeat a hash to drop several).
+    Blobs left without references are deleted, with their image variants
+    and replication jobs.
+    Does not commit.
+    Returns: stored paths of deleted blobs and variants, to be removed from disk after commit.
+    """
+    counts: dict[str, int] = {}
+    for h in hashes:
+        if h:
+            counts[h] = counts.get(h, 0) + 1
+    for h, n in counts.items():
+        await session.execute(update(Blob).where(Blob.sha256 == h).values(ref_count=Blob.ref_count - n))
+    if not counts:
+        return []
+    res = await session.execute(select(Blob).where(Blob.sha256.in_(list(counts)), Blob.ref_count <= 0))
+    orphans = res.scalars().all()
+    if not orphans:
+        return []
+    orphan_hashes = [b.sha256 for b in orphans]
+    res = await session.execute(select(FileVariant.stored_path).where(FileVariant.content_hash.in_(orphan_hashes)))
+    variant_paths = res.scalars().all()
+    await session.execute(delete(FileVariant).where(FileVariant.content_hash.in_(orphan_hashes)))
+    await session.execute(delete(ReplicationJob).where(ReplicationJob.content_hash.in_(orphan_hashes)))
+    await session.execute(delete(Blob).where(Blob.sha256.in_(orphan_hashes)))
+    return [b.stored_path for b in orphans] + list(variant_paths)
+
+
+async def referenced_blob_paths(session: AsyncSession, paths: list[str]) -> set[str]:
+    """The subset of `paths` that still belongs to a Blob row."""
+    res = await session.execute(select(Blob.stored_path).where(Blob.stored_path.in_(paths)))
+    return set(res.scalars().all())
+
+
+# Tiered local storage
+async def local_storage_usage(session: AsyncSession) -> int:
+    res = await session.execute(select(func.coalesce(func.sum(Blob.size), 0)).where(Blob.is_local.is_(True)))
+    return int(res.scalar_one())
+
+
+async def eviction_candidates(session: AsyncSession, policy: str, limit: int) -> list[Blob]:
+    """Local blobs that have a cloud copy, coldest first (LRU by last access, LFU by access count)."""
+    order = (Blob.access_count, Blob.last_accessed_at) if policy == "lfu" else (Blob.last_accessed_at,)
+    res = await session.execute(
+        select(Blob).where(Blob.is_local.is_(True), Blob.cloud_url.is_not(None)).order_by(*order).limit(limit)
+    )
+    return res.scalars().all()
+
+
+async def set_blobs_local(session: AsyncSession, hashes: list[str], is_local: bool):
+    values = {"is_local": is_local}
+    if is_local:
+        values["last_accessed_at"] = datetime.utcnow()
+    await session.execute(
+        update(Blob).where(Blob.sha256.in_(hashes)).values(**values).execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+
+async def record_blob_access(session: AsyncSession, accesses: dict[str, tuple[datetime, int]]):
+    """Apply buffered (last access, hit count) per blob in one executemany UPDATE."""
+    table = Blob.__table__
+    stmt = (
+        table.update()
+        .where(table.c.sha256 == bindparam("b_sha256"))
+        .values(last_accessed_at=bindparam("b_at"), access_count=table.c.access_count + bindparam("b_hits"))
+    )
+    await session.execute(
+        stmt, [{"b_sha256": h, "b_at": at, "b_hits": n} for h, (at, n) in accesses.items()]
+    )
+    await session.commit()
+
+
+async def set_blob_backend_key(session: AsyncSession, sha256: str, backend_key: str):
+    await session.execute(
+        update(Blob).where(Blob.sha256 == sha256, Blob.backend_key.is_(None)).values(backend_key=backend_key)
+    )
+    await session.commit()
+
+
+# Direct (presigned) uploads
+async def create_direct_upload(session: AsyncSession, **fields) -> DirectUpload:
+    upload = DirectUpload(**fields)
+    session.add(upload)
+    await session.commit()
+    await session.refresh(upload)
+    return upload
+
+
+async def claim_direct_upload(session: AsyncSession, upload_id: str) -> bool:
+    """Move a pending upload to 'completing'. False when another request claimed it first."""
+    res = await session.execute(
+        update(DirectUpload)
+        .where(DirectUpload.id == upload_id, DirectUpload.status == "pending")
+        .values(status="completing")
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return res.rowcount == 1
+
+
+async def reopen_direct_upload(session: AsyncSession, upload_id: str):
+    """Hand a claimed upload back to 'pending' after its completion failed."""
+    await session.execute(
+        update(DirectUpload)
+        .where(DirectUpload.id == upload_id, DirectUpload.status == "completing")
+        .values(status="pending")
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+
+async def expired_direct_uploads(session: AsyncSession, now: datetime, limit: int) -> list[DirectUpload]:
+    res = await session.execute(
+        select(DirectUpload).where(DirectUpload.status == "pending", DirectUpload.expires_at < now).limit(limit)
+    )
+    return res.scalars().all()
+
+
+async def delete_direct_uploads(session: AsyncSession, ids: list[str]):
+    await session.execute(delete(DirectUpload).where(DirectUpload.id.in_(ids)))
+    await session.commit()
+
+
+# Image variants
+async def get_file_variants(session: AsyncSession, content_hash: str) -> list[FileVariant]:
+    res = await session.execute(select(FileVariant).where(FileVariant.content_hash == content_hash))
+    return res.scalars().all()
+
+
+async def add_file_variant(session: AsyncSession, content_hash: str, media_type: str, stored_path: str, size: int):
+    insert = dialect_insert(session)
+    stmt = insert(FileVariant).values(
+        content_hash=content_hash, media_type=media_type, stored_path=stored_path,
+        size=size, created_at=datetime.utcnow(),
+    ).on_conflict_do_nothing(index_elements=[FileVariant.content_hash, FileVariant.media_type])
+    await session.execute(stmt)
+    await session.commit()
+
+
+# Cloud replication queue
+async def enqueue_replication(
+    session: AsyncSession, content_hash: str, *, local_path: str, folder: str | None, resource_type: str | None
+):
+    """Queue a blob for replication; re-arms a job that had given up. Commits."""
+    await enqueue_replications(
+        session, [{"content_hash": content_hash, "local_path": local_path, "folder": folder, "resource_type": resource_type}]
+    )
+
+
+async def enqueue_replications(session: AsyncSession, jobs: list[dict]):
+    """Multi-row enqueue_replication: one INSERT ... ON CONFLICT for all jobs. Commits."""
+    if not jobs:
+        return
+    now = datetime.utcnow()
+    insert = dialect_insert(session)
+    stmt = insert(ReplicationJob).values([
+        {**job, "status": "pending", "attempts": 0, "next_attempt_at": now, "created_at": now, "updated_at": now}
+        for job in jobs
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ReplicationJob.content_hash],
+        set_={"status": "pending", "attempts": 0, "next_attempt_at": now, "updated_at": now},
+        where=ReplicationJob.status == "failed",
+    )
+    await session.execute(stmt)
+    await session.commit()
+
+
+async def get_replication_job(session: AsyncSession, content_hash: str) -> ReplicationJob | None:
+    return await session.get(ReplicationJob, content_hash)
+
+
+async def claim_replication_jobs(session: AsyncSession, limit: int) -> list[ReplicationJob]:
+    """
+    Atomically mark up to `limit` due pending jobs as running for this caller.
+    Safe with several workers: each job is claimed by exactly one token.
+    """
+    now = datetime.utcnow()
+    res = await session.execute(
+        select(ReplicationJob.content_hash)
+        .where(ReplicationJob.status == "pending", ReplicationJob.next_attempt_at <= now)
+        .order_by(ReplicationJob.next_attempt_at)
+        .limit(limit)
+    )
+    due = res.scalars().all()
+    if not due:
+        return []
+    token = uuid4().hex
+    await session.execute(
+        update(ReplicationJob)
+        .where(ReplicationJob.content_hash.in_(due), ReplicationJob.status == "pending")
+        .values(status="running", claim_token=token, claimed_at=now, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    res = await session.execute(select(ReplicationJob).where(ReplicationJob.claim_token == token))
+    return res.scalars().all()
+
+
+async def complete_replication(session: AsyncSession, content_hash: str, cloud_url: str):
+    """Record the cloud copy on the job, the blob and every File row sharing it."""
+    now = datetime.utcnow()
+    await session.execute(
+        update(ReplicationJob).where(ReplicationJob.content_hash == content_hash)
+        .values(status="done", last_error=None, claim_token=None, updated_at=now)
+    )
+    await session.execute(
+        update(Blob).where(Blob.sha256 == content_hash, Blob.cloud_url.is_(None)).values(cloud_url=cloud_url)
+    )
+    await session.execute(
+        update(File).where(File.content_hash == content_hash, File.cloud_url.is_(None))
+        .values(cloud_url=cloud_url).execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+
+async def fail_replication(session: AsyncSession, content_hash: str, error: str, retry_at: datetime | None):
+    """Count a failed attempt; reschedule at `retry_at`, or give up when it is None."""
+    now = datetime.utcnow()
+    await session.execute(
+        update(ReplicationJob).where(ReplicationJob.content_hash == content_hash)
+        .values(
+            status="pending" if retry_at else "failed",
+            attempts=ReplicationJob.attempts + 1,
+            next_attempt_at=retry_at or now,
+            last_error=error,
+            claim_token=None,
+            updated_at=now,
+        )
+    )
+    await session.commit()
+
+
+async def release_stale_replication_jobs(session: AsyncSession, lease_seconds: int, exclude: list[str] = ()) -> int:
+    """
+    Return jobs whose worker died mid-upload (claimed longer than the lease ago)
+    to the queue. `exclude` names jobs the caller itself is still running.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=lease_seconds)
+    q = update(ReplicationJob).where(ReplicationJob.status == "running", ReplicationJob.claimed_at < cutoff)
+    if exclude:
+        q = q.where(ReplicationJob.content_hash.not_in(list(exclude)))
+    res = await session.execute(
+        q.values(status="pending", claim_token=None, next_attempt_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return res.rowcount or 0
+
+
+async def requeue_replication_jobs(session: AsyncSession, content_hashes: list[str]):
+    """Hand running jobs back to the queue without counting an attempt (clean shutdown)."""
+    await session.execute(
+        update(ReplicationJob)
+        .where(ReplicationJob.content_hash.in_(content_hashes), ReplicationJob.status == "running")
+        .values(status="pending", claim_token=None, next_attempt_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+
+# NSFW verdict cache
+async def get_nsfw_verdict(session: AsyncSession, cache_key: str) -> NsfwVerdict | None:
+    return await session.get(NsfwVerdict, cache_key)
+
+
+async def save_nsfw_verdict(session: AsyncSession, cache_key: str, is_nsfw: bool, score: float):
+    insert = dialect_insert(session)
+    stmt = insert(NsfwVerdict).values(
+        cache_key=cache_key, is_nsfw=is_nsfw, score=score, created_at=datetime.utcnow()
+    ).on_conflict_do_nothing(index_elements=[NsfwVerdict.cache_key])
+    await session.execute(stmt)
+    await session.commit()
+
+
 # Sharing / Usage
 async def share_file(
     session: AsyncSession,
@@ -66,46 +454,125 @@ async def share_file(
     bytes_transferred: int,
     message: str | None = None,
 ) -> FileShare:
-    s = FileShare(
-        file_id=file_id,
-        owner_id=owner_id,
-        recipient_id=recipient_id,
-        bytes_transferred=bytes_transferred,
-        message=message,
-    )
-    session.add(s)
+    shares = await share_file_bulk(session, file_id, owner_id, [recipient_id], bytes_transferred, message)
+    return shares[0]
 
-    # update usage summary
-    q = select(Usage).where(Usage.owner_id == owner_id, Usage.recipient_id == recipient_id)
-    res = await session.execute(q)
-    usage = res.scalar_one_or_none()
-    if not usage:
-        usage = Usage(owner_id=owner_id, recipient_id=recipient_id, total_bytes=bytes_transferred, updated_at=datetime.utcnow())
-        session.add(usage)
-    else:
-        usage.total_bytes += bytes_transferred
-        usage.updated_at = datetime.utcnow()
-        session.add(usage)
+
+async def share_file_bulk(
+    session: AsyncSession,
+    file_id: int,
+    owner_id: int,
+    recipient_ids: list[int],
+    bytes_transferred: int,
+    message: str | None = None,
+) -> list[FileShare]:
+    """
+    Share one file with many recipients in a single transaction: the
+    FileShare rows go in together and the Usage/rollup increments of all
+    recipients are applied with one upsert per table.
+    """
+    now = datetime.utcnow()
+    shares = [
+        FileShare(
+            file_id=file_id,
+            owner_id=owner_id,
+            recipient_id=recipient_id,
+            bytes_transferred=bytes_transferred,
+            message=message,
+            shared_at=now,
+        )
+        for recipient_id in recipient_ids
+    ]
+    session.add_all(shares)
+
+    # update usage summary and share rollups: merged by the write-behind
+    # aggregator once the shares are committed (a failed commit never
+    # reaches it), else atomic upserts in this transaction
+    usage: dict[tuple[int, int], int] = {}
+    rollups: dict = {}
+    hour = truncate(now, "hour")
+    for recipient_id in recipient_ids:
+        key = (owner_id, recipient_id)
+        usage[key] = usage.get(key, 0) + bytes_transferred
+        count, nbytes = rollups.get((hour, *key), (0, 0))
+        rollups[(hour, *key)] = (count + 1, nbytes + bytes_transferred)
+    deferred = usage_aggregator.running
+    if not deferred:
+        await add_usage(session, usage)
+        await add_share_rollups(session, rollups)
+
+    received: dict[int, dict[str, int]] = {}
+    for recipient_id in recipient_ids:
+        d = received.setdefault(recipient_id, {"shares_received": 0, "pending_shares": 0})
+        d["shares_received"] += 1
+        d["pending_shares"] += 1
+    await bump_user_stats(session, received)
 
     await session.commit()
-    await session.refresh(s)
-    return s
+    if deferred and not usage_aggregator.add(usage, rollups):
+        # the aggregator stopped while this commit was in flight
+        await add_usage(session, usage)
+        await add_share_rollups(session, rollups)
+        await session.commit()
+    acl_cache.invalidate_file(file_id)
+    return shares
 
 
 # Activity & token revocation
 async def log_activity(session: AsyncSession, user_id: int, action: str, details: str | None = None):
+    # buffered path: the background writer batches rows into one INSERT
+    if await activity_writer.enqueue(user_id, action, details):
+        return
     a = ActivityLog(user_id=user_id, action=action, details=details)
     session.add(a)
     await session.commit()
 
 
+async def log_activities(session: AsyncSession, user_id: int, action: str, details: list[str]):
+    """log_activity for many rows of one action; the direct path commits once."""
+    rows = []
+    for d in details:
+        if not await activity_writer.enqueue(user_id, action, d):
+            rows.append(ActivityLog(user_id=user_id, action=action, details=d))
+    if rows:
+        session.add_all(rows)
+        await session.commit()
+
+
 async def revoke_token(session: AsyncSession, jti: str, expires_at: datetime):
     rt = RevokedToken(jti=jti, expires_at=expires_at)
     session.add(rt)
     await session.commit()
+    revocation_index.add(jti)
 
 
 async def is_token_revoked(session: AsyncSession, jti: str) -> bool:
-    q = select(RevokedToken).where(RevokedToken.jti == jti)
+    # Bloom filter miss == definitely not revoked, no DB round-trip
+    if not revocation_index.might_be_revoked(jti):
+        return False
+    q = select(RevokedToken.jti).where(RevokedToken.jti == jti)
     res = await session.execute(q)
     return res.scalar_one_or_none() is not None
+
+
+async def load_revocations(session: AsyncSession, since: datetime | None = None) -> list[tuple[str, datetime]]:
+    """(jti, revoked_at) of unexpired revocations, optionally only those revoked at/after `since`."""
+    q = select(RevokedToken.jti, RevokedToken.revoked_at).where(RevokedToken.expires_at > datetime.utcnow())
+    if since is not None:
+        q = q.where(RevokedToken.revoked_at >= since)
+    res = await session.execute(q)
+    return [tuple(row) for row in res.all()]
+
+
+async def purge_expired_tokens(session: AsyncSession, batch_size: int = 1000) -> int:
+    """Delete revocations past expires_at in batches (short transactions). Returns rows deleted."""
+    total = 0
+    while True:
+        batch = select(RevokedToken.jti).where(RevokedToken.expires_at <= datetime.utcnow()).limit(batch_size)
+        res = await session.execute(
+            delete(RevokedToken).where(RevokedToken.jti.in_(batch)).execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        total += res.rowcount or 0
+        if (res.rowcount or 0) < batch_size:
+            return total
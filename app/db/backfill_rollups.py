@@ -0,0 +1,89 @@
+"""
+Rebuild the share rollup tables from FileShare history, and the per-user
+UserStats counters from File and FileShare:
+
+    python -m app.db.backfill_rollups [--batch-size N]
+
+Existing rows are replaced, each set of tables in a single transaction.
+FileShare is read in id order, `batch_size` rows at a time, so memory stays
+flat however long the history is. Run it while sharing is quiet: a share
+committed during the rebuild can be counted twice.
+"""
+import argparse
+import asyncio
+import logging
+
+from sqlalchemy import func
+from sqlmodel import select, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.usage import add_share_rollups, truncate
+from app.crud import bump_user_stats
+from app.db.session import get_session, init_db
+from app.models import File, FileShare, ShareRollupDaily, ShareRollupHourly, UserStats
+
+logger = logging.getLogger("shareledger.rollups")
+
+
+async def backfill_rollups(session: AsyncSession, batch_size: int = 5000) -> int:
+    """Replace the hourly/daily rollups with totals computed from FileShare. Returns shares counted."""
+    await session.execute(delete(ShareRollupHourly))
+    await session.execute(delete(ShareRollupDaily))
+    last_id, counted = 0, 0
+    while True:
+        q = (
+            select(FileShare.id, FileShare.owner_id, FileShare.recipient_id, FileShare.shared_at, FileShare.bytes_transferred)
+            .where(FileShare.id > last_id)
+            .order_by(FileShare.id)
+            .limit(batch_size)
+        )
+        rows = (await session.execute(q)).all()
+        if not rows:
+            break
+        increments: dict = {}
+        for row in rows:
+            key = (truncate(row.shared_at, "hour"), row.owner_id, row.recipient_id)
+            count, nbytes = increments.get(key, (0, 0))
+            increments[key] = (count + 1, nbytes + (row.bytes_transferred or 0))
+        await add_share_rollups(session, increments)
+        last_id = rows[-1].id
+        counted += len(rows)
+    await session.commit()
+    return counted
+
+
+async def backfill_user_stats(session: AsyncSession) -> int:
+    """Recompute file_count, bytes_stored and shares_received for every user (pending_shares restarts at 0). Returns users."""
+    await session.execute(delete(UserStats))
+    deltas: dict[int, dict[str, int]] = {}
+    files = await session.execute(
+        select(File.owner_id, func.count(), func.coalesce(func.sum(File.size), 0))
+        .where(File.is_deleted.is_(False))
+        .group_by(File.owner_id)
+    )
+    for owner_id, count, nbytes in files.all():
+        deltas.setdefault(owner_id, {}).update(file_count=count, bytes_stored=nbytes)
+    shares = await session.execute(select(FileShare.recipient_id, func.count()).group_by(FileShare.recipient_id))
+    for recipient_id, count in shares.all():
+        deltas.setdefault(recipient_id, {})["shares_received"] = count
+    items = sorted(deltas.items())
+    for i in range(0, len(items), 500):
+        await bump_user_stats(session, dict(items[i:i + 500]))
+    await session.commit()
+    return len(deltas)
+
+
+async def main(batch_size: int) -> None:
+    await init_db()
+    async for session in get_session():
+        counted = await backfill_rollups(session, batch_size)
+        users = await backfill_user_stats(session)
+    logger.info("Rebuilt share rollups from %d shares and counters for %d users", counted, users)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the share rollups and per-user counters.")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.batch_size))
@@ -1,2 +1,2 @@
 # For future Alembic use
-from app.models import User, File, FileShare, Usage, RevokedToken, ActivityLog
+from app.models import User, File, Blob, FileVariant, ReplicationJob, NsfwVerdict, DirectUpload, FileShare, UserStats, Usage, ShareRollupHourly, ShareRollupDaily, RevokedToken, ActivityLog
@@ -0,0 +1,10 @@
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+def dialect_insert(session: AsyncSession):
+    """Dialect-specific INSERT construct (supports ON CONFLICT upserts)."""
+    if session.bind.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert
@@ -15,8 +15,13 @@ sync_engine = create_sync_engine(
 )
 
 async def init_db():
+    # imported here: app.db.upgrade imports this module for init_db
+    from app.db.upgrade import upgrade_schema
+
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        # create_all never alters existing tables; add what newer models expect
+        await conn.run_sync(upgrade_schema)
 
 
 async def get_session():
@@ -0,0 +1,83 @@
+"""
+Bring a database created by an older release up to the current models:
+
+    python -m app.db.upgrade
+
+create_all only creates missing tables, never the columns and indexes added
+to tables that already exist. This adds them. Every step checks first, so
+init_db runs it on each start and a fresh database is left untouched.
+"""
+import asyncio
+from datetime import datetime
+import logging
+
+from sqlalchemy import inspect, text, true
+from sqlmodel import SQLModel
+
+from app.db.session import init_db
+from app.models import Blob, File, RevokedToken
+
+logger = logging.getLogger("shareledger.schema")
+
+# columns added to existing tables, with what existing rows get: None (NULL),
+# a literal (DDL DEFAULT) or a callable returning the UPDATE that fills it in
+ADDED_COLUMNS = [
+    (File.__table__.c.content_hash, None),
+    (RevokedToken.__table__.c.revoked_at, lambda: (
+        text("UPDATE revokedtoken SET revoked_at = :now").bindparams(now=datetime.utcnow())
+    )),
+    (Blob.__table__.c.is_local, true()),
+    (Blob.__table__.c.last_accessed_at, lambda: text("UPDATE blob SET last_accessed_at = created_at")),
+    (Blob.__table__.c.access_count, text("0")),
+    (Blob.__table__.c.backend_key, None),
+]
+
+
+def _add_column(conn, col, default) -> None:
+    dialect = conn.dialect
+    quote = dialect.identifier_preparer.quote
+    table = quote(col.table.name)
+    ddl = f"ALTER TABLE {table} ADD COLUMN {quote(col.name)} {col.type.compile(dialect=dialect)}"
+    for fk in col.foreign_keys:
+        ddl += f" REFERENCES {quote(fk.column.table.name)} ({quote(fk.column.name)})"
+    if default is not None and not callable(default):
+        ddl += f" NOT NULL DEFAULT {default.compile(dialect=dialect, compile_kwargs={'literal_binds': True})}"
+    conn.execute(text(ddl))
+    if callable(default):
+        conn.execute(default())
+        # SQLite can't add NOT NULL to an existing column; the models never write NULL anyway
+        if not col.nullable and dialect.name != "sqlite":
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {quote(col.name)} SET NOT NULL"))
+
+
+def upgrade_schema(conn) -> list[str]:
+    """Add missing columns and indexes to existing tables (sync connection). Returns what was added."""
+    added = []
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    for col, default in ADDED_COLUMNS:
+        if col.table.name not in tables:
+            continue
+        if col.name not in {c["name"] for c in inspector.get_columns(col.table.name)}:
+            _add_column(conn, col, default)
+            added.append(f"{col.table.name}.{col.name}")
+    inspector = inspect(conn)  # fresh: the cached reflection predates the new columns
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+                added.append(index.name)
+    for name in added:
+        logger.info("Schema upgrade: added %s", name)
+    return added
+
+
+async def main() -> None:
+    # init_db creates missing tables, then runs upgrade_schema
+    await init_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -1,6 +1,7 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from app.core.security import decode_token
+from app.core.principal_cache import principal_cache
 from app.db.session import get_session
 from app.crud import get_user_by_email, is_token_revoked
 from sqlmodel.ext.asyncio.session import AsyncSession
@@ -24,6 +25,12 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     except Exception:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
+    # warm path: principal already resolved for this token on this worker
+    if jti:
+        cached = principal_cache.get(jti)
+        if cached is not None:
+            return cached
+
     # check revoked tokens
     revoked = await is_token_revoked(db, jti)
     if revoked:
@@ -33,6 +40,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
+    if jti:
+        principal_cache.put(jti, user, token_exp=payload.get("exp"))
     return user
 
 
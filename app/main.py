@@ -1,9 +1,24 @@
 import os
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.db.session import init_db
 from app.core.config import settings
-from app.api.v1 import auth, users, files, admin
+from app.api.v1 import auth, users, files, admin, analytics, upload_sessions, direct_uploads, storage
+from app.utils.upload_sessions import start_session_sweeper, stop_session_sweeper
+from app.core.revocation import start_revocation_maintenance, stop_revocation_maintenance
+from app.core.security import PasswordHasherBusy, shutdown_hash_pool
+from app.core.audit import activity_writer
+from app.core.usage import usage_aggregator
+from app.core.email import email_outbox
+from app.utils.paginator import InvalidCursor
+from app.utils.nsfw_check import nsfw_service
+from app.utils.derivatives import derivative_cache
+from app.utils.variants import variant_builder
+from app.utils.replication import replication_worker
+from app.utils.tiering import tiered_store
+from app.utils.direct_uploads import start_direct_upload_sweeper, stop_direct_upload_sweeper
+from app.utils.storage import UploadBodyLimit
 
 app = FastAPI(title=settings.app_name)
 
@@ -15,16 +30,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# room for multipart boundaries and part headers on top of the file bytes
+_MULTIPART_SLACK = 64 * 1024
+app.add_middleware(
+    UploadBodyLimit,
+    limits={
+        "/api/v1/files/upload": settings.max_upload_size_bytes + _MULTIPART_SLACK,
+        "/api/v1/files/upload/batch": settings.batch_upload_max_files * (settings.max_upload_size_bytes + _MULTIPART_SLACK),
+    },
+)
+
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
 app.include_router(users.router, prefix="/api/v1/users", tags=["users"])
 app.include_router(files.router, prefix="/api/v1/files", tags=["files"])
+app.include_router(upload_sessions.router, prefix="/api/v1/files/sessions", tags=["files"])
+app.include_router(direct_uploads.router, prefix="/api/v1/files/direct-uploads", tags=["files"])
+app.include_router(storage.router, prefix="/api/v1/storage", tags=["storage"])
 app.include_router(admin.router, prefix="/api/v1/admin", tags=["admin"])
+app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["analytics"])
 
 @app.on_event("startup")
 async def startup_event():
     os.makedirs(settings.upload_dir, exist_ok=True)
     os.makedirs(settings.email_log_dir, exist_ok=True)
     await init_db()
+    start_session_sweeper()
+    start_direct_upload_sweeper()
+    await start_revocation_maintenance()
+    activity_writer.start()
+    usage_aggregator.start()
+    email_outbox.start()
+    await nsfw_service.start()
+    await derivative_cache.start()
+    await replication_worker.start()
+    tiered_store.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stop_session_sweeper()
+    await stop_direct_upload_sweeper()
+    await stop_revocation_maintenance()
+    await activity_writer.stop()
+    await usage_aggregator.stop()
+    await email_outbox.stop()
+    await nsfw_service.stop()
+    await derivative_cache.stop()
+    await variant_builder.stop()
+    await replication_worker.stop()
+    await tiered_store.stop()
+    shutdown_hash_pool()
+
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    # shed load fast instead of queueing logins behind a saturated pool
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursor):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
 
 @app.get("/health")
 async def health():
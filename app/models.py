@@ -1,9 +1,13 @@
 from typing import Optional
+from sqlalchemy import Index, UniqueConstraint
 from sqlmodel import SQLModel, Field
 from datetime import datetime
 
 
 class User(SQLModel, table=True):
+    # keyset pagination order (newest first)
+    __table_args__ = (Index("ix_user_created_at_id", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     email: str = Field(index=True, unique=True)
     username: str
@@ -14,6 +18,9 @@ class User(SQLModel, table=True):
 
 
 class File(SQLModel, table=True):
+    # /files/mine: a user's files, newest first
+    __table_args__ = (Index("ix_file_owner_id_created_at_id", "owner_id", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     owner_id: int = Field(foreign_key="user.id")
     filename: str
@@ -21,11 +28,90 @@ class File(SQLModel, table=True):
     cloud_url: Optional[str] = None
     content_type: Optional[str] = None
     size: int = 0
+    # sha256 of the content; points at the shared Blob holding the bytes
+    content_hash: Optional[str] = Field(default=None, foreign_key="blob.sha256", index=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_deleted: bool = Field(default=False)
 
 
+class Blob(SQLModel, table=True):
+    # content-addressed storage: one row per distinct sha256, shared by many File rows
+    sha256: str = Field(primary_key=True)
+    size: int = 0
+    stored_path: str
+    cloud_url: Optional[str] = None
+    ref_count: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    # tiered storage: a replicated blob's local file is a cache entry that may be evicted
+    is_local: bool = Field(default=True, index=True)
+    last_accessed_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    access_count: int = 0
+    # address of the bytes in the configured object-store backend (S3 key,
+    # Cloudinary URL), when they were uploaded there directly
+    backend_key: Optional[str] = None
+
+
+class FileVariant(SQLModel, table=True):
+    # compact re-encodings (WebP/AVIF) of an image blob, shared by every File with that content
+    __table_args__ = (UniqueConstraint("content_hash", "media_type", name="uq_filevariant_hash_type"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    content_hash: str = Field(foreign_key="blob.sha256", index=True)
+    media_type: str
+    stored_path: str
+    size: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ReplicationJob(SQLModel, table=True):
+    # durable queue of blobs still to be pushed to cloud storage (one job per blob)
+    __table_args__ = (Index("ix_replicationjob_status_next_attempt_at", "status", "next_attempt_at"),)
+
+    content_hash: str = Field(primary_key=True, foreign_key="blob.sha256")
+    local_path: str
+    folder: Optional[str] = None
+    resource_type: Optional[str] = None
+    status: str = Field(default="pending")  # 'pending', 'running', 'done' or 'failed'
+    attempts: int = 0
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+    claim_token: Optional[str] = None
+    claimed_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class NsfwVerdict(SQLModel, table=True):
+    # durable NSFW verdict cache: "<sha256>:<detector>:<version>:<threshold>"
+    cache_key: str = Field(primary_key=True)
+    is_nsfw: bool
+    score: float = 0.0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class DirectUpload(SQLModel, table=True):
+    # a presigned upload handed to a client; completed into a File by the owner
+    id: str = Field(primary_key=True)
+    owner_id: int = Field(foreign_key="user.id", index=True)
+    object_key: str
+    filename: str
+    content_type: Optional[str] = None
+    max_bytes: int
+    status: str = Field(default="pending")  # 'pending', 'completing', 'completed' or 'rejected'
+    file_id: Optional[int] = Field(default=None, foreign_key="file.id")
+    deduplicated: bool = False
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
+
+
 class FileShare(SQLModel, table=True):
+    # access checks and ACL loads look shares up by file, then recipient
+    __table_args__ = (
+        Index("ix_fileshare_file_id_recipient_id", "file_id", "recipient_id"),
+        # /files/shared-with-me: a recipient's shares, newest first
+        Index("ix_fileshare_recipient_id_shared_at_id", "recipient_id", "shared_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     file_id: int = Field(foreign_key="file.id")
     owner_id: int = Field(foreign_key="user.id")
@@ -35,6 +121,18 @@ class FileShare(SQLModel, table=True):
     message: Optional[str] = None
 
 
+class UserStats(SQLModel, table=True):
+    # denormalized per-user counters, kept current by create_file(s) and
+    # share_file so list headers never COUNT(*)
+    user_id: int = Field(primary_key=True, foreign_key="user.id")
+    file_count: int = Field(default=0)
+    bytes_stored: int = Field(default=0)
+    shares_received: int = Field(default=0)
+    # shares received since the user last marked their shared-with-me list as seen
+    pending_shares: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class Usage(SQLModel, table=True):
     # composite primary key: owner_id + recipient_id
     owner_id: int = Field(primary_key=True, index=True)
@@ -45,12 +143,40 @@ class Usage(SQLModel, table=True):
     updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
 
 
+class ShareRollupHourly(SQLModel, table=True):
+    # shares per (hour, owner, recipient); kept current by share_file,
+    # rebuilt from FileShare by `python -m app.db.backfill_rollups`
+    __table_args__ = (Index("ix_sharerolluphourly_owner_id_bucket", "owner_id", "bucket"),)
+
+    bucket: datetime = Field(primary_key=True)
+    owner_id: int = Field(primary_key=True)
+    recipient_id: int = Field(primary_key=True)
+    share_count: int = Field(default=0)
+    total_bytes: int = Field(default=0)
+
+
+class ShareRollupDaily(SQLModel, table=True):
+    # same as ShareRollupHourly with day buckets, for longer ranges
+    __table_args__ = (Index("ix_sharerollupdaily_owner_id_bucket", "owner_id", "bucket"),)
+
+    bucket: datetime = Field(primary_key=True)
+    owner_id: int = Field(primary_key=True)
+    recipient_id: int = Field(primary_key=True)
+    share_count: int = Field(default=0)
+    total_bytes: int = Field(default=0)
+
+
 class RevokedToken(SQLModel, table=True):
     jti: str = Field(primary_key=True)
-    expires_at: datetime
+    # indexed for the expiry purge and the cross-worker revocation refresh
+    expires_at: datetime = Field(index=True)
+    revoked_at: datetime = Field(default_factory=datetime.utcnow, index=True)
 
 
 class ActivityLog(SQLModel, table=True):
+    # keyset pagination order (newest first)
+    __table_args__ = (Index("ix_activitylog_created_at_id", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     action: str
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -30,6 +30,11 @@ class UserRead(BaseModel):
         orm_mode = True
 
 
+class UserPage(BaseModel):
+    items: List[UserRead]
+    next_cursor: Optional[str] = None
+
+
 class FileUploadResp(BaseModel):
     id: int
     filename: str
@@ -43,16 +48,87 @@ class FileUploadResp(BaseModel):
         orm_mode = True
 
 
+class FileRead(BaseModel):
+    id: int
+    filename: str
+    content_type: Optional[str] = None
+    size: int
+    content_hash: Optional[str] = None
+    cloud_url: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class FilePage(BaseModel):
+    items: List[FileRead]
+    next_cursor: Optional[str] = None
+    file_count: int
+    bytes_stored: int
+
+
+class SharedFileRead(FileRead):
+    share_id: int
+    shared_at: datetime
+    message: Optional[str] = None
+    owner_id: int
+    owner_email: EmailStr
+    owner_username: str
+
+
+class SharedFilePage(BaseModel):
+    items: List[SharedFileRead]
+    next_cursor: Optional[str] = None
+    shares_received: int
+    pending_shares: int
+
+
 class ShareReq(BaseModel):
     file_id: int
     recipient_email: EmailStr
     message: Optional[str] = None
 
 
+class BulkShareReq(BaseModel):
+    file_id: int
+    recipient_emails: List[EmailStr]
+    message: Optional[str] = None
+
+
 class UsageResp(BaseModel):
     owner_id: int
     recipient_id: int
     total_bytes: int
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    content_type: Optional[str] = None
+    total_size: Optional[int] = None
+
+
+class DirectUploadCreate(BaseModel):
+    filename: str
+    content_type: Optional[str] = None
+    size: Optional[int] = None
+
+
+class DirectUploadResp(BaseModel):
+    upload_id: str
+    method: str
+    url: str
+    headers: dict = {}
+    fields: dict = {}
+    expires_at: datetime
+
+
+class UploadSessionResp(BaseModel):
+    upload_id: str
+    filename: str
+    content_type: Optional[str]
+    total_size: Optional[int]
+    offset: int
+    file_id: Optional[int] = None
@@ -0,0 +1,148 @@
+from datetime import datetime
+from pathlib import PurePosixPath
+import os
+import zipfile
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+# content types worth deflating; everything else (images, video, archives,
+# office documents) is already compressed and is stored as-is
+_COMPRESSIBLE_PREFIXES = ("text/",)
+_COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/xml",
+    "application/javascript",
+    "application/x-ndjson",
+    "application/sql",
+    "application/x-yaml",
+    "application/x-sh",
+    "image/svg+xml",
+    "image/bmp",
+    "image/tiff",
+}
+
+
+def is_compressible(content_type: str | None) -> bool:
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    return content_type.startswith(_COMPRESSIBLE_PREFIXES) or content_type in _COMPRESSIBLE_TYPES
+
+
+class _Sink:
+    """Write-only, non-seekable file object; ZipFile appends, the generator drains."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def unique_arcnames(names: list[str]) -> list[str]:
+    """Flatten to base names and disambiguate duplicates as 'name (2).ext'."""
+    seen: set[str] = set()
+    result = []
+    for name in names:
+        name = PurePosixPath(name.replace("\\", "/")).name or "file"
+        stem, ext = os.path.splitext(name)
+        candidate, n = name, 1
+        while candidate.lower() in seen:
+            n += 1
+            candidate = f"{stem} ({n}){ext}"
+        seen.add(candidate.lower())
+        result.append(candidate)
+    return result
+
+
+async def _local_chunks(path: str, chunk_size: int):
+    f = await run_in_threadpool(open, path, "rb")
+    try:
+        while True:
+            chunk = await run_in_threadpool(f.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+
+async def _remote_chunks(url: str, chunk_size: int):
+    async with httpx.AsyncClient(timeout=60, follow_redirects=True) as client:
+        async with client.stream("GET", url) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.aiter_bytes(chunk_size):
+                yield chunk
+
+
+# written into an archive whose files vanished after the availability check
+MISSING_MANIFEST = "MISSING.txt"
+
+
+def _available(entry: dict) -> bool:
+    return bool(entry.get("path") and os.path.exists(entry["path"])) or bool(entry.get("url"))
+
+
+def unavailable_entries(entries: list[dict]) -> list[dict]:
+    """Entries with neither a local copy nor a cloud URL; check before streaming starts."""
+    return [e for e in entries if not _available(e)]
+
+
+async def zip_stream(entries: list[dict]):
+    """
+    Build a ZIP archive on the fly and yield it in pieces.
+    Each entry: {"name", "path", "url", "size", "content_type", "modified"};
+    the local `path` is read when it exists, else the cloud `url`. Entries
+    are written with data descriptors (the output is never seeked), so
+    memory stays at about one chunk however large the archive gets.
+    Callers reject unavailable_entries() up front; one that disappears
+    mid-stream is listed in MISSING.txt instead of silently left out.
+    """
+    chunk_size = settings.upload_chunk_size_bytes
+    sink = _Sink()
+    zf = zipfile.ZipFile(sink, mode="w", allowZip64=True)
+    missing: list[str] = []
+    arcnames = unique_arcnames([e["name"] for e in entries] + [MISSING_MANIFEST])
+    for entry, arcname in zip(entries, arcnames):
+        modified = entry.get("modified") or datetime.utcnow()
+        info = zipfile.ZipInfo(arcname, date_time=modified.timetuple()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if is_compressible(entry.get("content_type")) else zipfile.ZIP_STORED
+        if entry.get("path") and os.path.exists(entry["path"]):
+            chunks = _local_chunks(entry["path"], chunk_size)
+        elif entry.get("url"):
+            chunks = _remote_chunks(entry["url"], chunk_size)
+        else:
+            missing.append(arcname)
+            continue
+        # sizes are only known after the data, so ask for zip64 headers up front for big entries
+        with zf.open(info, mode="w", force_zip64=(entry.get("size") or 0) >= zipfile.ZIP64_LIMIT) as out:
+            async for chunk in chunks:
+                if info.compress_type == zipfile.ZIP_DEFLATED:
+                    await run_in_threadpool(out.write, chunk)
+                else:
+                    out.write(chunk)
+                data = sink.drain()
+                if data:
+                    yield data
+        data = sink.drain()
+        if data:
+            yield data
+    if missing:
+        zf.writestr(arcnames[-1], "Not available when this archive was built:\n" + "".join(f"{n}\n" for n in missing))
+    # central directory
+    zf.close()
+    yield sink.drain()
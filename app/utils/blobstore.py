@@ -0,0 +1,107 @@
+from pathlib import Path
+from uuid import uuid4
+import os
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+# Content-addressed layout: uploads/blobs/ab/cd/abcd...  (sha256 hex)
+BLOB_DIR = Path(settings.upload_dir) / "blobs"
+# Uploads land here first; they are renamed into BLOB_DIR once their hash is
+# known. Same filesystem as BLOB_DIR so the move is an atomic rename.
+STAGING_DIR = Path(settings.upload_dir) / "staging"
+
+
+def blob_path(sha256: str) -> Path:
+    """Sharded location of a blob: two levels of 2-hex-char prefixes."""
+    return BLOB_DIR / sha256[:2] / sha256[2:4] / sha256
+
+
+def staging_path(suffix: str = "") -> Path:
+    """Fresh, unique path to stream an upload into before it is hashed."""
+    STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    return STAGING_DIR / f"{uuid4().hex}{suffix}"
+
+
+def discard_staged(path: str | Path) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+async def commit_blob(staged: str | Path, sha256: str) -> str:
+    """
+    Move a fully written staging file into its content-addressed location.
+    If the blob already exists on disk the staged copy is left in place for
+    the caller to discard (ensure_blob may still need it).
+    Returns: blob path
+    """
+    dest = blob_path(sha256)
+
+    def _commit():
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if not dest.exists():
+            os.replace(staged, dest)
+
+    await run_in_threadpool(_commit)
+    return str(dest)
+
+
+async def ensure_blob(staged: str | Path, sha256: str) -> None:
+    """
+    Put `staged` in place as the blob file if that has gone missing. Call it
+    once a reference to the blob is committed: remove_orphaned_blobs may have
+    dropped the file this upload deduplicated against just before.
+    """
+    dest = blob_path(sha256)
+
+    def _ensure():
+        if not dest.exists() and os.path.exists(staged):
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staged, dest)
+
+    await run_in_threadpool(_ensure)
+
+
+async def remove_blob(path: str | Path) -> None:
+    """Delete a blob file once nothing references it any more."""
+    await run_in_threadpool(discard_staged, path)
+
+
+async def remove_orphaned_blobs(paths: list[str], still_referenced) -> None:
+    """
+    Delete the files of blobs whose rows were just dropped. A dedup upload
+    may re-reference the content in the meantime, so each file is first
+    renamed aside, then `still_referenced(paths)` (async, returns the subset
+    whose Blob row exists again) is asked, and those files are put back.
+    An upload whose reference commits after that check finds its file
+    missing and restores it with ensure_blob.
+    """
+    def _set_aside():
+        moved = {}
+        for path in paths:
+            aside = f"{path}.deleting-{uuid4().hex}"
+            try:
+                os.replace(path, aside)
+            except FileNotFoundError:
+                continue
+            moved[path] = aside
+        return moved
+
+    moved = await run_in_threadpool(_set_aside)
+    if not moved:
+        return
+    keep = await still_referenced(list(moved))
+
+    def _finish():
+        for path, aside in moved.items():
+            if path in keep:
+                try:
+                    os.link(aside, path)
+                except FileExistsError:
+                    pass  # an upload already restored it
+            discard_staged(aside)
+
+    await run_in_threadpool(_finish)
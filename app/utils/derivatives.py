@@ -0,0 +1,202 @@
+from collections import OrderedDict
+from pathlib import Path
+from uuid import uuid4
+import asyncio
+import logging
+import os
+
+from PIL import Image, ImageOps, features
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+logger = logging.getLogger("shareledger.derivatives")
+
+# Rendered thumbnails: uploads/derivatives/ab/<source key>-<w>x<h>.<ext>
+DERIVATIVE_DIR = Path(settings.upload_dir) / "derivatives"
+
+# fmt query value -> (Pillow format, media type, extension, save options)
+FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", "jpg", {"quality": 85, "optimize": True}),
+    "png": ("PNG", "image/png", "png", {"optimize": True}),
+    "webp": ("WEBP", "image/webp", "webp", {"quality": 80, "method": 4}),
+}
+
+
+def format_supported(fmt: str) -> bool:
+    if fmt not in FORMATS:
+        return False
+    return fmt != "webp" or features.check("webp")
+
+
+def derivative_source(file_obj) -> tuple[str, str]:
+    """
+    (cache key, local path) of a File's original. Keyed by content hash so
+    deduplicated files share their thumbnails; legacy rows fall back to the id.
+    """
+    key = file_obj.content_hash or f"file-{file_obj.id}"
+    return key, str(file_obj.stored_path)
+
+
+def parse_sizes(spec: str) -> list[tuple[int, int]]:
+    """"128x128,512x512" -> [(128, 128), (512, 512)]; malformed entries are skipped."""
+    sizes = []
+    for part in (spec or "").split(","):
+        w, _, h = part.strip().lower().partition("x")
+        if w.isdigit() and h.isdigit() and int(w) > 0 and int(h) > 0:
+            sizes.append((int(w), int(h)))
+    return sizes
+
+
+def render_thumbnail(src: str, dest: Path, width: int, height: int, fmt: str) -> int:
+    """
+    Downscale `src` to fit within width x height (aspect preserved, never
+    upscaled) and write it to `dest` atomically. Returns the written size.
+    """
+    pil_format, _, _, options = FORMATS[fmt]
+    with Image.open(src) as im:
+        # JPEG: decode straight at a reduced power-of-two scale; the square box
+        # keeps enough pixels whichever way EXIF rotates the image afterwards
+        side = max(width, height)
+        im.draft("RGB", (side, side))
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((width, height), Image.Resampling.LANCZOS)
+        if fmt == "jpeg" and im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        elif im.mode not in ("RGB", "RGBA", "L", "LA"):
+            im = im.convert("RGBA")
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{uuid4().hex}.tmp")
+        try:
+            im.save(tmp, format=pil_format, **options)
+            os.replace(tmp, dest)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+    return dest.stat().st_size
+
+
+class DerivativeCache:
+    """
+    On-disk cache of rendered thumbnails with a total size budget.
+    Entries are tracked in LRU order in memory (seeded from file mtimes at
+    start); rendering runs in the threadpool, at most once per key even
+    under concurrent requests, and the least recently used files are
+    deleted whenever the budget is exceeded.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._pending: set[asyncio.Task] = set()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path_for(self, key: str, width: int, height: int, fmt: str) -> Path:
+        name = f"{key}-{width}x{height}.{FORMATS[fmt][2]}"
+        return self.root / key[:2] / name
+
+    def _scan(self) -> list[tuple[float, str, int]]:
+        found = []
+        if self.root.exists():
+            for p in self.root.glob("*/*"):
+                if p.name.startswith("."):
+                    # leftover from an interrupted render
+                    p.unlink(missing_ok=True)
+                    continue
+                st = p.stat()
+                found.append((st.st_mtime, str(p), st.st_size))
+        return sorted(found)
+
+    async def start(self) -> None:
+        """Index what earlier runs left on disk, oldest first."""
+        self._entries.clear()
+        self.total_bytes = 0
+        for _, path, size in await run_in_threadpool(self._scan):
+            self._entries[path] = size
+            self.total_bytes += size
+        await self._evict()
+
+    def _lookup(self, dest: Path) -> bool:
+        name = str(dest)
+        if name in self._entries and dest.exists():
+            self._entries.move_to_end(name)
+            self.hits += 1
+            return True
+        return False
+
+    async def get_or_render(self, key: str, src: str, width: int, height: int, fmt: str) -> Path:
+        """Path of the cached derivative, rendering it first on a miss."""
+        dest = self.path_for(key, width, height, fmt)
+        if self._lookup(dest):
+            return dest
+
+        # concurrent misses on the same key wait for the one render in progress
+        name = str(dest)
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        try:
+            async with lock:
+                if self._lookup(dest):
+                    return dest
+                self.misses += 1
+                size = await run_in_threadpool(render_thumbnail, src, dest, width, height, fmt)
+                self.total_bytes += size - self._entries.pop(name, 0)
+                self._entries[name] = size
+        finally:
+            if not lock.locked():
+                self._locks.pop(name, None)
+        await self._evict()
+        return dest
+
+    async def _evict(self) -> None:
+        victims = []
+        # the newest entry stays even if it alone exceeds the budget
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            victims.append(path)
+        if victims:
+            await run_in_threadpool(lambda: [Path(p).unlink(missing_ok=True) for p in victims])
+
+    async def pregenerate(self, key: str, src: str, sizes: list[tuple[int, int]], fmt: str) -> None:
+        for width, height in sizes:
+            try:
+                await self.get_or_render(key, src, width, height, fmt)
+            except Exception:
+                logger.exception("Thumbnail pregeneration failed for %s", key)
+                return
+
+    def schedule_pregenerate(self, key: str, src: str) -> None:
+        """Render the configured thumbnail sizes in the background (no-op if none are set)."""
+        sizes = parse_sizes(settings.thumbnail_pregenerate_sizes)
+        fmt = settings.thumbnail_default_format
+        if not sizes or not format_supported(fmt):
+            return
+        task = asyncio.create_task(self.pregenerate(key, src, sizes, fmt))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def stop(self) -> None:
+        for task in list(self._pending):
+            task.cancel()
+        await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+derivative_cache = DerivativeCache(DERIVATIVE_DIR, settings.thumbnail_cache_max_bytes)
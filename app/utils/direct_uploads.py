@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+import asyncio
+import logging
+
+from app.core.config import settings
+from app.crud import delete_direct_uploads, expired_direct_uploads
+from app.db.session import get_session
+from app.utils.storage_backends import storage_backend
+
+logger = logging.getLogger("shareledger.uploads")
+
+_sweeper_task: asyncio.Task | None = None
+
+
+async def sweep_expired_direct_uploads(batch_size: int = 500) -> int:
+    """Drop presigned uploads never completed within direct_upload_ttl_seconds, and their objects."""
+    removed = 0
+    async for session in get_session():
+        while True:
+            expired = await expired_direct_uploads(session, datetime.utcnow(), batch_size)
+            if not expired:
+                break
+            for upload in expired:
+                try:
+                    await storage_backend.delete(upload.object_key)
+                except Exception:
+                    logger.warning("Could not delete abandoned upload object %s", upload.object_key)
+            await delete_direct_uploads(session, [u.id for u in expired])
+            removed += len(expired)
+    return removed
+
+
+async def sweep_orphaned_incoming() -> int:
+    """
+    Delete incoming objects older than direct_upload_ttl_seconds. Their upload
+    has expired or already been completed or rejected either way; this catches
+    objects whose promote() failed or that a replayed signed URL wrote.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.direct_upload_ttl_seconds)
+    return await storage_backend.sweep_incoming(cutoff)
+
+
+async def _sweep_loop():
+    while True:
+        await asyncio.sleep(settings.direct_upload_sweep_interval_seconds)
+        try:
+            removed = await sweep_expired_direct_uploads()
+            if removed:
+                logger.info("Swept %d abandoned direct uploads", removed)
+            orphaned = await sweep_orphaned_incoming()
+            if orphaned:
+                logger.info("Removed %d orphaned incoming objects", orphaned)
+        except Exception:
+            logger.exception("Direct upload sweep failed")
+
+
+def start_direct_upload_sweeper():
+    global _sweeper_task
+    if _sweeper_task is None:
+        _sweeper_task = asyncio.create_task(_sweep_loop())
+
+
+async def stop_direct_upload_sweeper():
+    global _sweeper_task
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+        try:
+            await _sweeper_task
+        except asyncio.CancelledError:
+            pass
+        _sweeper_task = None
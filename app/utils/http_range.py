@@ -0,0 +1,226 @@
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from mimetypes import guess_type
+from urllib.parse import quote
+from uuid import uuid4
+import os
+
+import anyio
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+# more ranges than this in one header is abuse, not a real client; serve the whole file
+MAX_RANGES = 16
+
+
+def http_date(dt: datetime) -> str:
+    """Format a naive-UTC (or aware) datetime as an RFC 7231 HTTP-date."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return formatdate(dt.timestamp(), usegmt=True)
+
+
+def _parse_http_date(value: str) -> datetime | None:
+    try:
+        dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _etag_matches(header: str, etag: str, weak: bool = True) -> bool:
+    """RFC 7232 entity-tag comparison against a comma separated header value."""
+    if header.strip() == "*":
+        return True
+    if not weak and etag.startswith("W/"):
+        return False
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def _content_disposition(filename: str) -> str:
+    # same encoding FileResponse uses for its attachment header
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime | None) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        return _etag_matches(inm, etag)
+    ims = request.headers.get("if-modified-since")
+    if ims and last_modified is not None:
+        since = _parse_http_date(ims)
+        if since is not None:
+            lm = last_modified if last_modified.tzinfo else last_modified.replace(tzinfo=timezone.utc)
+            return int(lm.timestamp()) <= int(since.timestamp())
+    return False
+
+
+def _range_applies(request: Request, etag: str, last_modified: datetime | None) -> bool:
+    """If-Range: only honour Range when the client's validator is still current."""
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return _etag_matches(if_range, etag, weak=False)
+    since = _parse_http_date(if_range)
+    if since is None or last_modified is None:
+        return False
+    lm = last_modified if last_modified.tzinfo else last_modified.replace(tzinfo=timezone.utc)
+    return int(lm.timestamp()) == int(since.timestamp())
+
+
+def parse_range_header(value: str, size: int) -> list[tuple[int, int]] | None:
+    """
+    Parse a `bytes=` Range header into inclusive (start, end) pairs, sorted
+    with overlapping and adjacent ranges merged (RFC 7233 section 4.1).
+    Returns None when the header is malformed or lists more than MAX_RANGES
+    ranges (the header is then ignored), and an empty list when no range is
+    satisfiable.
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    specs = spec.split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for part in specs:
+        part = part.strip()
+        if not part:
+            continue
+        start_s, sep, end_s = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if start_s == "":
+                # suffix range: last N bytes
+                length = int(end_s)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(start_s)
+                end = int(end_s) if end_s else size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        if start < 0 or end < start:
+            return None
+        ranges.append((start, min(end, size - 1)))
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+async def _iter_range(path: str, start: int, end: int):
+    async with await anyio.open_file(path, mode="rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def _iter_multipart(path: str, parts: list[tuple[bytes, int, int]], closing: bytes):
+    for head, start, end in parts:
+        yield head
+        async for chunk in _iter_range(path, start, end):
+            yield chunk
+    yield closing
+
+
+def conditional_file_response(
+    request: Request,
+    path: str,
+    *,
+    filename: str,
+    etag: str,
+    last_modified: datetime | None = None,
+    media_type: str | None = None,
+    extra_headers: dict | None = None,
+) -> Response:
+    """
+    Serve a local file with ETag / Last-Modified validators, conditional GET
+    (If-None-Match, If-Modified-Since -> 304) and byte ranges (Range, If-Range
+    -> 206 single or multipart/byteranges, 416 when unsatisfiable).
+    Validators come from the caller, so a 304 never touches the file.
+    """
+    headers = {"etag": etag, "accept-ranges": "bytes"}
+    if last_modified is not None:
+        headers["last-modified"] = http_date(last_modified)
+    if extra_headers:
+        headers.update(extra_headers)
+
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    media_type = media_type or guess_type(filename)[0] or "application/octet-stream"
+    range_header = request.headers.get("range")
+    if not range_header or request.method not in ("GET", "HEAD") or not _range_applies(request, etag, last_modified):
+        return FileResponse(path, filename=filename, media_type=media_type, headers=headers, method=request.method)
+
+    size = os.stat(path).st_size
+    ranges = parse_range_header(range_header, size)
+    if ranges is None:
+        return FileResponse(path, filename=filename, media_type=media_type, headers=headers, method=request.method)
+    if not ranges:
+        headers["content-range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    headers["content-disposition"] = _content_disposition(filename)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+        headers["content-length"] = str(end - start + 1)
+        body = _iter_range(path, start, end) if request.method == "GET" else iter(())
+        return StreamingResponse(body, status_code=206, media_type=media_type, headers=headers)
+
+    boundary = uuid4().hex
+    parts = []
+    length = 0
+    for start, end in ranges:
+        head = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode()
+        # the CRLF closing each part is carried by the next delimiter
+        if parts:
+            head = b"\r\n" + head
+        parts.append((head, start, end))
+        length += len(head) + (end - start + 1)
+    closing = f"\r\n--{boundary}--\r\n".encode()
+    length += len(closing)
+    headers["content-length"] = str(length)
+    body = _iter_multipart(path, parts, closing) if request.method == "GET" else iter(())
+    return StreamingResponse(
+        body,
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
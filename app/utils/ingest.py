@@ -0,0 +1,260 @@
+from pathlib import Path
+import asyncio
+import logging
+import os
+
+from fastapi import UploadFile
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.crud import create_file, create_files, get_blob, get_blobs, log_activity, set_blobs_local
+from app.models import File, User
+from app.utils.blobstore import commit_blob, discard_staged, ensure_blob, staging_path
+from app.utils.derivatives import derivative_cache, derivative_source
+from app.utils.nsfw_cache import classify_cached
+from app.utils.variants import variant_builder
+from app.utils.replication import replication_worker
+from app.utils.storage import UploadTooLarge, stream_upload_file
+
+logger = logging.getLogger("shareledger.uploads")
+
+
+class UploadRejected(Exception):
+    """Raised when a staged upload must not be stored (e.g. NSFW content)."""
+
+
+def is_image_content_type(content_type: str | None) -> bool:
+    return bool(content_type and content_type.startswith("image/"))
+
+
+def is_video_content_type(content_type: str | None) -> bool:
+    return bool(content_type and content_type.startswith("video/"))
+
+
+def replication_target(owner: User, content_type: str | None) -> tuple[str, str]:
+    """Cloudinary (folder, resource_type) for a blob uploaded by `owner`."""
+    folder = f"{settings.cloudinary_upload_folder.rstrip('/')}/{owner.id}"
+    # use resource_type='raw' for non-image/video files so Cloudinary accepts them
+    resource_type = "image" if is_image_content_type(content_type) or is_video_content_type(content_type) else "raw"
+    return folder, resource_type
+
+
+def upload_result(f: File, deduplicated: bool) -> dict:
+    return {
+        "id": f.id,
+        "filename": f.filename,
+        "size": f.size,
+        "stored_path": f.stored_path,
+        "cloud_url": getattr(f, "cloud_url", None),
+        "content_hash": f.content_hash,
+        "deduplicated": deduplicated,
+    }
+
+
+async def ingest_staged_file(
+    db: AsyncSession,
+    owner: User,
+    staged: str | Path,
+    *,
+    filename: str,
+    content_type: str,
+    size: int,
+    content_hash: str,
+) -> tuple[File, bool]:
+    """
+    Turn a fully written, hashed staging file into a stored File:
+    1. If image/video -> run NSFW check on the staged file (raises UploadRejected).
+    2. Look the sha256 up in the blob store. A duplicate reuses the stored
+       blob (and its Cloudinary copy); new content is moved into the store.
+    3. Create DB File record pointing at the blob, with the cloud_url if the
+       blob already has a cloud copy.
+    4. Otherwise queue the blob for background replication to Cloudinary
+       (if configured); the worker fills in cloud_url later.
+    5. Images: queue background rendering of the configured thumbnail sizes
+       and, for new content, of the compact WebP/AVIF variants.
+    The caller still owns `staged` and should discard it afterwards (no-op if moved).
+    Returns: (File, deduplicated)
+    """
+    # NSFW check for images and videos (verdict cache, then the batched inference service)
+    if is_image_content_type(content_type) or is_video_content_type(content_type):
+        blocked = False
+        try:
+            verdict = await classify_cached(str(staged), content_hash, content_type)
+            blocked = bool(verdict.get("is_nsfw"))
+        except Exception as exc:
+            # If detector fails, log error and proceed permissively
+            await log_activity(db, owner.id, "nsfw_check_error", f"Detector error during upload: {exc}")
+
+        if blocked:
+            await log_activity(db, owner.id, "upload_blocked", f"NSFW blocked: {filename}")
+            raise UploadRejected("Uploading NSFW content is not allowed")
+
+    # Content-addressed store: identical bytes are stored (and pushed to the cloud) once
+    stored_cloud_url = None
+    blob = await get_blob(db, content_hash)
+    deduplicated = blob is not None
+    if deduplicated:
+        local_path = blob.stored_path
+        stored_cloud_url = blob.cloud_url
+        if not blob.is_local:
+            # evicted to the cloud tier: the upload brings the bytes back for free
+            await commit_blob(staged, content_hash)
+            await set_blobs_local(db, [content_hash], True)
+    else:
+        local_path = await commit_blob(staged, content_hash)
+
+    # create DB record with BOTH local stored path and optional cloud URL
+    f = await create_file(
+        db,
+        owner_id=owner.id,
+        filename=filename,
+        stored_path=local_path,
+        cloud_url=stored_cloud_url,
+        content_type=content_type if content_type else None,
+        size=size,
+        content_hash=content_hash,
+    )
+    # our reference is committed; a concurrent delete of the blob's last
+    # reference may have removed the file we deduplicated against
+    await ensure_blob(staged, content_hash)
+
+    if is_image_content_type(content_type):
+        derivative_cache.schedule_pregenerate(*derivative_source(f))
+        if not deduplicated:
+            variant_builder.schedule(content_hash, local_path, content_type, size)
+
+    # Cloud copy: queued for the background replication worker, never awaited here
+    replication = "done" if stored_cloud_url else "local_only"
+    if stored_cloud_url is None and replication_worker.enabled():
+        folder, resource_type = replication_target(owner, content_type)
+        await replication_worker.enqueue(db, content_hash, local_path, folder=folder, resource_type=resource_type)
+        replication = "queued"
+
+    await log_activity(db, owner.id, "upload", f"Uploaded file {f.filename} (cloud={replication}, dedup={'yes' if deduplicated else 'no'})")
+    return f, deduplicated
+
+
+def _new_part(upload: UploadFile) -> dict:
+    filename = upload.filename or "upload"
+    content_type = (upload.content_type or "").lower()
+    return {"filename": filename, "content_type": content_type, "staged": staging_path(os.path.splitext(filename)[1])}
+
+
+async def _stage_part(upload: UploadFile, part: dict, slots: asyncio.Semaphore, audit: list[tuple[str, str]]) -> None:
+    """Stream, hash and NSFW-check one part of a batch into `part`. Touches no database session."""
+    filename, content_type = part["filename"], part["content_type"]
+    async with slots:
+        try:
+            part["size"], part["content_hash"] = await stream_upload_file(upload, part["staged"])
+        except UploadTooLarge:
+            part["error"] = "File too large"
+            return
+        if is_image_content_type(content_type) or is_video_content_type(content_type):
+            try:
+                verdict = await classify_cached(str(part["staged"]), part["content_hash"], content_type)
+            except Exception as exc:
+                audit.append(("nsfw_check_error", f"Detector error during upload: {exc}"))
+            else:
+                if verdict.get("is_nsfw"):
+                    audit.append(("upload_blocked", f"NSFW blocked: {filename}"))
+                    part["error"] = "Uploading NSFW content is not allowed"
+
+
+async def ingest_batch(db: AsyncSession, owner: User, uploads: list[UploadFile]) -> list[dict]:
+    """
+    Multi-file counterpart of ingest_staged_file, in three phases:
+    1. Stage, hash and NSFW-check the parts concurrently (at most
+       batch_upload_concurrency at a time); nothing touches `db` here.
+    2. Look every hash up in one query and move each new blob into the
+       store once, however many parts carry it.
+    3. Insert all File rows, blob references and audit rows in a single
+       transaction, then queue thumbnails, variants and replication.
+    A part that is too large, blocked or fails to stage (e.g. disk error)
+    fails on its own; the rest are stored. Every staged copy is discarded
+    on the way out, whichever phase fails.
+    Returns one result per upload, in order: upload_result(...) or {"filename", "error"}.
+    """
+    slots = asyncio.Semaphore(max(1, settings.batch_upload_concurrency))
+    audit: list[tuple[str, str]] = []
+    parts = [_new_part(upload) for upload in uploads]
+    try:
+        outcomes = await asyncio.gather(
+            *(_stage_part(upload, part, slots, audit) for upload, part in zip(uploads, parts)),
+            return_exceptions=True,
+        )
+        for part, outcome in zip(parts, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error("Staging %s failed", part["filename"], exc_info=outcome)
+                part["error"] = "Upload failed"
+        ok = [p for p in parts if "error" not in p]
+        blobs = await get_blobs(db, list({p["content_hash"] for p in ok}))
+
+        # hash -> staged copy to move into the store (new content, or an evicted blob coming back)
+        to_commit: dict[str, Path] = {}
+        restored: list[str] = []
+        for p in ok:
+            content_hash = p["content_hash"]
+            blob = blobs.get(content_hash)
+            p["deduplicated"] = blob is not None or content_hash in to_commit
+            p["cloud_url"] = blob.cloud_url if blob is not None else None
+            if content_hash in to_commit:
+                continue
+            if blob is None:
+                to_commit[content_hash] = p["staged"]
+            elif not blob.is_local:
+                to_commit[content_hash] = p["staged"]
+                restored.append(content_hash)
+        paths = await asyncio.gather(*(commit_blob(staged, h) for h, staged in to_commit.items()))
+        stored = {h: blob.stored_path for h, blob in blobs.items()}
+        stored.update(zip(to_commit, paths))
+        if restored:
+            await set_blobs_local(db, restored, True)
+
+        replicate = replication_worker.enabled()
+        rows = []
+        for p in ok:
+            p["stored_path"] = stored[p["content_hash"]]
+            replication = "done" if p["cloud_url"] else "queued" if replicate else "local_only"
+            audit.append((
+                "upload",
+                f"Uploaded file {p['filename']} (cloud={replication}, dedup={'yes' if p['deduplicated'] else 'no'})",
+            ))
+            rows.append({
+                "filename": p["filename"],
+                "stored_path": p["stored_path"],
+                "cloud_url": p["cloud_url"],
+                "content_type": p["content_type"] or None,
+                "size": p["size"],
+                "content_hash": p["content_hash"],
+            })
+        files = await create_files(db, owner.id, rows, audit)
+        # as in ingest_staged_file: put back a blob file a racing delete removed
+        for p in ok:
+            await ensure_blob(p["staged"], p["content_hash"])
+
+        jobs: dict[str, dict] = {}
+        for p, f in zip(ok, files):
+            p["file"] = f
+            if is_image_content_type(p["content_type"]):
+                derivative_cache.schedule_pregenerate(*derivative_source(f))
+                if p["content_hash"] in to_commit and p["content_hash"] not in restored:
+                    variant_builder.schedule(p["content_hash"], p["stored_path"], p["content_type"], p["size"])
+            if replicate and not p["cloud_url"] and p["content_hash"] not in jobs:
+                folder, resource_type = replication_target(owner, p["content_type"])
+                jobs[p["content_hash"]] = {
+                    "content_hash": p["content_hash"],
+                    "local_path": p["stored_path"],
+                    "folder": folder,
+                    "resource_type": resource_type,
+                }
+        if jobs:
+            await replication_worker.enqueue_many(db, list(jobs.values()))
+    finally:
+        for p in parts:
+            # no-op for copies already moved into the blob store
+            discard_staged(p["staged"])
+
+    return [
+        upload_result(p["file"], p["deduplicated"]) if "file" in p else {"filename": p["filename"], "error": p["error"]}
+        for p in parts
+    ]
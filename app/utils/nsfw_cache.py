@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from typing import Any, Dict
+
+from app.core.config import settings
+from app.crud import get_nsfw_verdict, save_nsfw_verdict
+from app.db.session import get_session
+from app.utils.nsfw_check import detector_available, nsfw_service, verdict_fingerprint
+
+
+class VerdictCache:
+    """
+    NSFW verdicts keyed by content sha256 + detector name/version + threshold.
+    An in-memory LRU sits in front of the NsfwVerdict table; both are keyed by
+    the full fingerprint, so changing the detector or threshold simply stops
+    matching old entries.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(content_hash: str) -> str:
+        return f"{content_hash}:{verdict_fingerprint()}"
+
+    def _remember(self, key: str, verdict: Dict[str, Any]) -> None:
+        self._entries[key] = verdict
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get(self, content_hash: str) -> Dict[str, Any] | None:
+        key = self.key(content_hash)
+        verdict = self._entries.get(key)
+        if verdict is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return verdict
+        async for session in get_session():
+            row = await get_nsfw_verdict(session, key)
+        if row is None:
+            self.misses += 1
+            return None
+        self.db_hits += 1
+        verdict = {"detector": verdict_fingerprint(), "is_nsfw": row.is_nsfw, "score": row.score, "cached": True}
+        self._remember(key, verdict)
+        return verdict
+
+    async def put(self, content_hash: str, verdict: Dict[str, Any]) -> None:
+        key = self.key(content_hash)
+        self._remember(key, {**verdict, "cached": True})
+        async for session in get_session():
+            await save_nsfw_verdict(session, key, bool(verdict["is_nsfw"]), float(verdict.get("score", 0.0)))
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+        }
+
+
+verdict_cache = VerdictCache(maxsize=settings.nsfw_verdict_cache_size)
+
+
+async def classify_cached(path: str, content_hash: str | None, content_type: str | None = None) -> Dict[str, Any]:
+    """nsfw_service.classify, skipping decode + inference when this content was judged before."""
+    if content_hash and detector_available():
+        cached = await verdict_cache.get(content_hash)
+        if cached is not None:
+            return cached
+    verdict = await nsfw_service.classify(path, content_type)
+    # a clean verdict cut short by nsfw_media_budget_seconds only covers part of
+    # the media; don't let it stand in for a full check of the same content later
+    partial = verdict.get("truncated") and not verdict.get("is_nsfw")
+    if content_hash and verdict.get("detector") and not partial:
+        await verdict_cache.put(content_hash, verdict)
+    return verdict
@@ -1,23 +1,51 @@
 from pathlib import Path
-from typing import Tuple, Dict, Any
+from typing import Dict, Any, List
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import importlib.metadata
+import importlib.util
 import logging
+import multiprocessing
+import time
 from PIL import Image
 from app.core.config import settings
 
 logger = logging.getLogger("shareledger.nsfw")
 logger.setLevel(logging.INFO)
 
+_DETECTOR_NAME = "nsfw_image_detector"
+_DETECTOR_AVAILABLE = importlib.util.find_spec(_DETECTOR_NAME) is not None
+if not _DETECTOR_AVAILABLE:
+    logger.info("nsfw_image_detector not available")
+
 try:
-    from nsfw_image_detector import NSFWDetector  # type: ignore
-    _DETECTOR = NSFWDetector()
-    _DETECTOR_NAME = "nsfw_image_detector"
-except Exception as e:
-    _DETECTOR = None
-    _DETECTOR_NAME = None
-    logger.info("nsfw_image_detector not available: %s", e)
+    DETECTOR_VERSION = importlib.metadata.version(_DETECTOR_NAME)
+except importlib.metadata.PackageNotFoundError:
+    DETECTOR_VERSION = "unknown"
 
 NSFW_THRESHOLD = 0.7
 
+# Loaded lazily, once per process (inference workers load it in their initializer).
+_DETECTOR = None
+
+
+def detector_available() -> bool:
+    return _DETECTOR_AVAILABLE
+
+
+def verdict_fingerprint() -> str:
+    """Identifies what produced a verdict; cached verdicts from another detector/threshold don't apply."""
+    return f"{_DETECTOR_NAME}:{DETECTOR_VERSION}:{NSFW_THRESHOLD}"
+
+
+def _get_detector():
+    global _DETECTOR
+    if _DETECTOR is None:
+        from nsfw_image_detector import NSFWDetector  # type: ignore
+        _DETECTOR = NSFWDetector()
+    return _DETECTOR
+
+
 def _is_image_file(path: Path) -> bool:
     try:
         suffix = path.suffix.lower()
@@ -25,35 +53,355 @@ def _is_image_file(path: Path) -> bool:
     except Exception:
         return False
 
+
+VIDEO_SUFFIXES = (".mp4", ".m4v", ".mov", ".webm", ".mkv", ".avi", ".mpeg", ".mpg", ".3gp")
+# classifier input is 448x448; decoding or scaling beyond that is wasted work
+FRAME_SIZE = (448, 448)
+
+
+def _is_video_file(path: Path, content_type: str | None = None) -> bool:
+    return bool(content_type and content_type.startswith("video/")) or path.suffix.lower() in VIDEO_SUFFIXES
+
+
+def _safe_verdict() -> Dict[str, Any]:
+    return {"detector": None, "is_nsfw": False, "probs": {}}
+
+
+def _verdict(probs: Dict[Any, float]) -> Dict[str, Any]:
+    # predict_proba returns cumulative scores per level ("medium" = medium + high)
+    probs = {str(getattr(k, "value", k)): float(v) for k, v in (probs or {}).items()}
+    score = probs.get("medium", 0.0)
+    return {"detector": _DETECTOR_NAME, "is_nsfw": score >= NSFW_THRESHOLD, "score": score, "probs": probs}
+
+
+def _load_still(path: str) -> Image.Image:
+    im = Image.open(path)
+    # JPEG: let the decoder downscale by a power of two while decoding
+    im.draft("RGB", FRAME_SIZE)
+    return im.convert("RGB")
+
+
+def _classify_batch(paths: List[str]) -> List[Dict[str, Any]]:
+    """
+    Runs in an inference worker: decode every image, then one forward pass
+    for the whole batch. A path that fails to decode gets {"error": ...};
+    an animated image gets {"animated": True} and is re-sent for frame sampling.
+    """
+    detector = _get_detector()
+    images, slots, results = [], [], [None] * len(paths)
+    for i, p in enumerate(paths):
+        try:
+            with Image.open(p) as probe:
+                if getattr(probe, "is_animated", False):
+                    results[i] = {"animated": True}
+                    continue
+            images.append(_load_still(p))
+            slots.append(i)
+        except Exception as exc:
+            results[i] = {"error": f"{exc}"}
+    if images:
+        for i, probs in zip(slots, detector.predict_proba(images)):
+            results[i] = _verdict(probs)
+    return results
+
+
+def _evenly_spaced(total: int, n: int) -> List[int]:
+    if total <= 0:
+        return []
+    if total <= n:
+        return list(range(total))
+    return sorted({int((k + 0.5) * total / n) for k in range(n)})
+
+
+def _animated_frames(path: str, n: int):
+    with Image.open(path) as im:
+        for index in _evenly_spaced(getattr(im, "n_frames", 1), n):
+            im.seek(index)
+            frame = im.convert("RGB")
+            frame.thumbnail(FRAME_SIZE)
+            yield frame
+
+
+def _video_frames_av(path: str, n: int, max_keyframes: int):
+    import av  # type: ignore
+
+    def _scaled(frame):
+        # scale inside the decoder pipeline (swscale) rather than on a full-size image
+        w, h = frame.width, frame.height
+        ratio = min(1.0, FRAME_SIZE[0] / max(w, h))
+        return frame.reformat(width=max(1, int(w * ratio)), height=max(1, int(h * ratio)), format="rgb24").to_image()
+
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        duration = float(stream.duration * stream.time_base) if stream.duration else (
+            container.duration / 1_000_000 if container.duration else 0.0
+        )
+        # evenly spaced coverage of the whole clip
+        if duration > 0:
+            for index in range(n):
+                target = (index + 0.5) * duration / n
+                container.seek(int(target / stream.time_base), stream=stream, backward=True, any_frame=False)
+                for frame in container.decode(stream):
+                    yield _scaled(frame)
+                    break
+        # keyframes: encoders place them at scene changes, and skipping
+        # non-key frames means they decode without the frames in between
+        container.seek(0, stream=stream)
+        stream.codec_context.skip_frame = "NONKEY"
+        for count, frame in enumerate(container.decode(stream)):
+            if count >= max_keyframes:
+                break
+            yield _scaled(frame)
+
+
+def _video_frames_cv2(path: str, n: int):
+    import cv2  # type: ignore
+
+    cap = cv2.VideoCapture(path)
+    try:
+        for index in _evenly_spaced(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), n):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ok, frame = cap.read()
+            if not ok:
+                continue
+            image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            image.thumbnail(FRAME_SIZE)
+            yield image
+    finally:
+        cap.release()
+
+
+def _media_frames(path: str, kind: str, n: int, max_keyframes: int):
+    if kind == "animated":
+        return _animated_frames(path, n)
+    if importlib.util.find_spec("av") is not None:
+        return _video_frames_av(path, n, max_keyframes)
+    if importlib.util.find_spec("cv2") is not None:
+        return _video_frames_cv2(path, n)
+    raise RuntimeError("No video decoder available (install av or opencv-python)")
+
+
+def _classify_frames(path: str, kind: str, n: int, max_keyframes: int, batch_size: int, budget: float) -> Dict[str, Any]:
+    """
+    Runs in an inference worker: sample frames from an animated image or a
+    video and classify them in small batches, stopping at the first frame
+    over the threshold or when the time budget runs out.
+    """
+    detector = _get_detector()
+    started = time.monotonic()
+    worst: Dict[str, Any] | None = None
+    frames_checked = 0
+    truncated = False
+    batch: List[Image.Image] = []
+
+    def _run(batch):
+        nonlocal worst, frames_checked
+        for probs in detector.predict_proba(batch):
+            frames_checked += 1
+            v = _verdict(probs)
+            if worst is None or v["score"] > worst["score"]:
+                worst = v
+
+    for frame in _media_frames(path, kind, n, max_keyframes):
+        batch.append(frame)
+        if len(batch) >= batch_size:
+            _run(batch)
+            batch = []
+            if worst["is_nsfw"]:
+                break
+        if time.monotonic() - started > budget:
+            truncated = True
+            break
+    if batch and not (worst and worst["is_nsfw"]):
+        _run(batch)
+
+    result = worst or _safe_verdict()
+    return {**result, "frames_checked": frames_checked, "truncated": truncated}
+
+
+def _init_worker():
+    # warm the model once per worker process
+    _get_detector()
+
+
+def _noop():
+    return None
+
+
 def predict_image(filepath: str) -> Dict[str, Any]:
+    """Synchronous, in-process classification of a single image (one forward pass)."""
     p = Path(filepath)
     if not p.exists():
         raise FileNotFoundError(filepath)
 
     # If file doesn't look like an image, return safe
     if not _is_image_file(p):
-        return {"detector": None, "is_nsfw": False, "probs": {}}
+        return _safe_verdict()
 
-    if _DETECTOR is not None:
+    if _DETECTOR_AVAILABLE:
         try:
-            image = Image.open(str(p)).convert("RGB")
-            is_nsfw = _DETECTOR.is_nsfw(image)
-            probs = _DETECTOR.predict_proba(image)
-            # compute a simple nsfw score from probs if needed
-            score = 0.0
-            for k, v in (probs or {}).items():
-                if k.lower() in ("porn", "sexy", "nsfw", "explicit"):
-                    score += float(v)
-            if score == 0.0 and isinstance(is_nsfw, bool):
-                score = 1.0 if is_nsfw else 0.0
-            return {"detector": _DETECTOR_NAME, "is_nsfw": score >= NSFW_THRESHOLD, "probs": probs}
+            result = _classify_batch([str(p)])[0]
         except Exception as exc:
             logger.exception("Primary detector failed: %s", exc)
             # conservative or permissive fallback handled by caller
             raise
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result
 
     # no detector available -> behave according to settings
     if settings.nsfw_detector != "enabled":
-        return {"detector": None, "is_nsfw": False, "probs": {}}
+        return _safe_verdict()
 
     raise RuntimeError("NSFW detector enabled in config but no detector installed")
+
+
+class NSFWService:
+    """
+    Micro-batching inference front end.
+    classify() calls arriving together are grouped into batches of up to
+    `max_batch` images (or whatever arrived within `max_wait` seconds of the
+    first) and each batch runs as a single forward pass on a process pool
+    whose workers keep the model loaded. The event loop never decodes or
+    runs the model itself.
+    """
+
+    def __init__(self, workers: int, max_batch: int, max_wait: float):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pool: ProcessPoolExecutor | None = None
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._in_flight: set[asyncio.Task] = set()
+        self.batches = 0
+        self.images = 0
+
+    def _ensure_started(self) -> None:
+        if self._task is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.workers)
+            self._task = asyncio.create_task(self._run())
+
+    async def start(self) -> None:
+        """Spin up the pool and load the model in every worker ahead of the first upload."""
+        if not _DETECTOR_AVAILABLE:
+            return
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _noop) for _ in range(self.workers)))
+
+    async def classify(self, path: str, content_type: str | None = None) -> Dict[str, Any]:
+        """
+        Verdict for one file: {"detector", "is_nsfw", "score", "probs"}.
+        Still images are micro-batched; animated images and videos are
+        frame-sampled (see _classify_frames).
+        """
+        p = Path(path)
+        if not p.exists():
+            raise FileNotFoundError(path)
+        is_video = _is_video_file(p, content_type)
+        if not is_video and not _is_image_file(p):
+            return _safe_verdict()
+        if not _DETECTOR_AVAILABLE:
+            if settings.nsfw_detector != "enabled":
+                return _safe_verdict()
+            raise RuntimeError("NSFW detector enabled in config but no detector installed")
+
+        self._ensure_started()
+        if is_video:
+            return await self._classify_media(str(p), "video")
+
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((str(p), fut))
+        result = await fut
+        if result.get("animated"):
+            return await self._classify_media(str(p), "animated")
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result
+
+    async def _classify_media(self, path: str, kind: str) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        # shares the per-worker slots with still-image batches
+        async with self._slots:
+            return await loop.run_in_executor(
+                self._pool,
+                _classify_frames,
+                path,
+                kind,
+                settings.nsfw_sample_frames,
+                settings.nsfw_max_keyframes,
+                settings.nsfw_frame_batch_size,
+                settings.nsfw_media_budget_seconds,
+            )
+
+    async def _run_batch(self, batch) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._pool, _classify_batch, [p for p, _ in batch])
+            self.batches += 1
+            self.images += len(batch)
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+        except Exception as exc:
+            logger.exception("NSFW batch of %d failed", len(batch))
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+        finally:
+            self._slots.release()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # at most one batch in flight per worker; the rest keep queueing
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run_batch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "available": _DETECTOR_AVAILABLE,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "batches": self.batches,
+            "images": self.images,
+            "avg_batch": (self.images / self.batches) if self.batches else 0.0,
+        }
+
+
+nsfw_service = NSFWService(
+    workers=settings.nsfw_workers,
+    max_batch=settings.nsfw_batch_size,
+    max_wait=settings.nsfw_batch_max_wait_ms / 1000,
+)
@@ -1,7 +1,17 @@
+from datetime import datetime
+import base64
+
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
 def paginate(queryset: list, page: int = 1, page_size: int = 10):
     """
-    Simple Python pagination utility.
-    For DB-level pagination, use LIMIT/OFFSET in SQL queries.
+    Simple Python pagination utility for lists that are already in memory.
+    For DB-level pagination use paginate_query (keyset, constant cost per page).
     """
     start = (page - 1) * page_size
     end = start + page_size
@@ -14,3 +24,45 @@ def paginate(queryset: list, page: int = 1, page_size: int = 10):
         "total_pages": (total + page_size - 1) // page_size,
         "items": queryset[start:end],
     }
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque cursor for the (created_at, id) position of a row."""
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+async def paginate_query(session, query, *, created_col, id_col, limit: int, cursor: str | None = None, key=None):
+    """
+    Keyset pagination, newest first, over (created_col, id_col).
+    Seeks past the cursor with a row-value comparison that a composite
+    (created_at, id) index serves directly, so page N costs the same as page 1
+    and only `limit + 1` rows are ever loaded.
+    `key(row)` returns the row's (created_at, id); defaults to the mapped attributes.
+    Returns: {"items": [...], "next_cursor": str | None}
+    """
+    if cursor:
+        c_created, c_id = decode_cursor(cursor)
+        query = query.where(tuple_(created_col, id_col) < tuple_(c_created, c_id))
+    query = query.order_by(created_col.desc(), id_col.desc()).limit(limit + 1)
+    rows = (await session.exec(query)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if key is not None:
+            created_at, row_id = key(last)
+        else:
+            created_at, row_id = getattr(last, created_col.key), getattr(last, id_col.key)
+        next_cursor = encode_cursor(created_at, row_id)
+    return {"items": rows, "next_cursor": next_cursor}
@@ -0,0 +1,215 @@
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+import random
+
+from app.core.config import settings
+from app.crud import (
+    claim_replication_jobs,
+    complete_replication,
+    enqueue_replication,
+    enqueue_replications,
+    fail_replication,
+    release_stale_replication_jobs,
+    requeue_replication_jobs,
+)
+from app.db.session import get_session
+from app.utils.storage import cloudinary_configured, upload_file_to_cloudinary
+
+logger = logging.getLogger("shareledger.replication")
+
+
+class CloudinaryUploader:
+    """
+    Default replication target. Any object with `host`, `configured()` and
+    `async upload(path, *, folder, resource_type) -> {"url": ..., "bytes": ...}`
+    can replace it (tests use a local fake).
+    """
+
+    host = "api.cloudinary.com"
+
+    def configured(self) -> bool:
+        return cloudinary_configured()
+
+    async def upload(self, path: str, *, folder: str | None, resource_type: str | None) -> dict:
+        size = os.path.getsize(path)
+        chunk_size = settings.replication_chunk_size_bytes if size > settings.replication_chunk_threshold_bytes else None
+        res = await upload_file_to_cloudinary(path, folder=folder, resource_type=resource_type, chunk_size=chunk_size)
+        return {"url": res.get("secure_url") or res.get("url"), "bytes": res.get("bytes")}
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for the given (1-based) failed attempt."""
+    delay = min(
+        settings.replication_backoff_max_seconds,
+        settings.replication_backoff_base_seconds * (2 ** (attempt - 1)),
+    )
+    return delay * random.uniform(0.5, 1.0)
+
+
+class ReplicationWorker:
+    """
+    Pushes blobs to cloud storage in the background from the durable
+    ReplicationJob queue. Jobs are claimed from the database, so a restart
+    or a second worker process picks up where this one left off. At most
+    `concurrency` uploads run per target host; failures are retried with
+    exponential backoff until `max_attempts`, then marked failed.
+    """
+
+    def __init__(self, uploader, concurrency: int, batch_size: int, poll_interval: float, max_attempts: int):
+        self.uploader = uploader
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._task: asyncio.Task | None = None
+        self._wake: asyncio.Event | None = None
+        self._in_flight: dict[asyncio.Task, str] = {}
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+        self.replicated = 0
+        self.retried = 0
+        self.failed = 0
+
+    def enabled(self) -> bool:
+        return self.uploader.configured()
+
+    async def enqueue(self, db, content_hash: str, local_path: str, *, folder: str | None, resource_type: str | None) -> None:
+        """Persist a job for the blob (commits) and wake the worker."""
+        await enqueue_replication(db, content_hash, local_path=local_path, folder=folder, resource_type=resource_type)
+        self.notify()
+
+    async def enqueue_many(self, db, jobs: list[dict]) -> None:
+        """enqueue() for several blobs in one statement; each job holds enqueue_replication's fields."""
+        await enqueue_replications(db, jobs)
+        self.notify()
+
+    def notify(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    def _slots_for(self, host: str) -> asyncio.Semaphore:
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.concurrency)
+        return self._host_slots[host]
+
+    async def _replicate(self, job) -> None:
+        host = getattr(self.uploader, "host", "default")
+        try:
+            async with self._slots_for(host):
+                res = await self.uploader.upload(job.local_path, folder=job.folder, resource_type=job.resource_type)
+            cloud_url = res.get("url")
+            if not cloud_url:
+                raise RuntimeError("upload response carried no URL")
+        except Exception as exc:
+            attempt = job.attempts + 1
+            retry_at = None
+            if attempt < self.max_attempts:
+                retry_at = datetime.utcnow() + timedelta(seconds=backoff_delay(attempt))
+                self.retried += 1
+            else:
+                self.failed += 1
+            logger.warning("Replication of %s failed (attempt %d): %s", job.content_hash, attempt, exc)
+            try:
+                async for session in get_session():
+                    await fail_replication(session, job.content_hash, f"{exc}"[:500], retry_at)
+            except Exception:
+                logger.exception("Could not record replication failure for %s", job.content_hash)
+            return
+        try:
+            async for session in get_session():
+                await complete_replication(session, job.content_hash, cloud_url)
+            self.replicated += 1
+        except Exception:
+            # the job stays 'running' and is retried once its lease expires
+            logger.exception("Could not record replication of %s", job.content_hash)
+
+    def _spawn(self, job) -> None:
+        task = asyncio.create_task(self._replicate(job))
+        self._in_flight[task] = job.content_hash
+        task.add_done_callback(lambda t: self._in_flight.pop(t, None))
+        # a freed slot may let the loop claim more work
+        task.add_done_callback(lambda _: self.notify())
+
+    async def _release_stale(self) -> None:
+        """Hand jobs whose lease expired (e.g. their worker crashed) back to the queue."""
+        async for session in get_session():
+            # our own long uploads may outlive the lease; they are not stale
+            released = await release_stale_replication_jobs(
+                session, settings.replication_lease_seconds, exclude=list(self._in_flight.values())
+            )
+        if released:
+            logger.info("Re-queued %d interrupted replication jobs", released)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        last_release = loop.time()
+        while True:
+            self._wake.clear()
+            # a peer that died mid-upload leaves its jobs 'running'; reclaim them once per lease
+            if loop.time() - last_release >= settings.replication_lease_seconds:
+                last_release = loop.time()
+                try:
+                    await self._release_stale()
+                except Exception:
+                    logger.exception("Could not re-queue stale replication jobs")
+            want = min(self.concurrency - len(self._in_flight), self.batch_size)
+            if want > 0:
+                try:
+                    async for session in get_session():
+                        jobs = await claim_replication_jobs(session, want)
+                    for job in jobs:
+                        self._spawn(job)
+                    if len(jobs) == want:
+                        # there may be more due work behind this batch
+                        continue
+                except Exception:
+                    logger.exception("Could not claim replication jobs")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        if self._task is not None or not self.enabled():
+            return
+        await self._release_stale()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop claiming work; uploads in progress are cancelled and their jobs handed back to the queue."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        interrupted = list(self._in_flight.values())
+        for task in list(self._in_flight):
+            task.cancel()
+        await asyncio.gather(self._task, *self._in_flight, return_exceptions=True)
+        if interrupted:
+            try:
+                async for session in get_session():
+                    await requeue_replication_jobs(session, interrupted)
+            except Exception:
+                # the lease check at the next start picks them up instead
+                logger.exception("Could not re-queue %d interrupted replication jobs", len(interrupted))
+        self._task = None
+        self._wake = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "in_flight": len(self._in_flight),
+            "replicated": self.replicated,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+replication_worker = ReplicationWorker(
+    CloudinaryUploader(),
+    concurrency=settings.replication_concurrency,
+    batch_size=settings.replication_batch_size,
+    poll_interval=settings.replication_poll_interval_seconds,
+    max_attempts=settings.replication_max_attempts,
+)
@@ -2,16 +2,147 @@ from pathlib import Path
 from uuid import uuid4
 from fastapi import UploadFile
 from app.core.config import settings
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
 import os
+import hashlib
 import tempfile
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 
 # keep existing local upload behavior
 UPLOAD_DIR = Path(settings.upload_dir)
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 
+class UploadTooLarge(ValueError):
+    """Raised when a streamed upload grows past the configured size limit."""
+
+
+class UploadBodyLimit:
+    """
+    ASGI middleware capping the raw request body of multipart upload routes
+    ({path: max bytes}). FastAPI parses (and spools) the whole multipart body
+    before the handler runs, so this is where an oversize upload can still be
+    refused early: on its Content-Length before anything is read, or as soon
+    as a chunked body passes the cap. Answers 400 "File too large" like the
+    handlers do.
+    """
+
+    def __init__(self, app, limits: dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        try:
+            declared = int(headers.get(b"content-length", b""))
+        except ValueError:
+            declared = None
+        if declared is not None and declared > limit:
+            return await self._reject(scope, receive, send)
+
+        received = 0
+        exceeded = False
+
+        async def capped_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI reports any error while parsing the form as its
+                    # own 400; capped_send swaps that for ours
+                    exceeded = True
+                    raise UploadTooLarge("File too large")
+            return message
+
+        async def capped_send(message):
+            if not exceeded:
+                await send(message)
+            elif message["type"] == "http.response.start":
+                await self._reject(scope, receive, send)
+
+        try:
+            await self.app(scope, capped_receive, capped_send)
+        except UploadTooLarge:
+            await self._reject(scope, receive, send)
+
+    @staticmethod
+    async def _reject(scope, receive, send):
+        await JSONResponse({"detail": "File too large"}, status_code=400, headers={"Connection": "close"})(scope, receive, send)
+
+
+async def iter_upload_chunks(upload_file: UploadFile, chunk_size: int | None = None):
+    """
+    Yield the body of an UploadFile in fixed-size blocks.
+    Only one block is held in memory at a time.
+    """
+    chunk_size = chunk_size or settings.upload_chunk_size_bytes
+    while True:
+        chunk = await upload_file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def stream_to_path(chunks, dest_path: str | Path, max_bytes: int | None = None, append: bool = False) -> tuple[int, str]:
+    """
+    Write an async iterator of byte blocks to dest_path.
+    Bytes are counted and SHA-256 hashed as they are written, and the write
+    is aborted as soon as the running total exceeds max_bytes. A fresh file
+    is removed on abort; with append=True the bytes already on disk are kept
+    (resumable uploads) and only the appended bytes are counted and hashed.
+    Returns: (bytes written, sha256 hex digest of those bytes)
+    """
+    max_bytes = settings.max_upload_size_bytes if max_bytes is None else max_bytes
+    hasher = hashlib.sha256()
+    size = 0
+    dest_path = Path(dest_path)
+    out = await run_in_threadpool(open, dest_path, "ab" if append else "wb")
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge("File too large")
+            hasher.update(chunk)
+            await run_in_threadpool(out.write, chunk)
+    except BaseException:
+        out.close()
+        if not append:
+            dest_path.unlink(missing_ok=True)
+        raise
+    await run_in_threadpool(out.close)
+    return size, hasher.hexdigest()
+
+
+def hash_file(path: str | Path, chunk_size: int | None = None) -> str:
+    """SHA-256 of a file on disk, read in fixed-size blocks (blocking; run in a thread)."""
+    chunk_size = chunk_size or settings.upload_chunk_size_bytes
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+async def stream_upload_file(upload_file: UploadFile, dest_path: str | Path, max_bytes: int | None = None) -> tuple[int, str]:
+    """
+    Stream an UploadFile to dest_path in constant memory.
+    Rejects early if the client-declared size is already over the limit.
+    By now FastAPI has already spooled the multipart body; UploadBodyLimit
+    is what stops an oversize request before that.
+    Returns: (file size, sha256 hex digest)
+    """
+    max_bytes = settings.max_upload_size_bytes if max_bytes is None else max_bytes
+    declared = getattr(upload_file, "size", None)
+    if declared is not None and declared > max_bytes:
+        raise UploadTooLarge("File too large")
+    return await stream_to_path(iter_upload_chunks(upload_file), dest_path, max_bytes=max_bytes)
+
+
 async def save_upload_file(owner_id: int, upload_file: UploadFile) -> tuple[str, int]:
     """
     Save uploaded file in user-specific folder.
@@ -20,18 +151,11 @@ async def save_upload_file(owner_id: int, upload_file: UploadFile) -> tuple[str,
     owner_dir = UPLOAD_DIR / str(owner_id)
     owner_dir.mkdir(parents=True, exist_ok=True)
 
-    suffix = Path(upload_file.filename).suffix
+    suffix = Path(upload_file.filename or "").suffix
     unique_name = f"{uuid4().hex}{suffix}"
     dest_path = owner_dir / unique_name
 
-    file_bytes = await upload_file.read()
-    file_size = len(file_bytes)
-
-    if file_size > settings.max_upload_size_bytes:
-        raise ValueError("File too large")
-
-    with open(dest_path, "wb") as f:
-        f.write(file_bytes)
+    file_size, _ = await stream_upload_file(upload_file, dest_path)
 
     return str(dest_path), file_size
 
@@ -43,7 +167,18 @@ try:
 except Exception:
     _CLOUDINARY_AVAILABLE = False
 
-_executor = ThreadPoolExecutor(max_workers=6)
+# bounds the blocking Cloudinary calls in flight across the whole process;
+# callers beyond the limit wait here instead of piling up on the threadpool
+_cloudinary_slots = asyncio.Semaphore(settings.cloudinary_max_concurrency)
+
+
+def cloudinary_configured() -> bool:
+    return bool(
+        _CLOUDINARY_AVAILABLE
+        and settings.cloudinary_api_key
+        and settings.cloudinary_api_secret
+        and settings.cloudinary_cloud_name
+    )
 
 
 def _configure_cloudinary():
@@ -60,10 +195,11 @@ def _configure_cloudinary():
     return True
 
 
-async def upload_file_to_cloudinary(file_path: str, public_id: str | None = None, folder: str | None = None, resource_type: str | None = None):
+async def upload_file_to_cloudinary(file_path: str, public_id: str | None = None, folder: str | None = None, resource_type: str | None = None, chunk_size: int | None = None):
     """
     Uploads a local file path to Cloudinary and returns the upload response dict.
     Runs the blocking cloudinary.uploader.upload in a threadpool.
+    With chunk_size, uses upload_large (chunked, resumable on Cloudinary's side).
     """
     if not _configure_cloudinary():
         raise RuntimeError("Cloudinary not configured or package not installed")
@@ -79,17 +215,18 @@ async def upload_file_to_cloudinary(file_path: str, public_id: str | None = None
         if resource_type:
             opts["resource_type"] = resource_type
         # let Cloudinary auto-detect resource_type when not provided
+        if chunk_size:
+            return cloudinary.uploader.upload_large(file_path, chunk_size=chunk_size, **opts)
         return cloudinary.uploader.upload(file_path, **opts)
 
-    loop = asyncio.get_running_loop()
-    result = await loop.run_in_executor(_executor, _sync_upload)
-    return result
+    async with _cloudinary_slots:
+        return await run_in_threadpool(_sync_upload)
 
 
 async def upload_uploadfile_obj(upload_file: UploadFile, public_id: str | None = None, folder: str | None = None, resource_type: str | None = None):
     """
-    Upload from a FastAPI UploadFile instance (in-memory stream).
-    Writes to a temp file then calls upload_file_to_cloudinary.
+    Upload from a FastAPI UploadFile instance.
+    Streams it to a temp file then calls upload_file_to_cloudinary.
     Returns the Cloudinary upload result dict.
     """
     # create temp file with same suffix
@@ -99,11 +236,10 @@ async def upload_uploadfile_obj(upload_file: UploadFile, public_id: str | None =
         suffix = ext or ""
 
     with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = await upload_file.read()
-        tmp.write(content)
         tmp_path = tmp.name
 
     try:
+        await stream_upload_file(upload_file, tmp_path)
         res = await upload_file_to_cloudinary(tmp_path, public_id=public_id, folder=folder, resource_type=resource_type)
     finally:
         try:
@@ -121,5 +257,5 @@ async def delete_from_cloudinary(public_id: str):
     def _sync_destroy():
         return cloudinary.uploader.destroy(public_id)
 
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(_executor, _sync_destroy)
+    async with _cloudinary_slots:
+        return await run_in_threadpool(_sync_destroy)
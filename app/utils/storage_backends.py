@@ -0,0 +1,347 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import quote, urlencode
+import base64
+import hashlib
+import hmac
+import os
+import shutil
+import time
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.utils.blobstore import blob_path
+from app.utils.storage import UploadTooLarge, cloudinary_configured, hash_file
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+    _BOTO3_AVAILABLE = True
+except Exception:
+    _BOTO3_AVAILABLE = False
+
+try:
+    import cloudinary
+    import cloudinary.api
+    import cloudinary.exceptions
+    import cloudinary.uploader
+    import cloudinary.utils
+except Exception:
+    pass
+
+# Objects uploaded by clients land under incoming/ until they are completed;
+# the local backend keeps them in upload_dir/incoming on the same filesystem as the blob store
+INCOMING_DIR = Path(settings.upload_dir) / "incoming"
+
+
+class InvalidSignature(Exception):
+    """Raised when a signed storage URL is malformed, tampered with or expired."""
+
+
+def incoming_key(upload_id: str, suffix: str = "") -> str:
+    return f"incoming/{upload_id}{suffix}"
+
+
+def upload_id_from_key(key: str) -> str:
+    """Inverse of incoming_key (upload ids are hex, so the first dot starts the suffix)."""
+    return key.rsplit("/", 1)[-1].split(".", 1)[0]
+
+
+def _signature(method: str, key: str, params: dict) -> str:
+    payload = "\n".join([method, key] + [f"{k}={params[k]}" for k in sorted(params)])
+    digest = hmac.new(settings.secret_key.encode(), payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def sign_url(method: str, key: str, expires_in: int, **params) -> str:
+    """App-served object URL carrying an HMAC over method, key, expiry and params."""
+    params = {k: str(v) for k, v in params.items() if v is not None}
+    params["exp"] = str(int(time.time()) + expires_in)
+    params["sig"] = _signature(method, key, params)
+    return f"{settings.public_base_url.rstrip('/')}/api/v1/storage/objects/{quote(key)}?{urlencode(params)}"
+
+
+def verify_signed(method: str, key: str, query: dict) -> dict:
+    """Check a signed URL's query; returns its params (without exp/sig)."""
+    params = dict(query)
+    sig = params.pop("sig", "")
+    try:
+        expired = int(params.get("exp", "0")) < time.time()
+    except ValueError:
+        raise InvalidSignature("Invalid signature")
+    if not hmac.compare_digest(sig, _signature(method, key, params)):
+        raise InvalidSignature("Invalid signature")
+    if expired:
+        raise InvalidSignature("Signed URL expired")
+    params.pop("exp")
+    return params
+
+
+class StorageBackend(ABC):
+    """
+    Where uploaded object bytes live, and how clients reach them directly.
+    presign_upload() tells a client how to send bytes straight to storage;
+    claim() copies a completed upload to a local path for moderation and the
+    blob store, leaving the object in place so a failed completion can be
+    retried; promote() runs once the upload is recorded, files the object
+    under its content address and returns the key to record on the Blob
+    (None when the blob store itself is the copy); presign_download() turns
+    such a key into a short-lived URL.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def presign_upload(self, key: str, *, content_type: str | None, max_bytes: int, expires_in: int) -> dict:
+        ...
+
+    @abstractmethod
+    def presign_download(self, backend_key: str, *, filename: str, content_type: str | None, expires_in: int) -> str | None:
+        ...
+
+    @abstractmethod
+    async def claim(self, key: str, dest: Path, max_bytes: int) -> tuple[int, str]:
+        """Copy the uploaded object to `dest`. Returns (size, sha256); FileNotFoundError if absent."""
+
+    @abstractmethod
+    async def promote(self, key: str, content_hash: str, deduplicated: bool) -> str | None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    async def sweep_incoming(self, older_than: datetime) -> int:
+        """Delete incoming objects last written before `older_than`; returns how many. No-op by default."""
+        return 0
+
+
+class LocalBackend(StorageBackend):
+    """
+    Local disk behind HMAC-signed URLs served by the lightweight
+    /api/v1/storage routes (no session, no database lookup).
+    """
+
+    name = "local"
+
+    def incoming_path(self, key: str) -> Path:
+        if not key.startswith("incoming/") or "/" in key[len("incoming/"):] or ".." in key:
+            raise FileNotFoundError(key)
+        return INCOMING_DIR / key[len("incoming/"):]
+
+    def presign_upload(self, key, *, content_type, max_bytes, expires_in):
+        headers = {"Content-Type": content_type} if content_type else {}
+        return {"method": "PUT", "url": sign_url("PUT", key, expires_in, max=max_bytes), "headers": headers}
+
+    def presign_download(self, backend_key, *, filename, content_type, expires_in):
+        return sign_url("GET", backend_key, expires_in, fn=filename, ct=content_type)
+
+    def blob_key(self, content_hash: str) -> str:
+        return f"blobs/{content_hash}"
+
+    def blob_file(self, key: str) -> Path:
+        if not key.startswith("blobs/"):
+            raise FileNotFoundError(key)
+        return blob_path(key[len("blobs/"):])
+
+    async def claim(self, key, dest, max_bytes):
+        src = self.incoming_path(key)
+
+        def _claim():
+            size = src.stat().st_size
+            if size > max_bytes:
+                raise UploadTooLarge("File too large")
+            # hard link (same filesystem): the incoming object survives a failed completion
+            try:
+                os.link(src, dest)
+            except OSError:
+                shutil.copyfile(src, dest)
+            return size, hash_file(dest)
+
+        return await run_in_threadpool(_claim)
+
+    async def promote(self, key, content_hash, deduplicated):
+        await self.delete(key)
+        return None
+
+    async def delete(self, key):
+        await run_in_threadpool(lambda: self.incoming_path(key).unlink(missing_ok=True))
+
+    async def sweep_incoming(self, older_than):
+        cutoff = older_than.replace(tzinfo=timezone.utc).timestamp()
+
+        def _sweep():
+            removed = 0
+            if not INCOMING_DIR.exists():
+                return 0
+            for path in INCOMING_DIR.iterdir():
+                try:
+                    if path.is_file() and path.stat().st_mtime < cutoff:
+                        path.unlink()
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+            return removed
+
+        return await run_in_threadpool(_sweep)
+
+
+class S3Backend(StorageBackend):
+    """S3-compatible object storage (AWS, MinIO, ...) through boto3 presigned URLs."""
+
+    name = "s3"
+
+    def __init__(self):
+        if not _BOTO3_AVAILABLE:
+            raise RuntimeError("S3 storage backend requires boto3")
+        self.bucket = settings.s3_bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings.s3_endpoint_url,
+            region_name=settings.s3_region,
+            aws_access_key_id=settings.s3_access_key_id,
+            aws_secret_access_key=settings.s3_secret_access_key,
+        )
+
+    def presign_upload(self, key, *, content_type, max_bytes, expires_in):
+        params = {"Bucket": self.bucket, "Key": key}
+        if content_type:
+            params["ContentType"] = content_type
+        url = self.client.generate_presigned_url("put_object", Params=params, ExpiresIn=expires_in)
+        return {"method": "PUT", "url": url, "headers": {"Content-Type": content_type} if content_type else {}}
+
+    def presign_download(self, backend_key, *, filename, content_type, expires_in):
+        params = {
+            "Bucket": self.bucket,
+            "Key": backend_key,
+            "ResponseContentDisposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+        }
+        if content_type:
+            params["ResponseContentType"] = content_type
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires_in)
+
+    def _head(self, key: str) -> dict | None:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    async def claim(self, key, dest, max_bytes):
+        def _claim():
+            head = self._head(key)
+            if head is None:
+                raise FileNotFoundError(key)
+            # a presigned PUT cannot cap the body, so the limit is enforced here
+            if head["ContentLength"] > max_bytes:
+                raise UploadTooLarge("File too large")
+            self.client.download_file(self.bucket, key, str(dest))
+            return os.path.getsize(dest), hash_file(dest)
+
+        return await run_in_threadpool(_claim)
+
+    async def promote(self, key, content_hash, deduplicated):
+        target = f"blobs/{content_hash}"
+
+        def _promote():
+            if self._head(target) is None:
+                self.client.copy_object(Bucket=self.bucket, Key=target, CopySource={"Bucket": self.bucket, "Key": key})
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+            return target
+
+        return await run_in_threadpool(_promote)
+
+    async def delete(self, key):
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=key)
+
+    async def sweep_incoming(self, older_than):
+        cutoff = older_than.replace(tzinfo=timezone.utc)
+
+        def _sweep():
+            removed = 0
+            pages = self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix="incoming/")
+            for page in pages:
+                stale = [{"Key": o["Key"]} for o in page.get("Contents", []) if o["LastModified"] < cutoff]
+                if stale:
+                    self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": stale, "Quiet": True})
+                    removed += len(stale)
+            return removed
+
+        return await run_in_threadpool(_sweep)
+
+
+class CloudinaryBackend(StorageBackend):
+    """
+    Cloudinary signed direct uploads (multipart POST with a signature).
+    The asset stays where the client put it; its delivery URL becomes the
+    blob's backend key.
+    """
+
+    name = "cloudinary"
+
+    def __init__(self):
+        if not cloudinary_configured():
+            raise RuntimeError("Cloudinary storage backend is not configured")
+
+    def _public_id(self, key: str) -> str:
+        return f"{settings.cloudinary_upload_folder.rstrip('/')}/{key}"
+
+    def presign_upload(self, key, *, content_type, max_bytes, expires_in):
+        params = {"public_id": self._public_id(key), "timestamp": int(time.time())}
+        params["signature"] = cloudinary.utils.api_sign_request(params, settings.cloudinary_api_secret)
+        params["api_key"] = settings.cloudinary_api_key
+        url = f"https://api.cloudinary.com/v1_1/{settings.cloudinary_cloud_name}/auto/upload"
+        return {"method": "POST", "url": url, "fields": params}
+
+    def presign_download(self, backend_key, *, filename, content_type, expires_in):
+        return backend_key
+
+    def _resource(self, key: str) -> dict:
+        for resource_type in ("image", "video", "raw"):
+            try:
+                return cloudinary.api.resource(self._public_id(key), resource_type=resource_type)
+            except cloudinary.exceptions.NotFound:
+                continue
+        raise FileNotFoundError(key)
+
+    async def claim(self, key, dest, max_bytes):
+        res = await run_in_threadpool(self._resource, key)
+        if int(res.get("bytes") or 0) > max_bytes:
+            raise UploadTooLarge("File too large")
+        size = 0
+        hasher = hashlib.sha256()
+        async with httpx.AsyncClient(timeout=60, follow_redirects=True) as client:
+            async with client.stream("GET", res["secure_url"]) as resp:
+                resp.raise_for_status()
+                with open(dest, "wb") as out:
+                    async for chunk in resp.aiter_bytes(settings.upload_chunk_size_bytes):
+                        size += len(chunk)
+                        hasher.update(chunk)
+                        await run_in_threadpool(out.write, chunk)
+        return size, hasher.hexdigest()
+
+    async def promote(self, key, content_hash, deduplicated):
+        res = await run_in_threadpool(self._resource, key)
+        return res["secure_url"]
+
+    async def delete(self, key):
+        for resource_type in ("image", "video", "raw"):
+            await run_in_threadpool(cloudinary.uploader.destroy, self._public_id(key), resource_type=resource_type)
+
+
+local_backend = LocalBackend()
+
+
+def _build_backend(name: str) -> StorageBackend:
+    if name == "s3":
+        return S3Backend()
+    if name == "cloudinary":
+        return CloudinaryBackend()
+    return local_backend
+
+
+storage_backend = _build_backend((settings.storage_backend or "local").strip().lower())
@@ -0,0 +1,173 @@
+from datetime import datetime
+import asyncio
+import hashlib
+import logging
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.crud import eviction_candidates, local_storage_usage, record_blob_access, set_blobs_local
+from app.db.session import get_session
+from app.utils.blobstore import commit_blob, discard_staged, remove_blob, staging_path
+
+logger = logging.getLogger("shareledger.tiering")
+
+
+class TieredStore:
+    """
+    Local disk as a cache tier in front of the cloud copies.
+    Downloads record blob accesses in memory; a maintenance loop flushes them
+    in one batched UPDATE and, while local blobs exceed the disk budget,
+    evicts the coldest blobs that already have a cloud copy (down to the
+    low watermark). A missing local copy can be fetched back from the cloud
+    in the background; its sha256 is verified before it re-enters the store.
+    """
+
+    def __init__(self, budget: int, low_watermark: float, policy: str, interval: float, batch_size: int):
+        self.budget = budget
+        self.low_watermark = low_watermark
+        self.policy = policy
+        self.interval = interval
+        self.batch_size = batch_size
+        # sha256 -> (last access, hits since the last flush)
+        self._accesses: dict[str, tuple[datetime, int]] = {}
+        self._rehydrating: dict[str, asyncio.Task] = {}
+        self._task: asyncio.Task | None = None
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self.rehydrated = 0
+        self.misses = 0
+
+    def record_access(self, content_hash: str | None) -> None:
+        if not content_hash:
+            return
+        _, hits = self._accesses.get(content_hash, (None, 0))
+        self._accesses[content_hash] = (datetime.utcnow(), hits + 1)
+
+    async def flush_accesses(self) -> None:
+        if not self._accesses:
+            return
+        accesses, self._accesses = self._accesses, {}
+        async for session in get_session():
+            await record_blob_access(session, accesses)
+
+    async def evict_once(self) -> int:
+        """Evict cold replicated blobs until local usage is under the low watermark. Returns blobs evicted."""
+        if self.budget <= 0:
+            return 0
+        evicted = 0
+        async for session in get_session():
+            usage = await local_storage_usage(session)
+            target = self.budget * self.low_watermark if usage > self.budget else usage
+            while usage > target:
+                candidates = await eviction_candidates(session, self.policy, self.batch_size)
+                if not candidates:
+                    logger.warning("Local storage over budget (%d bytes) with nothing replicated to evict", usage)
+                    break
+                victims = []
+                for blob in candidates:
+                    if usage <= target:
+                        break
+                    victims.append(blob)
+                    usage -= blob.size
+                # flip the flag first: a reader that still finds the file streams
+                # it, one that doesn't falls back to the cloud copy
+                await set_blobs_local(session, [b.sha256 for b in victims], False)
+                for blob in victims:
+                    await remove_blob(blob.stored_path)
+                    self.evicted_bytes += blob.size
+                evicted += len(victims)
+        self.evicted += evicted
+        return evicted
+
+    async def rehydrate(self, content_hash: str, cloud_url: str) -> None:
+        """Copy a blob back from its cloud URL into the local store (coalesced per blob)."""
+        task = self._rehydrating.get(content_hash)
+        if task is None:
+            task = asyncio.create_task(self._fetch(content_hash, cloud_url))
+            self._rehydrating[content_hash] = task
+            task.add_done_callback(lambda _: self._rehydrating.pop(content_hash, None))
+        await asyncio.shield(task)
+
+    async def _fetch(self, content_hash: str, cloud_url: str) -> None:
+        staged = staging_path()
+        try:
+            hasher = hashlib.sha256()
+            async with httpx.AsyncClient(timeout=60, follow_redirects=True) as client:
+                async with client.stream("GET", cloud_url) as resp:
+                    resp.raise_for_status()
+                    with open(staged, "wb") as out:
+                        async for chunk in resp.aiter_bytes(settings.upload_chunk_size_bytes):
+                            hasher.update(chunk)
+                            await run_in_threadpool(out.write, chunk)
+            if hasher.hexdigest() != content_hash:
+                raise ValueError(f"cloud copy of {content_hash} does not match its hash")
+            await commit_blob(staged, content_hash)
+            async for session in get_session():
+                await set_blobs_local(session, [content_hash], True)
+            self.rehydrated += 1
+        finally:
+            discard_staged(staged)
+
+    def on_miss(self, content_hash: str | None, cloud_url: str) -> None:
+        """A download found no local copy; start re-hydration if the policy asks for it."""
+        self.misses += 1
+        if settings.local_miss_policy != "rehydrate" or not content_hash or content_hash in self._rehydrating:
+            return
+        task = asyncio.create_task(self.rehydrate(content_hash, cloud_url))
+        task.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Re-hydration failed: %s", task.exception())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush_accesses()
+                evicted = await self.evict_once()
+                if evicted:
+                    logger.info("Evicted %d replicated blobs from local storage", evicted)
+            except Exception:
+                logger.exception("Local storage maintenance failed")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for task in list(self._rehydrating.values()):
+            task.cancel()
+        await asyncio.gather(*self._rehydrating.values(), return_exceptions=True)
+        try:
+            await self.flush_accesses()
+        except Exception:
+            logger.exception("Could not flush blob access times")
+
+    def stats(self) -> dict:
+        return {
+            "budget_bytes": self.budget,
+            "policy": self.policy,
+            "pending_accesses": len(self._accesses),
+            "evicted": self.evicted,
+            "evicted_bytes": self.evicted_bytes,
+            "misses": self.misses,
+            "rehydrating": len(self._rehydrating),
+            "rehydrated": self.rehydrated,
+        }
+
+
+tiered_store = TieredStore(
+    budget=settings.local_storage_budget_bytes,
+    low_watermark=settings.local_storage_low_watermark,
+    policy=settings.local_eviction_policy,
+    interval=settings.local_eviction_interval_seconds,
+    batch_size=settings.local_eviction_batch_size,
+)
@@ -0,0 +1,231 @@
+from contextlib import asynccontextmanager
+from pathlib import Path
+from datetime import datetime
+from uuid import uuid4
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import shutil
+import time
+import weakref
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.utils.blobstore import staging_path
+from app.utils.storage import stream_to_path
+
+logger = logging.getLogger("shareledger.uploads")
+
+# Resumable upload sessions: uploads/sessions/<upload_id>/{meta.json,data<suffix>}
+# Lives under upload_dir so finalized data can be linked into the blob store.
+SESSIONS_DIR = Path(settings.upload_dir) / "sessions"
+
+# one lock per live session so concurrent PUTs for the same offset serialize
+# within this process; session_lock() adds flock() for the other workers
+_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+_LOCK_POLL_SECONDS = 0.05
+_sweeper_task: asyncio.Task | None = None
+
+
+class UploadSessionNotFound(Exception):
+    pass
+
+
+class UploadOffsetMismatch(Exception):
+    """The client tried to write past the committed offset."""
+
+    def __init__(self, committed: int):
+        super().__init__(f"Expected offset <= {committed}")
+        self.committed = committed
+
+
+@asynccontextmanager
+async def session_lock(upload_id: str):
+    """
+    Serialize appends and finalize of one session across coroutines and
+    worker processes: the in-process asyncio.Lock first, then flock() on the
+    session's lock file (polled, so a cancelled request never strands it).
+    A missing session is not locked; the caller's load_session reports it.
+    """
+    lock = _locks.get(upload_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _locks[upload_id] = lock
+    async with lock:
+        try:
+            fd = os.open(_session_dir(upload_id) / ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        except (FileNotFoundError, UploadSessionNotFound):
+            yield
+            return
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(_LOCK_POLL_SECONDS)
+            yield
+        finally:
+            os.close(fd)  # releases the flock
+
+
+def _session_dir(upload_id: str) -> Path:
+    # ids are uuid4 hex; anything else can't be ours (and must not escape SESSIONS_DIR)
+    if len(upload_id) != 32 or not all(c in "0123456789abcdef" for c in upload_id):
+        raise UploadSessionNotFound(upload_id)
+    return SESSIONS_DIR / upload_id
+
+
+def data_path(meta: dict) -> Path:
+    return _session_dir(meta["upload_id"]) / f"data{meta['suffix']}"
+
+
+def committed_offset(meta: dict) -> int:
+    """Bytes durably appended so far; the data file size is the source of truth."""
+    try:
+        return data_path(meta).stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _write_meta(meta: dict) -> None:
+    d = _session_dir(meta["upload_id"])
+    tmp = d / "meta.json.tmp"
+    tmp.write_text(json.dumps(meta))
+    os.replace(tmp, d / "meta.json")
+
+
+def create_session(owner_id: int, filename: str, content_type: str | None, total_size: int | None) -> dict:
+    upload_id = uuid4().hex
+    d = _session_dir(upload_id)
+    d.mkdir(parents=True, exist_ok=True)
+    meta = {
+        "upload_id": upload_id,
+        "owner_id": owner_id,
+        "filename": filename,
+        "suffix": os.path.splitext(filename)[1],
+        "content_type": content_type,
+        "total_size": total_size,
+        "created_at": datetime.utcnow().isoformat(),
+        "file_id": None,
+        "deduplicated": False,
+    }
+    _write_meta(meta)
+    data_path(meta).touch()
+    return meta
+
+
+def load_session(upload_id: str) -> dict:
+    try:
+        return json.loads((_session_dir(upload_id) / "meta.json").read_text())
+    except (FileNotFoundError, ValueError):
+        raise UploadSessionNotFound(upload_id)
+
+
+def snapshot_data(meta: dict) -> Path:
+    """
+    Staging copy of the session data (a hard link when possible) for ingest
+    to move into the blob store. The session keeps its own data until
+    mark_finalized, so a failed finalize can simply be retried.
+    """
+    staged = staging_path(meta["suffix"])
+    try:
+        os.link(data_path(meta), staged)
+    except OSError:
+        shutil.copyfile(data_path(meta), staged)
+    return staged
+
+
+def mark_finalized(meta: dict, file_id: int, deduplicated: bool, size: int) -> None:
+    meta["file_id"] = file_id
+    meta["size"] = size
+    meta["deduplicated"] = deduplicated
+    _write_meta(meta)
+    try:
+        os.unlink(data_path(meta))
+    except FileNotFoundError:
+        pass
+
+
+def delete_session(upload_id: str) -> None:
+    shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+
+
+async def append_chunk(meta: dict, offset: int, chunks) -> int:
+    """
+    Append a chunk that starts at `offset`. Retries are idempotent: bytes the
+    session already holds are skipped, only the tail past the committed offset
+    is written. Caller must hold session_lock().
+    Returns: new committed offset
+    """
+    committed = committed_offset(meta)
+    if offset > committed:
+        raise UploadOffsetMismatch(committed)
+
+    skip = committed - offset
+
+    async def _tail():
+        nonlocal skip
+        async for chunk in chunks:
+            if skip:
+                if len(chunk) <= skip:
+                    skip -= len(chunk)
+                    continue
+                chunk = chunk[skip:]
+                skip = 0
+            yield chunk
+
+    limit = meta["total_size"] if meta["total_size"] is not None else settings.max_session_upload_bytes
+    await stream_to_path(_tail(), data_path(meta), max_bytes=limit - committed, append=True)
+    return committed_offset(meta)
+
+
+def sweep_expired(now: float | None = None) -> int:
+    """Remove sessions with no activity for upload_session_ttl_seconds. Returns count removed."""
+    now = now or time.time()
+    cutoff = now - settings.upload_session_ttl_seconds
+    removed = 0
+    if not SESSIONS_DIR.exists():
+        return 0
+    for d in SESSIONS_DIR.iterdir():
+        if not d.is_dir():
+            continue
+        try:
+            last_activity = max([p.stat().st_mtime for p in d.iterdir()] or [d.stat().st_mtime])
+        except FileNotFoundError:
+            continue
+        if last_activity < cutoff:
+            shutil.rmtree(d, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+async def _sweep_loop():
+    while True:
+        await asyncio.sleep(settings.upload_session_sweep_interval_seconds)
+        try:
+            removed = await run_in_threadpool(sweep_expired)
+            if removed:
+                logger.info("Swept %d abandoned upload sessions", removed)
+        except Exception:
+            logger.exception("Upload session sweep failed")
+
+
+def start_session_sweeper():
+    global _sweeper_task
+    if _sweeper_task is None:
+        _sweeper_task = asyncio.create_task(_sweep_loop())
+
+
+async def stop_session_sweeper():
+    global _sweeper_task
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+        try:
+            await _sweeper_task
+        except asyncio.CancelledError:
+            pass
+        _sweeper_task = None
@@ -0,0 +1,181 @@
+from pathlib import Path
+from uuid import uuid4
+import asyncio
+import logging
+import os
+
+from PIL import Image, ImageOps, features
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.crud import add_file_variant
+from app.db.session import get_session
+
+logger = logging.getLogger("shareledger.variants")
+
+# Re-encoded images: uploads/variants/ab/cd/<sha256>.<ext>
+VARIANT_DIR = Path(settings.upload_dir) / "variants"
+
+# format -> (Pillow format, media type, extension, save options)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp", "webp", {"quality": 80, "method": 4}),
+    "avif": ("AVIF", "image/avif", "avif", {"quality": 60, "speed": 6}),
+}
+
+# sources worth re-encoding; GIF (animation), SVG and already-compact formats are left alone
+TRANSCODABLE_TYPES = {"image/jpeg", "image/jpg", "image/png", "image/bmp", "image/tiff"}
+
+VARIANT_EXTENSIONS = {media_type: ext for _, media_type, ext, _ in VARIANT_FORMATS.values()}
+
+
+def enabled_formats() -> list[str]:
+    """Configured variant formats this Pillow build can encode."""
+    formats = []
+    for fmt in (settings.image_variant_formats or "").split(","):
+        fmt = fmt.strip().lower()
+        if fmt in VARIANT_FORMATS and features.check(fmt) and fmt not in formats:
+            formats.append(fmt)
+    return formats
+
+
+def variant_path(content_hash: str, fmt: str) -> Path:
+    return VARIANT_DIR / content_hash[:2] / content_hash[2:4] / f"{content_hash}.{VARIANT_FORMATS[fmt][2]}"
+
+
+def transcode(src: str, dest: Path, fmt: str) -> int:
+    """
+    Re-encode `src` as `fmt` at full resolution and write it to `dest`
+    atomically. EXIF orientation is applied to the pixels (the metadata
+    itself is dropped); the ICC profile is kept. Returns the written size.
+    """
+    pil_format, _, _, options = VARIANT_FORMATS[fmt]
+    with Image.open(src) as im:
+        if getattr(im, "is_animated", False):
+            raise ValueError("animated images are not transcoded")
+        icc_profile = im.info.get("icc_profile")
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ("RGB", "RGBA", "L", "LA"):
+            im = im.convert("RGBA" if "A" in im.getbands() or "transparency" in im.info else "RGB")
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{uuid4().hex}.tmp")
+        try:
+            if icc_profile:
+                options = {**options, "icc_profile": icc_profile}
+            im.save(tmp, format=pil_format, **options)
+            os.replace(tmp, dest)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+    return dest.stat().st_size
+
+
+def accepted_types(accept: str | None) -> set[str]:
+    """
+    Media types the Accept header names explicitly with q > 0. Wildcards are
+    ignored on purpose: "*/*" or "image/*" says nothing about WebP/AVIF
+    decoding support.
+    """
+    accepted = set()
+    for part in (accept or "").split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type and "*" not in media_type and q > 0:
+            accepted.add(media_type.lower())
+    return accepted
+
+
+def choose_variant(accept: str | None, original_size: int, variants: list):
+    """Smallest variant the client accepts that beats the original, else None."""
+    allowed = accepted_types(accept)
+    candidates = [v for v in variants if v.media_type in allowed and v.size < original_size]
+    return min(candidates, key=lambda v: v.size, default=None)
+
+
+def wants_variant(accept: str | None) -> bool:
+    """Cheap pre-check so downloads from clients without WebP/AVIF support skip the lookup."""
+    return bool(accepted_types(accept) & set(VARIANT_EXTENSIONS))
+
+
+class VariantBuilder:
+    """
+    Background WebP/AVIF encoder for freshly ingested images.
+    Encoding runs in the threadpool with at most `workers` images at a time,
+    off the upload request. A variant is recorded only when it comes out at
+    most `max_ratio` of the original size.
+    """
+
+    def __init__(self, workers: int, max_ratio: float):
+        self.workers = workers
+        self.max_ratio = max_ratio
+        self._slots: asyncio.Semaphore | None = None
+        self._pending: set[asyncio.Task] = set()
+        self.built = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes_saved = 0
+
+    def schedule(self, content_hash: str, src: str, content_type: str | None, size: int) -> None:
+        """Queue variant encoding for a new blob (no-op when disabled or not a transcodable image)."""
+        if not settings.image_variants_enabled or (content_type or "").lower() not in TRANSCODABLE_TYPES:
+            return
+        formats = enabled_formats()
+        if not formats:
+            return
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        task = asyncio.create_task(self._build(content_hash, src, size, formats))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _build(self, content_hash: str, src: str, size: int, formats: list[str]) -> None:
+        async with self._slots:
+            for fmt in formats:
+                dest = variant_path(content_hash, fmt)
+                try:
+                    variant_size = await run_in_threadpool(transcode, src, dest, fmt)
+                except Exception:
+                    self.failed += 1
+                    logger.exception("Could not encode %s variant of %s", fmt, content_hash)
+                    continue
+                if variant_size > size * self.max_ratio:
+                    self.skipped += 1
+                    await run_in_threadpool(dest.unlink, missing_ok=True)
+                    continue
+                try:
+                    async for session in get_session():
+                        await add_file_variant(session, content_hash, VARIANT_FORMATS[fmt][1], str(dest), variant_size)
+                except Exception:
+                    # e.g. the blob was deleted while we were encoding
+                    self.failed += 1
+                    logger.exception("Could not record %s variant of %s", fmt, content_hash)
+                    await run_in_threadpool(dest.unlink, missing_ok=True)
+                    continue
+                self.built += 1
+                self.bytes_saved += size - variant_size
+
+    async def stop(self) -> None:
+        for task in list(self._pending):
+            task.cancel()
+        await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "built": self.built,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+variant_builder = VariantBuilder(
+    workers=settings.image_variant_workers,
+    max_ratio=settings.image_variant_max_ratio,
+)